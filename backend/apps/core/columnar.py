@@ -0,0 +1,207 @@
+"""
+Cópia colunar (Arrow) das planilhas enviadas.
+
+A planilha é convertida uma única vez, no upload, para arquivos Arrow IPC
+sem compressão, identificados pelo hash do conteúdo. Processamentos,
+pré-visualizações e reprocessamentos leem essa cópia com memory-map em vez
+de interpretar o XML do Excel novamente.
+"""
+
+import io
+import json
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .parser_pool import parse_to_arrow
+from .readers import DEFAULT_CHUNK_SIZE
+
+
+CACHE_DIR = 'excel_uploads/cache'
+
+# Linhas por arquivo da cópia colunar; limita a memória usada na conversão
+PART_SIZE = 50000
+
+
+def cache_dir(file_hash):
+    """Retorna o diretório da cópia colunar de um arquivo."""
+    return f'{CACHE_DIR}/{file_hash}'
+
+
+def load_cache_meta(file_hash):
+    """Retorna os metadados da cópia colunar, ou None se ela não existir."""
+    meta_path = f'{cache_dir(file_hash)}/meta.json'
+    if not default_storage.exists(meta_path):
+        return None
+    with default_storage.open(meta_path, 'rb') as meta_file:
+        return json.load(meta_file)
+
+
+def build_columnar_cache(file, file_name, file_hash):
+    """
+    Gera a cópia colunar da planilha, se ainda não existir.
+    
+    A planilha é lida em streaming num processo auxiliar (ver parser_pool)
+    e cada bloco de PART_SIZE linhas vira um arquivo Arrow, copiado para um
+    subdiretório exclusivo desta conversão. O meta.json é
+    gravado por último e marca a cópia como completa; se outra conversão do
+    mesmo conteúdo terminou antes, as partes geradas aqui são descartadas.
+    Depois do meta.json, os subdiretórios de outras conversões (interrompidas
+    ou descartadas) são removidos. Retorna os metadados (colunas, total de
+    linhas e partes).
+    """
+    meta = load_cache_meta(file_hash)
+    if meta is not None:
+        return meta
+    
+    directory = f'{cache_dir(file_hash)}/{uuid.uuid4().hex}'
+    
+    with parse_to_arrow(file, file_name, PART_SIZE) as parsed:
+        meta = {
+            'columns': parsed['columns'],
+            'rows_count': parsed['rows_count'],
+            'parts': []
+        }
+        for part in parsed['parts']:
+            with open(part['path'], 'rb') as part_file:
+                name = default_storage.save(
+                    f'{directory}/{os.path.basename(part["path"])}', File(part_file)
+                )
+            meta['parts'].append({
+                'name': name,
+                'start_row': part['start_row'],
+                'end_row': part['end_row']
+            })
+    file.seek(0)
+    
+    existing = load_cache_meta(file_hash)
+    if existing is not None:
+        _delete_parts(meta)
+        return existing
+    
+    default_storage.save(f'{cache_dir(file_hash)}/meta.json', ContentFile(json.dumps(meta).encode()))
+    
+    subdirectories, _ = default_storage.listdir(cache_dir(file_hash))
+    for name in subdirectories:
+        if f'{cache_dir(file_hash)}/{name}' != directory:
+            _delete_tree(f'{cache_dir(file_hash)}/{name}')
+    return meta
+
+
+def delete_columnar_caches(keep):
+    """
+    Remove as cópias colunares cujos hashes não estão em `keep`.
+    
+    O meta.json é removido primeiro, então uma leitura concorrente vê a
+    cópia como inexistente (e a gera de novo) em vez de encontrar partes
+    faltando. Retorna os hashes removidos.
+    """
+    if not default_storage.exists(CACHE_DIR):
+        return []
+    
+    removed = []
+    hashes, _ = default_storage.listdir(CACHE_DIR)
+    for file_hash in hashes:
+        if file_hash in keep:
+            continue
+        meta_path = f'{cache_dir(file_hash)}/meta.json'
+        if default_storage.exists(meta_path):
+            default_storage.delete(meta_path)
+        _delete_tree(cache_dir(file_hash))
+        removed.append(file_hash)
+    return removed
+
+
+def iter_cached_chunks(file_hash, chunk_size=DEFAULT_CHUNK_SIZE, start_row=0):
+    """
+    Lê a cópia colunar em blocos de no máximo `chunk_size` linhas.
+    
+    Os blocos têm o mesmo formato dos gerados por iter_sheet_chunks (índice
+    igual à posição da linha na planilha), então podem ser usados no lugar
+    da leitura da planilha original.
+    """
+    meta = load_cache_meta(file_hash)
+    buffer = []
+    buffered = 0
+    
+    for part in meta['parts']:
+        if part['end_row'] <= start_row:
+            continue
+        
+        df = _read_part(part['name'])
+        if part['start_row'] < start_row:
+            df = df[df.index >= start_row]
+        
+        buffer.append(df)
+        buffered += len(df)
+        
+        while buffered >= chunk_size:
+            df = pd.concat(buffer) if len(buffer) > 1 else buffer[0]
+            yield df.iloc[:chunk_size]
+            rest = df.iloc[chunk_size:]
+            buffer = [rest] if len(rest) else []
+            buffered = len(rest)
+    
+    if buffered:
+        yield pd.concat(buffer) if len(buffer) > 1 else buffer[0]
+
+
+def _read_part(name):
+    """Lê um arquivo Arrow da cópia colunar, com memory-map quando possível."""
+    try:
+        source = pa.memory_map(default_storage.path(name))
+    except NotImplementedError:
+        # Storage sem caminho local (ex.: S3): lê o arquivo para a memória
+        with default_storage.open(name, 'rb') as part_file:
+            source = pa.BufferReader(part_file.read())
+    
+    return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def to_arrow_bytes(df):
+    """Serializa o bloco em formato Arrow IPC sem compressão."""
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Colunas com tipos misturados (ex.: códigos numéricos e textuais)
+        # são gravadas como texto
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == object:
+                try:
+                    pa.array(df[column], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    df[column] = df[column].map(lambda value: value if value is None else str(value))
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    
+    sink = io.BytesIO()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _delete_parts(meta):
+    """Remove as partes de uma conversão descartada."""
+    for part in meta['parts']:
+        default_storage.delete(part['name'])
+
+
+def _delete_tree(path):
+    """Remove um diretório do storage com todo o seu conteúdo."""
+    subdirectories, files = default_storage.listdir(path)
+    for name in files:
+        default_storage.delete(f'{path}/{name}')
+    for name in subdirectories:
+        _delete_tree(f'{path}/{name}')
+    try:
+        # Storages sem diretórios (ex.: S3) não têm o que remover aqui
+        default_storage.delete(path)
+    except OSError:
+        # Uma conversão concorrente gravou uma parte no diretório; ela mesma
+        # descarta as suas partes ao encontrar o meta.json
+        pass
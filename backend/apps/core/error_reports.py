@@ -0,0 +1,261 @@
+"""
+Relatórios de erros das importações de planilhas.
+
+Os erros de cada bloco são gravados num arquivo CSV próprio (linha, coluna,
+código e mensagem) enquanto a importação roda, em vez de acumulados no
+registro da importação. O nome do arquivo traz a primeira linha do bloco e
+a quantidade de erros, o que permite reprocessar um bloco sobrescrevendo
+seu arquivo e pular blocos inteiros ao paginar o relatório.
+
+Nas importações paralelas cada partição grava os seus arquivos num
+subdiretório. Enquanto a importação roda, o relatório é lido intercalando
+pela linha os blocos já confirmados das partições (ver
+iter_partition_errors); ao final eles são gravados como o relatório da
+importação (ver merge_partition_errors).
+
+Opcionalmente, as linhas rejeitadas também viram uma planilha anotada
+(coluna com o erro e células problemáticas destacadas), para correção no
+Excel.
+"""
+
+import csv
+import heapq
+import io
+import itertools
+import tempfile
+
+import pandas as pd
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font, PatternFill
+
+from .columnar import iter_cached_chunks
+
+
+ERRORS_DIR = 'excel_uploads/errors'
+
+ERROR_FIELDS = ['row', 'column', 'code', 'message']
+
+# Erros por arquivo no relatório intercalado das partições
+MERGED_PART_SIZE = 50000
+
+# Colunas acrescentadas às linhas da planilha de erros
+WORKBOOK_EXTRA_COLUMNS = ['Linha', 'Erro']
+
+# Linhas de dados por aba (o Excel aceita 1.048.576 linhas, com o cabeçalho)
+WORKBOOK_SHEET_ROWS = 1048575
+
+# Estilo "Ruim" do Excel para as células com erro
+ERROR_FILL = PatternFill(fill_type='solid', start_color='FFC7CE', end_color='FFC7CE')
+ERROR_FONT = Font(color='9C0006')
+
+
+class _Echo:
+    """Buffer que apenas devolve o que recebe, para gerar o CSV linha a linha."""
+    
+    def write(self, value):
+        return value
+
+
+def errors_dir(job_id, partition=None):
+    """Retorna o diretório do relatório de erros de uma importação (ou partição)."""
+    if partition is not None:
+        return f'{ERRORS_DIR}/{job_id}/p{partition:03d}'
+    return f'{ERRORS_DIR}/{job_id}'
+
+
+def _list_parts(job_id, partition=None):
+    """Retorna (linha inicial, quantidade de erros, caminho) de cada bloco, em ordem."""
+    directory = errors_dir(job_id, partition)
+    if not default_storage.exists(directory):
+        return []
+    
+    parts = []
+    for name in default_storage.listdir(directory)[1]:
+        if not name.startswith('part-') or not name.endswith('.csv'):
+            continue
+        start_row, count = name[len('part-'):-len('.csv')].split('-')
+        parts.append((int(start_row), int(count), f'{directory}/{name}'))
+    return sorted(parts)
+
+
+def write_error_part(job_id, start_row, errors, partition=None):
+    """
+    Grava os erros de um bloco, substituindo os de um processamento anterior.
+    
+    Deve ser chamada antes de o checkpoint do bloco ser gravado: se a
+    transação do bloco for desfeita, o arquivo é sobrescrito quando o bloco
+    for reprocessado e, até lá, fica fora do relatório (ver iter_errors).
+    """
+    for part_start, _, path in _list_parts(job_id, partition):
+        if part_start == start_row:
+            default_storage.delete(path)
+    
+    if not errors:
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ERROR_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(errors)
+    
+    path = f'{errors_dir(job_id, partition)}/part-{start_row:010d}-{len(errors):07d}.csv'
+    default_storage.save(path, ContentFile(buffer.getvalue().encode('utf-8')))
+
+
+def iter_errors(job_id, end_row=None, offset=0, partition=None):
+    """
+    Percorre os erros gravados de uma importação, na ordem da planilha.
+    
+    Blocos a partir de `end_row` (linhas ainda sem checkpoint) são
+    ignorados. Os blocos anteriores a `offset` são pulados sem serem lidos.
+    """
+    for start_row, count, path in _list_parts(job_id, partition):
+        if end_row is not None and start_row >= end_row:
+            break
+        if offset >= count:
+            offset -= count
+            continue
+        
+        with default_storage.open(path, 'rb') as part:
+            reader = csv.DictReader(io.TextIOWrapper(part, encoding='utf-8', newline=''))
+            for error in itertools.islice(reader, offset, None):
+                yield error
+        offset = 0
+
+
+def iter_partition_errors(job_id, end_rows):
+    """
+    Percorre os erros das partições de uma importação, intercalados pela linha.
+    
+    `end_rows` traz o checkpoint de cada partição ({número: linha}); erros
+    de blocos não confirmados ficam de fora.
+    """
+    return heapq.merge(
+        *(iter_errors(job_id, end_row=end_row, partition=number) for number, end_row in end_rows.items()),
+        key=lambda error: int(error['row'])
+    )
+
+
+def iter_error_csv(job_id, end_row=None, offset=0, limit=None, partitions=None):
+    """
+    Gera o relatório de erros (ou uma página dele) como linhas de CSV.
+    
+    Com `partitions` ({número: checkpoint}), o relatório é lido dos blocos
+    das partições, para importações paralelas ainda não consolidadas.
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=ERROR_FIELDS)
+    yield writer.writeheader()
+    
+    if partitions is not None:
+        errors = itertools.islice(iter_partition_errors(job_id, partitions), offset, None)
+    else:
+        errors = iter_errors(job_id, end_row=end_row, offset=offset)
+    for error in itertools.islice(errors, limit):
+        yield writer.writerow(error)
+
+
+def merge_partition_errors(job_id, end_rows):
+    """
+    Intercala os relatórios das partições no relatório da importação.
+    
+    `end_rows` segue o formato de iter_partition_errors. O relatório da
+    importação é refeito por completo, então a intercalação pode ser repetida (ex.: ao
+    terminar uma importação retomada). Retorna os erros em ordem de linha,
+    para que quem chama possa ler os primeiros.
+    """
+    for _, _, path in _list_parts(job_id):
+        default_storage.delete(path)
+    
+    errors = iter_partition_errors(job_id, end_rows)
+    while True:
+        batch = list(itertools.islice(errors, MERGED_PART_SIZE))
+        if not batch:
+            break
+        write_error_part(job_id, int(batch[0]['row']) - 1, batch)
+    
+    return iter_errors(job_id)
+
+
+def delete_partition_errors(job_id, partitions):
+    """Remove os relatórios das partições, depois de intercalados."""
+    for number in partitions:
+        for _, _, path in _list_parts(job_id, number):
+            default_storage.delete(path)
+
+
+def write_error_workbook(job):
+    """
+    Gera a planilha com as linhas rejeitadas da importação.
+    
+    As linhas são lidas da cópia colunar do arquivo e recebem as colunas
+    Linha e Erro; a célula da coluna com problema é destacada. A planilha é
+    escrita com o modo write_only do openpyxl, que grava cada linha direto
+    no arquivo, então a memória usada não cresce com o total de rejeições.
+    Retorna o caminho da planilha no storage.
+    """
+    errors = iter_errors(job.pk, end_row=job.errors_end_row)
+    error = next(errors, None)
+    
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    
+    chunks = iter_cached_chunks(job.file_hash, start_row=int(error['row']) - 1 if error else 0)
+    for df in chunks:
+        if error is None:
+            break
+        
+        columns = list(df.columns)
+        end_row = int(df.index[-1]) + 1
+        while error is not None and int(error['row']) <= end_row:
+            if sheet is None or sheet_rows == WORKBOOK_SHEET_ROWS:
+                sheet = workbook.create_sheet(f'Rejeitadas {len(workbook.worksheets) + 1}')
+                sheet.append([str(column) for column in columns] + WORKBOOK_EXTRA_COLUMNS)
+                sheet_rows = 0
+            
+            values = df.loc[int(error['row']) - 1].tolist()
+            sheet.append(_annotated_row(sheet, columns, values, error))
+            sheet_rows += 1
+            error = next(errors, None)
+    
+    if sheet is None:
+        sheet = workbook.create_sheet('Rejeitadas 1')
+    
+    path = f'{errors_dir(job.pk)}/rejected.xlsx'
+    with tempfile.TemporaryFile(suffix='.xlsx') as output:
+        workbook.save(output)
+        output.seek(0)
+        default_storage.delete(path)
+        return default_storage.save(path, File(output))
+
+
+def _annotated_row(sheet, columns, values, error):
+    """Monta as células de uma linha rejeitada, destacando a coluna do erro."""
+    cells = []
+    for column, value in zip(columns, values):
+        cell = WriteOnlyCell(sheet, value=_cell_value(value))
+        if str(column) == error['column']:
+            cell.fill = ERROR_FILL
+            cell.font = ERROR_FONT
+        cells.append(cell)
+    
+    message = WriteOnlyCell(sheet, value=_cell_value(error['message']))
+    message.font = ERROR_FONT
+    return cells + [int(error['row']), message]
+
+
+def _cell_value(value):
+    """Converte o valor lido da cópia colunar para um valor aceito pelo openpyxl."""
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        # Datas com fuso horário não são aceitas pelo Excel
+        return value.tz_localize(None).to_pydatetime() if value.tzinfo else value.to_pydatetime()
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value
@@ -0,0 +1,1054 @@
+"""
+Motores de importação de planilhas do LogFlow.
+"""
+
+import io
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+import pandas as pd
+from django.db import connection
+from django.utils import timezone
+
+from apps.inventory.alerts import is_low, record_crossings
+from apps.inventory.models import Product, Category, StockMovement
+from apps.orders.models import Order, OrderItem, Client
+
+from .validation import ChunkValidator, decimal_max
+
+
+class BaseImporter:
+    """Base dos motores de importação por blocos de linhas."""
+    
+    batch_size = 1000
+    
+    # Linhas por bloco; None usa settings.IMPORT_CHUNK_SIZE
+    chunk_size = None
+    
+    result_message = 'Processamento concluído. {} linhas processadas.'
+    
+    # Contadores acumulados em ImportJob.summary e usados na mensagem final
+    summary_keys = ()
+    
+    # Campo que distribui as linhas entre as partições da importação
+    # paralela: linhas com a mesma chave ficam na mesma partição, na ordem da
+    # planilha. None divide o arquivo em faixas de linhas.
+    partition_field = None
+    
+    def __init__(self, column_mapping, options, user):
+        self.column_mapping = column_mapping or {}
+        self.options = options or {}
+        self.user = user
+        
+        # Chaves que a simulação dos blocos anteriores criaria, por tipo
+        self.planned = defaultdict(set)
+    
+    def format_result(self, processed_rows, summary):
+        """Monta a mensagem final da importação."""
+        counters = {**dict.fromkeys(self.summary_keys, 0), **summary}
+        return self.result_message.format(processed_rows, **counters)
+    
+    def partition_keys(self, df):
+        """Retorna a chave de partição de cada linha do bloco."""
+        return ChunkValidator(df, self.column_mapping).text(self.partition_field)
+    
+    def process(self, df):
+        """
+        Processa um bloco da planilha.
+        
+        Os erros são registros com row, column, code e message (ver
+        ChunkValidator.errors).
+        """
+        raise NotImplementedError
+    
+    def plan(self, df):
+        """
+        Simula o processamento de um bloco, sem gravar nada.
+        
+        Usa as mesmas validações do processamento e apenas consultas em lote.
+        Retorna processed_rows, errors e, em summary, o que seria criado ou
+        atualizado.
+        """
+        raise NotImplementedError
+
+
+class InventoryImporter(BaseImporter):
+    """
+    Importa produtos e movimentações de estoque em lote.
+    
+    Cada bloco consulta categorias e produtos uma única vez, calcula os
+    saldos das movimentações em memória e grava tudo com bulk_create e
+    bulk_update, em vez de duas ou três consultas por linha.
+    """
+    
+    result_message = 'Processamento concluído. {} produtos processados.'
+    
+    # Movimentações de um produto ficam na mesma partição, em ordem
+    partition_field = 'code'
+    
+    def process(self, df):
+        processed_rows = 0
+        errors = []
+        warnings = []
+        
+        rows = self._validate(df, errors)
+        if rows.empty:
+            return {
+                'processed_rows': processed_rows,
+                'errors': errors,
+                'warnings': warnings
+            }
+        
+        categories = self._resolve_categories(set(rows['category']))
+        products = {
+            product.code: product
+            for product in Product.objects.select_for_update().filter(
+                code__in=set(rows['code'])
+            ).order_by('code')
+        }
+        
+        was_low = {
+            code: is_low(product.current_stock, product.minimum_stock)
+            for code, product in products.items()
+        }
+        new_products = {}
+        updated_products = {}
+        movements = []
+        
+        for index, code, name, category, quantity in rows.itertuples():
+            if code not in products and code not in new_products:
+                new_products[code] = Product(
+                    code=code,
+                    name=name,
+                    category=categories[category],
+                    current_stock=quantity,
+                    minimum_stock=self.options.get('default_min_stock', 0)
+                )
+            elif quantity > 0:
+                # Entrada de estoque para produto já existente
+                product = products.get(code) or new_products[code]
+                previous_stock = product.current_stock
+                product.current_stock = previous_stock + quantity
+                if code in products:
+                    updated_products[code] = product
+                
+                movements.append(StockMovement(
+                    product=product,
+                    movement_type='in',
+                    quantity=quantity,
+                    previous_stock=previous_stock,
+                    current_stock=product.current_stock,
+                    reference=f'Importação Excel - Linha {index + 1}',
+                    notes='Importação automática via Excel',
+                    created_by=self.user
+                ))
+            
+            processed_rows += 1
+        
+        Product.objects.bulk_create(new_products.values(), batch_size=self.batch_size)
+        Product.objects.bulk_update(
+            updated_products.values(), ['current_stock'], batch_size=self.batch_size
+        )
+        StockMovement.objects.bulk_create(movements, batch_size=self.batch_size)
+        record_crossings(
+            [
+                (product.pk, False, product.current_stock, product.minimum_stock)
+                for product in new_products.values()
+            ] + [
+                (product.pk, was_low[code], product.current_stock, product.minimum_stock)
+                for code, product in updated_products.items()
+            ]
+        )
+        
+        return {
+            'processed_rows': processed_rows,
+            'errors': errors,
+            'warnings': warnings
+        }
+    
+    def plan(self, df):
+        errors = []
+        rows = self._validate(df, errors)
+        
+        codes = set(rows['code'])
+        stored = set(Product.objects.filter(code__in=codes).values_list('code', flat=True))
+        existing = stored | (self.planned['products'] & codes)
+        
+        # Mesmas regras do process: a primeira linha de um código novo cria
+        # o produto, as demais linhas com quantidade positiva geram entradas
+        created = ~rows['code'].duplicated() & ~rows['code'].isin(existing)
+        entries = ~created & rows['quantity'].gt(0)
+        
+        # Produtos já cadastrados que recebem entradas, contados uma vez na
+        # simulação inteira (o resultado não depende do tamanho do bloco)
+        updated = set(rows.loc[entries & rows['code'].isin(stored), 'code'])
+        updated -= self.planned['updated_products']
+        
+        categories = set(rows['category'])
+        new_categories = categories - set(
+            Category.objects.filter(name__in=categories).values_list('name', flat=True)
+        ) - self.planned['categories']
+        
+        self.planned['products'] |= set(rows.loc[created, 'code'])
+        self.planned['updated_products'] |= updated
+        self.planned['categories'] |= new_categories
+        
+        return {
+            'processed_rows': len(rows),
+            'errors': errors,
+            'summary': {
+                'products_created': int(created.sum()),
+                'products_updated': len(updated),
+                'categories_created': len(new_categories),
+                'movements_created': int(entries.sum()),
+            }
+        }
+    
+    def _validate(self, df, errors):
+        """Valida as colunas do bloco e retorna as linhas válidas, registrando os erros."""
+        
+        validator = ChunkValidator(df, self.column_mapping)
+        code = validator.text('code')
+        name = validator.text('name')
+        category = validator.text('category').replace('', 'Sem Categoria')
+        
+        validator.require(code.eq(''), 'Código e nome são obrigatórios', 'code')
+        validator.require(name.eq(''), 'Código e nome são obrigatórios', 'name')
+        validator.max_length(code, Product._meta.get_field('code').max_length, 'Código')
+        validator.max_length(name, Product._meta.get_field('name').max_length, 'Nome')
+        validator.max_length(category, Category._meta.get_field('name').max_length, 'Categoria')
+        quantity = self._validate_quantity(validator)
+        
+        errors.extend(validator.errors)
+        
+        rows = pd.DataFrame({'code': code, 'name': name, 'category': category, 'quantity': quantity})
+        return rows[validator.valid]
+    
+    def _validate_quantity(self, validator):
+        """Valida a coluna de quantidade; vazios valem zero."""
+        return validator.integer('quantity')
+    
+    def _resolve_categories(self, names):
+        """Retorna as categorias pelo nome, criando as que não existem."""
+        
+        categories = {
+            category.name: category
+            for category in Category.objects.filter(name__in=names)
+        }
+        
+        missing = names - categories.keys()
+        if missing:
+            # Sempre em ordem de nome: partições simultâneas que criam as
+            # mesmas categorias esperam umas pelas outras sem deadlock
+            Category.objects.bulk_create(
+                [
+                    Category(name=name, description='Categoria criada automaticamente')
+                    for name in sorted(missing)
+                ],
+                ignore_conflicts=True
+            )
+            categories.update(
+                (category.name, category)
+                for category in Category.objects.filter(name__in=missing)
+            )
+        
+        return categories
+
+
+class InventoryDeltaImporter(InventoryImporter):
+    """
+    Importa uma contagem completa de inventário gravando apenas as diferenças.
+    
+    A quantidade da planilha é o estoque contado. O estoque atual dos
+    produtos do bloco é lido numa única consulta e comparado com a contagem
+    de forma vetorizada; só os produtos com diferença recebem uma
+    movimentação de ajuste. Produtos novos são criados com o estoque
+    contado. Se o código aparecer mais de uma vez, vale a última linha.
+    """
+    
+    result_message = (
+        'Processamento concluído. {} produtos processados '
+        '({created} criados, {adjusted} ajustados, {unchanged} sem alteração).'
+    )
+    
+    summary_keys = ('created', 'adjusted', 'unchanged')
+    
+    def _validate_quantity(self, validator):
+        """A contagem é obrigatória e não pode ser negativa: um vazio zeraria o estoque."""
+        validator.require(validator.column('quantity').isna(), 'Quantidade é obrigatória', 'quantity')
+        quantity = validator.integer('quantity')
+        validator.fail(quantity < 0, 'Quantidade não pode ser negativa', 'quantity', 'out_of_range')
+        return quantity
+    
+    def process(self, df):
+        errors = []
+        rows = self._validate(df, errors)
+        counted = rows.drop_duplicates('code', keep='last')
+        
+        products = {
+            product.code: product
+            for product in Product.objects.select_for_update().filter(
+                code__in=set(counted['code'])
+            ).order_by('code')
+        }
+        
+        current = counted['code'].map({code: product.current_stock for code, product in products.items()})
+        is_new = current.isna()
+        changed = ~is_new & counted['quantity'].ne(current)
+        
+        new_rows = counted[is_new]
+        categories = self._resolve_categories(set(new_rows['category']))
+        new_products = [
+            Product(
+                code=row.code,
+                name=row.name,
+                category=categories[row.category],
+                current_stock=row.quantity,
+                minimum_stock=self.options.get('default_min_stock', 0)
+            )
+            for row in new_rows.itertuples()
+        ]
+        
+        adjusted_products = []
+        crossings = []
+        movements = []
+        for row in counted[changed].itertuples():
+            product = products[row.code]
+            crossings.append(
+                (product.pk, is_low(product.current_stock, product.minimum_stock), row.quantity, product.minimum_stock)
+            )
+            movements.append(StockMovement(
+                product=product,
+                movement_type='adjustment',
+                quantity=row.quantity,
+                previous_stock=product.current_stock,
+                current_stock=row.quantity,
+                reference=f'Importação Excel - Linha {row.Index + 1}',
+                notes='Ajuste de inventário via Excel',
+                created_by=self.user
+            ))
+            product.current_stock = row.quantity
+            adjusted_products.append(product)
+        
+        Product.objects.bulk_create(new_products, batch_size=self.batch_size)
+        Product.objects.bulk_update(adjusted_products, ['current_stock'], batch_size=self.batch_size)
+        StockMovement.objects.bulk_create(movements, batch_size=self.batch_size)
+        record_crossings(
+            [(product.pk, False, product.current_stock, product.minimum_stock) for product in new_products]
+            + crossings
+        )
+        
+        return {
+            'processed_rows': len(rows),
+            'errors': errors,
+            'warnings': [],
+            'summary': {
+                'created': len(new_products),
+                'adjusted': len(adjusted_products),
+                'unchanged': len(counted) - len(new_products) - len(adjusted_products),
+            }
+        }
+    
+    def plan(self, df):
+        errors = []
+        rows = self._validate(df, errors)
+        counted = rows.drop_duplicates('code', keep='last')
+        
+        stock = dict(
+            Product.objects.filter(code__in=set(counted['code'])).values_list('code', 'current_stock')
+        )
+        current = counted['code'].map(stock)
+        is_new = current.isna() & ~counted['code'].isin(self.planned['products'])
+        changed = current.notna() & counted['quantity'].ne(current)
+        
+        categories = set(counted.loc[is_new, 'category'])
+        new_categories = categories - set(
+            Category.objects.filter(name__in=categories).values_list('name', flat=True)
+        ) - self.planned['categories']
+        
+        self.planned['products'] |= set(counted.loc[is_new, 'code'])
+        self.planned['categories'] |= new_categories
+        
+        return {
+            'processed_rows': len(rows),
+            'errors': errors,
+            'summary': {
+                'products_created': int(is_new.sum()),
+                'products_adjusted': int(changed.sum()),
+                'products_unchanged': int((~is_new & ~changed).sum()),
+                'categories_created': len(new_categories),
+                'movements_created': int(changed.sum()),
+            }
+        }
+
+
+class InventoryCopyImporter(InventoryImporter):
+    """
+    Importa produtos e movimentações de estoque com COPY do PostgreSQL.
+    
+    As linhas válidas do bloco são enviadas com COPY FROM STDIN para uma
+    tabela de staging UNLOGGED e consolidadas em categorias, produtos e
+    movimentações com poucas instruções SQL por bloco, sem instanciar
+    modelos. As regras são as mesmas do InventoryImporter: categorias são
+    criadas automaticamente, a primeira linha de um produto novo define o
+    estoque inicial e as demais linhas com quantidade positiva geram
+    entradas, com saldos acumulados na ordem da planilha.
+    """
+    
+    chunk_size = 50000
+    
+    staging_table = 'core_inventory_staging'
+    
+    def process(self, df):
+        if connection.vendor != 'postgresql':
+            raise ValueError('A importação via COPY requer PostgreSQL')
+        
+        errors = []
+        rows = self._validate(df, errors)
+        
+        if not rows.empty:
+            batch = uuid.uuid4().hex
+            with connection.cursor() as cursor:
+                self._create_staging_table(cursor)
+                self._copy_rows(cursor, batch, rows)
+                self._merge(cursor, batch)
+                cursor.execute(f'DELETE FROM {self.staging_table} WHERE batch = %s', [batch])
+        
+        return {
+            'processed_rows': len(rows),
+            'errors': errors,
+            'warnings': []
+        }
+    
+    def _create_staging_table(self, cursor):
+        """Cria a tabela de staging, se ainda não existir."""
+        
+        cursor.execute('SELECT to_regclass(%s)', [self.staging_table])
+        if cursor.fetchone()[0] is not None:
+            return
+        
+        # Serializa a criação entre workers concorrentes
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [self.staging_table])
+        cursor.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {self.staging_table} (
+                batch uuid NOT NULL,
+                row_number integer NOT NULL,
+                code varchar(50) NOT NULL,
+                name varchar(200) NOT NULL,
+                category varchar(100) NOT NULL,
+                quantity integer NOT NULL,
+                created boolean NOT NULL DEFAULT false
+            )
+        """)
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.staging_table}_batch '
+            f'ON {self.staging_table} (batch, code, row_number)'
+        )
+    
+    def _copy_rows(self, cursor, batch, rows):
+        """Envia as linhas válidas para a tabela de staging com COPY."""
+        
+        buffer = io.StringIO()
+        rows.assign(batch=batch, row_number=rows.index).to_csv(
+            buffer,
+            columns=['batch', 'row_number', 'code', 'name', 'category', 'quantity'],
+            header=False,
+            index=False
+        )
+        buffer.seek(0)
+        
+        cursor.copy_expert(
+            f'COPY {self.staging_table} (batch, row_number, code, name, category, quantity) '
+            f'FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+    
+    def _merge(self, cursor, batch):
+        """Consolida as linhas do lote nas tabelas do inventário."""
+        
+        staging = self.staging_table
+        category_table = Category._meta.db_table
+        product_table = Product._meta.db_table
+        movement_table = StockMovement._meta.db_table
+        
+        # Categorias novas, inseridas em ordem de nome (ver _resolve_categories)
+        cursor.execute(f"""
+            INSERT INTO {category_table} (name, description, is_active, created_at, updated_at)
+            SELECT DISTINCT category, 'Categoria criada automaticamente', true, now(), now()
+            FROM {staging}
+            WHERE batch = %s
+            ORDER BY category
+            ON CONFLICT (name) DO NOTHING
+        """, [batch])
+        
+        # Bloqueia os produtos existentes, em ordem de código
+        cursor.execute(f"""
+            SELECT id FROM {product_table}
+            WHERE code IN (SELECT code FROM {staging} WHERE batch = %s)
+            ORDER BY code
+            FOR UPDATE
+        """, [batch])
+        
+        # A primeira linha de cada código inexistente cria o produto
+        cursor.execute(f"""
+            UPDATE {staging} s SET created = true
+            FROM (
+                SELECT DISTINCT ON (code) row_number
+                FROM {staging}
+                WHERE batch = %s
+                ORDER BY code, row_number
+            ) first_rows
+            WHERE s.batch = %s
+                AND s.row_number = first_rows.row_number
+                AND NOT EXISTS (SELECT 1 FROM {product_table} p WHERE p.code = s.code)
+        """, [batch, batch])
+        
+        cursor.execute(f"""
+            INSERT INTO {product_table} (
+                code, name, category_id, unit, current_stock, minimum_stock,
+                status, is_active, created_at, updated_at
+            )
+            SELECT s.code, s.name, c.id, 'UN', s.quantity, %s, 'active', true, now(), now()
+            FROM {staging} s
+            JOIN {category_table} c ON c.name = s.category
+            WHERE s.batch = %s AND s.created
+            RETURNING id, false, current_stock, minimum_stock
+        """, [self.options.get('default_min_stock', 0), batch])
+        crossings = cursor.fetchall()
+        
+        # Entradas com saldos acumulados por produto, na ordem das linhas
+        cursor.execute(f"""
+            INSERT INTO {movement_table} (
+                product_id, movement_type, quantity, previous_stock, current_stock,
+                reference, notes, created_by_id, created_at
+            )
+            SELECT
+                p.id, 'in', s.quantity,
+                p.current_stock + SUM(s.quantity) OVER w - s.quantity,
+                p.current_stock + SUM(s.quantity) OVER w,
+                'Importação Excel - Linha ' || (s.row_number + 1),
+                'Importação automática via Excel', %s, now()
+            FROM {staging} s
+            JOIN {product_table} p ON p.code = s.code
+            WHERE s.batch = %s AND NOT s.created AND s.quantity > 0
+            WINDOW w AS (PARTITION BY s.code ORDER BY s.row_number)
+        """, [self.user.pk, batch])
+        
+        cursor.execute(f"""
+            UPDATE {product_table} p SET current_stock = p.current_stock + entries.total
+            FROM (
+                SELECT code, SUM(quantity) AS total
+                FROM {staging}
+                WHERE batch = %s AND NOT created AND quantity > 0
+                GROUP BY code
+            ) entries
+            WHERE p.code = entries.code
+            RETURNING p.id, p.current_stock - entries.total <= p.minimum_stock, p.current_stock, p.minimum_stock
+        """, [batch])
+        crossings += cursor.fetchall()
+        
+        # Produtos que cruzaram o estoque mínimo
+        record_crossings(crossings)
+
+
+class OrdersImporter(BaseImporter):
+    """Importa ordens, uma por linha da planilha."""
+    
+    result_message = 'Processamento concluído. {} ordens criadas.'
+    
+    # Cada cliente novo é criado por uma única partição
+    partition_field = 'client'
+    
+    def partition_keys(self, df):
+        return super().partition_keys(df).map(Client.normalize_name)
+    
+    def process(self, df):
+        rows, errors = self._validate(df)
+        
+        clients = self._resolve_clients(rows['client'].unique())
+        orders = [
+            Order(
+                client=clients[row.client],
+                order_type=row.order_type,
+                description=row.description,
+                requested_date=row.requested_date,
+                created_by=self.user
+            )
+            for row in rows.itertuples()
+        ]
+        
+        # Os números das ordens são reservados de uma vez, no bulk_create
+        Order.objects.bulk_create(orders, batch_size=self.batch_size)
+        
+        return {
+            'processed_rows': len(orders),
+            'errors': errors,
+            'warnings': []
+        }
+    
+    def plan(self, df):
+        rows, errors = self._validate(df)
+        
+        return {
+            'processed_rows': len(rows),
+            'errors': errors,
+            'summary': {
+                'orders_created': len(rows),
+                'clients_created': self._plan_clients(rows['client'].unique()),
+            }
+        }
+    
+    def _validate(self, df):
+        """Valida as colunas do bloco e retorna as linhas válidas e os erros."""
+        
+        validator = ChunkValidator(df, self.column_mapping)
+        client_name = validator.text('client')
+        validator.require(client_name.eq(''), 'Nome do cliente é obrigatório', 'client')
+        validator.max_length(client_name, Client._meta.get_field('name').max_length, 'Nome do cliente')
+        order_type = validator.choice(
+            'order_type', [choice[0] for choice in Order.ORDER_TYPES], 'delivery', 'Tipo de ordem'
+        )
+        requested_date = validator.date('requested_date', label='Data solicitada')
+        description = validator.text('description')
+        
+        rows = pd.DataFrame({
+            'client': client_name,
+            'order_type': order_type,
+            'requested_date': requested_date,
+            'description': description,
+        })
+        return rows[validator.valid], validator.errors
+    
+    def _resolve_clients(self, names):
+        """
+        Retorna os clientes pelo nome, criando os que não existem.
+        
+        Os nomes são comparados pela chave normalizada (Client.name_key), com
+        uma única consulta indexada por bloco (ver ClientQuerySet.by_name_key).
+        Se houver mais de um cliente com a mesma chave, o mais antigo é usado.
+        """
+        keys = {name: Client.normalize_name(name) for name in names}
+        
+        clients = Client.objects.by_name_key(keys)
+        
+        missing = {}
+        for name, key in keys.items():
+            if key not in clients:
+                missing.setdefault(key, name)
+        
+        if missing and connection.vendor == 'postgresql':
+            # Importações simultâneas (ou partições de pedidos diferentes) não
+            # criam o mesmo cliente: as chaves ficam bloqueadas até o fim da
+            # transação e são consultadas de novo depois do bloqueio
+            with connection.cursor() as cursor:
+                for key in sorted(missing):
+                    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'client:{key}'])
+            found = Client.objects.by_name_key(name for name, key in keys.items() if key in missing)
+            for key, client in found.items():
+                clients.setdefault(key, client)
+                missing.pop(key, None)
+        
+        if missing:
+            created = Client.objects.bulk_create(
+                [
+                    Client(
+                        name=name,
+                        name_key=key,
+                        email=f'{name.lower().replace(" ", ".")}@exemplo.com'
+                    )
+                    for key, name in missing.items()
+                ],
+                batch_size=self.batch_size
+            )
+            clients.update((client.name_key, client) for client in created)
+        
+        return {name: clients[key] for name, key in keys.items()}
+    
+    def _plan_clients(self, names):
+        """Conta os clientes que _resolve_clients criaria, sem criá-los."""
+        
+        keys = {Client.normalize_name(name) for name in names}
+        missing = keys - set(Client.objects.by_name_key(names)) - self.planned['clients']
+        
+        self.planned['clients'] |= missing
+        return len(missing)
+
+
+class OrderLinesImporter(OrdersImporter):
+    """
+    Importa ordens com vários itens, uma linha da planilha por item.
+    
+    As linhas são agrupadas pela coluna indicada em options['group_by'], o
+    número do pedido no sistema de origem, gravado em
+    Order.external_reference. Os dados da ordem vêm da primeira linha válida
+    do grupo que traz o cliente; as linhas seguintes podem deixá-lo em
+    branco. Grupos que continuam em blocos seguintes (ou após uma
+    retomada) recebem os itens na ordem já criada com a mesma referência.
+    Produtos, clientes, ordens e itens são consultados e gravados em lote,
+    e os totais são calculados por grupo.
+    """
+    
+    result_message = 'Processamento concluído. {} itens de ordens importados.'
+    
+    @property
+    def partition_field(self):
+        """Os itens de um pedido ficam na mesma partição."""
+        return self.options['group_by']
+    
+    def partition_keys(self, df):
+        return BaseImporter.partition_keys(self, df)
+    
+    def process(self, df):
+        lines, errors, existing, products = self._validate(df, lock=True)
+        
+        if lines.empty:
+            return {
+                'processed_rows': 0,
+                'errors': errors,
+                'warnings': []
+            }
+        
+        # Peso e volume de cada linha, somados por pedido
+        lines['weight'] = lines['quantity'] * lines['product_code'].map(
+            {code: float(product.weight or 0) for code, product in products.items()}
+        )
+        lines['volume'] = lines['quantity'] * lines['product_code'].map(
+            {code: product.volume for code, product in products.items()}
+        )
+        totals = lines.groupby('key')[['weight', 'volume']].sum()
+        
+        # Ordens novas, com os dados da primeira linha de cada pedido
+        headers = lines[~lines['key'].isin(existing.keys())].drop_duplicates('key')
+        clients = self._resolve_clients(headers['client'].unique())
+        new_orders = [
+            Order(
+                external_reference=row.key,
+                client=clients[row.client],
+                order_type=row.order_type,
+                description=row.description,
+                requested_date=row.requested_date,
+                total_weight=_to_decimal(totals.at[row.key, 'weight'], 3),
+                total_volume=_to_decimal(totals.at[row.key, 'volume'], 3),
+                created_by=self.user
+            )
+            for row in headers.itertuples()
+        ]
+        Order.objects.bulk_create(new_orders, batch_size=self.batch_size)
+        
+        # Pedidos que continuam de blocos anteriores acumulam os totais
+        updated_orders = []
+        for reference in totals.index.intersection(list(existing.keys())):
+            order = existing[reference]
+            order.total_weight += _to_decimal(totals.at[reference, 'weight'], 3)
+            order.total_volume += _to_decimal(totals.at[reference, 'volume'], 3)
+            updated_orders.append(order)
+        Order.objects.bulk_update(
+            updated_orders, ['total_weight', 'total_volume'], batch_size=self.batch_size
+        )
+        
+        orders = {**existing, **{order.external_reference: order for order in new_orders}}
+        items = []
+        for row in lines.itertuples():
+            unit_price = _to_decimal(row.unit_price, 2)
+            items.append(OrderItem(
+                order=orders[row.key],
+                product=products[row.product_code],
+                quantity=int(row.quantity),
+                unit_price=unit_price,
+                total_price=unit_price * int(row.quantity)
+            ))
+        OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+        
+        return {
+            'processed_rows': len(items),
+            'errors': errors,
+            'warnings': []
+        }
+    
+    def plan(self, df):
+        lines, errors, existing, products = self._validate(df, lock=False)
+        
+        # Pedidos de blocos anteriores da simulação já teriam sido criados
+        known = lines['key'].isin(existing.keys()) | lines['key'].isin(self.planned['orders'])
+        headers = lines[~known].drop_duplicates('key')
+        self.planned['orders'] |= set(headers['key'])
+        
+        return {
+            'processed_rows': len(lines),
+            'errors': errors,
+            'summary': {
+                'orders_created': len(headers),
+                'orders_updated': lines.loc[known, 'key'].nunique(),
+                'items_created': len(lines),
+                'clients_created': self._plan_clients(headers['client'].unique()),
+            }
+        }
+    
+    def _validate(self, df, lock):
+        """
+        Valida as colunas do bloco.
+        
+        Retorna as linhas válidas, os erros, as ordens já existentes (pela
+        referência) e os produtos encontrados (pelo código).
+        """
+        validator = ChunkValidator(df, self.column_mapping)
+        
+        key = validator.text(self.options['group_by'])
+        validator.require(key.eq(''), 'Número do pedido é obrigatório', self.options['group_by'])
+        validator.max_length(
+            key, Order._meta.get_field('external_reference').max_length, 'Número do pedido'
+        )
+        
+        orders = Order.objects.filter(external_reference__in=set(key[validator.valid])).order_by('id')
+        if lock:
+            orders = orders.select_for_update()
+        existing = {order.external_reference: order for order in orders}
+        
+        client_name = validator.text('client')
+        validator.max_length(client_name, Client._meta.get_field('name').max_length, 'Nome do cliente')
+        order_type = validator.choice(
+            'order_type', [choice[0] for choice in Order.ORDER_TYPES], 'delivery', 'Tipo de ordem'
+        )
+        requested_date = validator.date('requested_date', label='Data solicitada')
+        description = validator.text('description')
+        
+        product_code = validator.text('product_code')
+        validator.require(product_code.eq(''), 'Código do produto é obrigatório', 'product_code')
+        products = {
+            product.code: product
+            for product in Product.objects.filter(code__in=set(product_code[validator.valid]))
+        }
+        validator.fail(
+            ~product_code.isin(products.keys()), 'Produto não encontrado: ' + product_code,
+            'product_code', 'not_found'
+        )
+        
+        quantity = validator.integer('quantity')
+        validator.fail(quantity < 1, 'Quantidade deve ser maior que zero', 'quantity', 'out_of_range')
+        unit_price = validator.decimal(
+            'unit_price', label='Preço unitário',
+            min_value=0, max_value=decimal_max(OrderItem._meta.get_field('unit_price'))
+        ).round(2)
+        self._check_totals(validator, key, product_code, quantity, unit_price, existing, products)
+        
+        # Um pedido ainda não criado é criado pela sua primeira linha válida
+        # com cliente; o cliente é exigido só até essa linha, como se as
+        # linhas fossem importadas uma a uma (o resultado não depende do
+        # tamanho do bloco)
+        new_order = ~key.isin(existing.keys()) & ~key.isin(self.planned['orders'])
+        position = pd.Series(range(len(key)), index=key.index)
+        creates = validator.valid & new_order & client_name.ne('')
+        creating_position = key.map(position[creates].groupby(key[creates]).min())
+        validator.require(
+            new_order & client_name.eq('') & ~(position > creating_position),
+            'Nome do cliente é obrigatório', 'client'
+        )
+        
+        lines = pd.DataFrame({
+            'key': key,
+            'client': client_name,
+            'order_type': order_type,
+            'requested_date': requested_date,
+            'description': description,
+            'product_code': product_code,
+            'quantity': quantity,
+            'unit_price': unit_price,
+        })
+        return lines[validator.valid], validator.errors, existing, products
+    
+    def _check_totals(self, validator, key, product_code, quantity, unit_price, existing, products):
+        """
+        Rejeita as linhas cujos totais não cabem nas colunas do banco.
+        
+        O preço total do item e os totais de peso e volume do pedido (somando
+        os blocos anteriores) são conferidos antes da gravação, para que uma
+        linha fora da faixa vire um erro da linha em vez de falhar o bloco.
+        """
+        max_price = decimal_max(OrderItem._meta.get_field('total_price'))
+        validator.fail(
+            (unit_price * quantity).round(2) > max_price,
+            f'Preço total do item excede {max_price:.2f}', 'unit_price', 'out_of_range'
+        )
+        
+        line_totals = {
+            'total_weight': quantity * product_code.map(
+                {code: float(product.weight or 0) for code, product in products.items()}
+            ).fillna(0),
+            'total_volume': quantity * product_code.map(
+                {code: product.volume for code, product in products.items()}
+            ).fillna(0),
+        }
+        for field, values in line_totals.items():
+            limit = decimal_max(Order._meta.get_field(field))
+            base = key.map({reference: float(getattr(order, field)) for reference, order in existing.items()})
+            base = base.fillna(0)
+            
+            # Soma acumulada por pedido; só os pedidos que passam do limite
+            # são percorridos linha a linha, pulando as linhas rejeitadas
+            running = values.where(validator.valid, 0).groupby(key).cumsum() + base
+            over = pd.Series(False, index=key.index)
+            if (validator.valid & (running.round(3) > limit)).any():
+                totals = {}
+                for index in key.index[validator.valid]:
+                    total = totals.get(key[index], base[index]) + values[index]
+                    if round(total, 3) > limit:
+                        over[index] = True
+                    else:
+                        totals[key[index]] = total
+            
+            label = Order._meta.get_field(field).verbose_name
+            validator.fail(over, f'{label} do pedido excede {limit:.3f}', 'quantity', 'out_of_range')
+
+
+class ClientsImporter(BaseImporter):
+    """
+    Importa e atualiza clientes pelo nome, em lote.
+    
+    Os clientes do bloco são localizados com uma única consulta pela chave
+    normalizada do nome. Email, telefone e endereço preenchidos na planilha
+    são comparados em memória com os dados atuais, e só os clientes que
+    realmente mudaram são gravados, num único bulk_update.
+    """
+    
+    result_message = (
+        'Processamento concluído. {} clientes processados '
+        '({created} criados, {updated} atualizados, {unchanged} sem alteração).'
+    )
+    
+    summary_keys = ('created', 'updated', 'unchanged')
+    
+    fields = ['email', 'phone', 'address']
+    
+    partition_field = 'name'
+    
+    def partition_keys(self, df):
+        return super().partition_keys(df).map(Client.normalize_name)
+    
+    def process(self, df):
+        diff = self._diff(df)
+        
+        Client.objects.bulk_create(diff['new_clients'], batch_size=self.batch_size)
+        Client.objects.bulk_update(
+            diff['changed_clients'], self.fields + ['updated_at'], batch_size=self.batch_size
+        )
+        
+        return {
+            'processed_rows': diff['processed_rows'],
+            'errors': diff['errors'],
+            'warnings': [],
+            'summary': {
+                'created': len(diff['new_clients']),
+                'updated': len(diff['changed_clients']),
+                'unchanged': diff['unchanged'],
+            }
+        }
+    
+    def plan(self, df):
+        diff = self._diff(df)
+        
+        # Clientes novos em blocos anteriores da simulação contam como existentes
+        new_keys = {client.name_key for client in diff['new_clients']}
+        created = len(new_keys - self.planned['clients'])
+        self.planned['clients'] |= new_keys
+        
+        return {
+            'processed_rows': diff['processed_rows'],
+            'errors': diff['errors'],
+            'summary': {
+                'clients_created': created,
+                'clients_updated': len(diff['changed_clients']) + len(new_keys) - created,
+                'clients_unchanged': diff['unchanged'],
+            }
+        }
+    
+    def _diff(self, df):
+        """
+        Valida o bloco e compara os clientes da planilha com os existentes.
+        
+        Os clientes alterados são modificados apenas em memória; nada é gravado.
+        """
+        validator = ChunkValidator(df, self.column_mapping)
+        name = validator.text('name')
+        validator.require(name.eq(''), 'Nome é obrigatório', 'name')
+        validator.max_length(name, Client._meta.get_field('name').max_length, 'Nome')
+        email = validator.email('email')
+        phone = validator.text('phone')
+        validator.max_length(phone, Client._meta.get_field('phone').max_length, 'Telefone')
+        address = validator.text('address')
+        
+        rows = pd.DataFrame({
+            'name': name,
+            'email': email,
+            'phone': phone,
+            'address': address,
+        })[validator.valid]
+        rows['key'] = rows['name'].map(Client.normalize_name)
+        
+        # Um registro por cliente: o primeiro nome e o último valor preenchido
+        # de cada campo, como se as linhas fossem aplicadas em sequência
+        incoming = rows[self.fields + ['key']].replace('', None).groupby('key').last()
+        incoming['name'] = rows.drop_duplicates('key').set_index('key')['name']
+        
+        existing = Client.objects.by_name_key(rows['name'].unique())
+        
+        new_clients = []
+        changed_clients = []
+        now = timezone.now()
+        
+        for key, values in incoming.iterrows():
+            values = {field: None if pd.isna(value) else value for field, value in values.items()}
+            client = existing.get(key)
+            
+            if client is None:
+                new_clients.append(Client(
+                    name=values['name'],
+                    name_key=key,
+                    email=values['email'] or f'{values["name"].lower().replace(" ", ".")}@exemplo.com',
+                    phone=values['phone'],
+                    address=values['address']
+                ))
+                continue
+            
+            changed = False
+            for field in self.fields:
+                if values[field] is not None and getattr(client, field) != values[field]:
+                    setattr(client, field, values[field])
+                    changed = True
+            
+            if changed:
+                client.updated_at = now
+                changed_clients.append(client)
+        
+        return {
+            'processed_rows': len(rows),
+            'errors': validator.errors,
+            'new_clients': new_clients,
+            'changed_clients': changed_clients,
+            'unchanged': len(existing) - len(changed_clients),
+        }
+
+
+IMPORTERS = {
+    'inventory': InventoryImporter,
+    'orders': OrdersImporter,
+    'clients': ClientsImporter,
+}
+
+
+def get_importer(data_type, column_mapping, options, user):
+    """Retorna o motor de importação do tipo de dados, conforme as opções."""
+    options = options or {}
+    importer_class = IMPORTERS[data_type]
+    if data_type == 'inventory' and options.get('delta'):
+        importer_class = InventoryDeltaImporter
+    elif data_type == 'inventory' and options.get('copy'):
+        importer_class = InventoryCopyImporter
+    elif data_type == 'orders' and options.get('group_by'):
+        importer_class = OrderLinesImporter
+    return importer_class(column_mapping, options, user)
+
+
+def _to_decimal(value, places):
+    """Converte o número para Decimal com a quantidade de casas do campo."""
+    return Decimal(f'{value:.{places}f}')
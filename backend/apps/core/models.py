@@ -0,0 +1,459 @@
+"""
+Modelos da aplicação core do LogFlow.
+"""
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class SheetUpload(models.Model):
+    """
+    Planilha enviada por um usuário.
+    
+    O arquivo é armazenado uma única vez por conteúdo e compartilhado entre
+    os registros; cada usuário tem o seu registro (nome, envios, importações).
+    """
+    
+    file_hash = models.CharField(
+        max_length=64,
+        verbose_name=_('Hash do Arquivo')
+    )
+    
+    file_path = models.CharField(
+        max_length=255,
+        verbose_name=_('Arquivo')
+    )
+    
+    original_name = models.CharField(
+        max_length=255,
+        verbose_name=_('Nome Original')
+    )
+    
+    data_type = models.CharField(
+        max_length=20,
+        verbose_name=_('Tipo de Dados')
+    )
+    
+    size = models.BigIntegerField(
+        default=0,
+        verbose_name=_('Tamanho (bytes)')
+    )
+    
+    # Metadados da leitura
+    columns = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_('Colunas')
+    )
+    
+    sample_rows = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_('Linhas de Amostra')
+    )
+    
+    rows_count = models.IntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_('Total de Linhas')
+    )
+    
+    rows_count_exact = models.BooleanField(
+        default=False,
+        verbose_name=_('Total Exato')
+    )
+    
+    # Controle
+    upload_count = models.IntegerField(
+        default=1,
+        verbose_name=_('Quantidade de Envios')
+    )
+    
+    created_by = models.ForeignKey(
+        'users.User',
+        on_delete=models.PROTECT,
+        related_name='sheet_uploads',
+        verbose_name=_('Enviado por')
+    )
+    
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Data de envio')
+    )
+    
+    last_uploaded_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Último envio')
+    )
+    
+    class Meta:
+        verbose_name = _('Planilha Enviada')
+        verbose_name_plural = _('Planilhas Enviadas')
+        ordering = ['-last_uploaded_at']
+        unique_together = ['file_hash', 'created_by']
+    
+    def __str__(self):
+        return f"{self.original_name} ({self.file_hash[:12]})"
+    
+    @property
+    def last_import(self):
+        """Retorna a última importação concluída deste conteúdo pelo mesmo usuário."""
+        return ImportJob.objects.filter(
+            file_hash=self.file_hash, created_by=self.created_by_id, status='completed'
+        ).order_by('-finished_at').first()
+
+
+class ImportJob(models.Model):
+    """Importação de planilha executada em segundo plano."""
+    
+    DATA_TYPES = [
+        ('inventory', _('Inventário')),
+        ('orders', _('Ordens')),
+        ('clients', _('Clientes')),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', _('Pendente')),
+        ('running', _('Em Processamento')),
+        ('completed', _('Concluída')),
+        ('failed', _('Falhou')),
+        ('cancelled', _('Cancelada')),
+    ]
+    
+    FINISHED_STATUSES = ['completed', 'failed', 'cancelled']
+    
+    # Arquivo e parâmetros
+    file_path = models.CharField(
+        max_length=255,
+        verbose_name=_('Arquivo')
+    )
+    
+    data_type = models.CharField(
+        max_length=20,
+        choices=DATA_TYPES,
+        verbose_name=_('Tipo de Dados')
+    )
+    
+    column_mapping = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Mapeamento de Colunas')
+    )
+    
+    options = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Opções')
+    )
+    
+    # Execução
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name=_('Status')
+    )
+    
+    task_id = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        verbose_name=_('ID da Tarefa')
+    )
+    
+    # Progresso
+    total_rows = models.IntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_('Total de Linhas')
+    )
+    
+    rows_done = models.IntegerField(
+        default=0,
+        verbose_name=_('Linhas Lidas')
+    )
+    
+    processed_rows = models.IntegerField(
+        default=0,
+        verbose_name=_('Linhas Processadas')
+    )
+    
+    # Checkpoint do último bloco gravado, usado para retomar a importação
+    checkpoint_start = models.IntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_('Início do Último Bloco')
+    )
+    
+    file_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        verbose_name=_('Hash do Arquivo')
+    )
+    
+    heartbeat_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Último Sinal do Worker')
+    )
+    
+    # Execução atual: cada worker que assume a importação gera um novo token,
+    # e o worker substituído para no bloco seguinte
+    run_token = models.UUIDField(
+        blank=True,
+        null=True,
+        verbose_name=_('Token da Execução')
+    )
+    
+    message = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name=_('Mensagem')
+    )
+    
+    # Total de linhas rejeitadas; a lista completa fica no relatório de erros
+    error_count = models.IntegerField(
+        default=0,
+        verbose_name=_('Total de Erros')
+    )
+    
+    # Primeiras mensagens de erro (até IMPORT_MAX_INLINE_ERRORS)
+    errors = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_('Erros')
+    )
+    
+    # Planilha com as linhas rejeitadas (options.error_workbook)
+    error_workbook_path = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        verbose_name=_('Planilha de Erros')
+    )
+    
+    warnings = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_('Avisos')
+    )
+    
+    # Contadores do motor de importação (ex.: clientes criados/atualizados)
+    summary = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Resumo')
+    )
+    
+    # Controle
+    created_by = models.ForeignKey(
+        'users.User',
+        on_delete=models.PROTECT,
+        related_name='import_jobs',
+        verbose_name=_('Criado por')
+    )
+    
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Data de criação')
+    )
+    
+    started_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Data de início')
+    )
+    
+    finished_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Data de término')
+    )
+    
+    class Meta:
+        verbose_name = _('Importação')
+        verbose_name_plural = _('Importações')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', 'created_at']),
+            models.Index(fields=['status']),
+            models.Index(fields=['file_hash', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_data_type_display()} - {self.file_path} ({self.get_status_display()})"
+    
+    @property
+    def is_finished(self):
+        """Verifica se a importação já terminou."""
+        return self.status in self.FINISHED_STATUSES
+    
+    @property
+    def is_stale(self):
+        """Verifica se o worker parou de dar sinal durante o processamento."""
+        if self.status != 'running' or not self.heartbeat_at:
+            return True
+        elapsed = (timezone.now() - self.heartbeat_at).total_seconds()
+        return elapsed > settings.IMPORT_STALE_AFTER
+    
+    @property
+    def checkpoint(self):
+        """Retorna a faixa de linhas do último bloco gravado."""
+        if self.checkpoint_start is None:
+            return None
+        return {'start_row': self.checkpoint_start, 'end_row': self.rows_done}
+    
+    @property
+    def errors_end_row(self):
+        """Linha até a qual o relatório de erros está confirmado pelos checkpoints."""
+        if self.options.get('partitions'):
+            # Os relatórios das partições já são filtrados ao serem intercalados
+            return None
+        return self.rows_done
+    
+    @property
+    def elapsed_seconds(self):
+        """Retorna o tempo de execução em segundos."""
+        if not self.started_at:
+            return 0
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+    
+    @property
+    def throughput(self):
+        """Calcula a vazão em linhas por segundo."""
+        elapsed = self.elapsed_seconds
+        if not elapsed:
+            return 0
+        return self.rows_done / elapsed
+    
+    @classmethod
+    def historical_throughput(cls, data_type, sample=20):
+        """Retorna a vazão média (linhas por segundo) das últimas importações concluídas do tipo."""
+        jobs = cls.objects.filter(
+            data_type=data_type, status='completed', started_at__isnull=False
+        ).order_by('-finished_at')[:sample]
+        
+        seconds = sum(job.elapsed_seconds for job in jobs)
+        if not seconds:
+            return None
+        return sum(job.rows_done for job in jobs) / seconds
+    
+    @property
+    def eta_seconds(self):
+        """Estima o tempo restante em segundos."""
+        if self.is_finished:
+            return 0
+        if not self.total_rows or not self.throughput:
+            return None
+        return max(self.total_rows - self.rows_done, 0) / self.throughput
+
+
+class ImportPartition(models.Model):
+    """
+    Partição de uma importação paralela (options.partitions).
+    
+    Cada partição é processada por uma tarefa própria e guarda o seu
+    checkpoint e os seus contadores; os totais da importação são somados ao
+    final, quando a última partição termina.
+    """
+    
+    job = models.ForeignKey(
+        ImportJob,
+        on_delete=models.CASCADE,
+        related_name='partitions',
+        verbose_name=_('Importação')
+    )
+    
+    number = models.IntegerField(
+        verbose_name=_('Número')
+    )
+    
+    status = models.CharField(
+        max_length=20,
+        choices=ImportJob.STATUS_CHOICES,
+        default='pending',
+        verbose_name=_('Status')
+    )
+    
+    # Faixa de linhas lidas pela partição; nas partições por chave, todas
+    start_row = models.IntegerField(
+        default=0,
+        verbose_name=_('Linha Inicial')
+    )
+    
+    end_row = models.IntegerField(
+        verbose_name=_('Linha Final')
+    )
+    
+    # Checkpoint: linha seguinte ao último bloco gravado
+    rows_done = models.IntegerField(
+        default=0,
+        verbose_name=_('Linhas Lidas')
+    )
+    
+    processed_rows = models.IntegerField(
+        default=0,
+        verbose_name=_('Linhas Processadas')
+    )
+    
+    error_count = models.IntegerField(
+        default=0,
+        verbose_name=_('Total de Erros')
+    )
+    
+    warnings = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_('Avisos')
+    )
+    
+    summary = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Resumo')
+    )
+    
+    message = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name=_('Mensagem')
+    )
+    
+    heartbeat_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Último Sinal do Worker')
+    )
+    
+    # Execução atual da partição (ver ImportJob.run_token)
+    run_token = models.UUIDField(
+        blank=True,
+        null=True,
+        verbose_name=_('Token da Execução')
+    )
+    
+    class Meta:
+        verbose_name = _('Partição de Importação')
+        verbose_name_plural = _('Partições de Importação')
+        ordering = ['job', 'number']
+        unique_together = ['job', 'number']
+    
+    def __str__(self):
+        return f"{self.job} - partição {self.number}"
+    
+    @property
+    def is_finished(self):
+        """Verifica se a partição já terminou."""
+        return self.status in ImportJob.FINISHED_STATUSES
+    
+    @property
+    def is_stale(self):
+        """Verifica se o worker parou de dar sinal durante o processamento."""
+        if self.status != 'running' or not self.heartbeat_at:
+            return True
+        elapsed = (timezone.now() - self.heartbeat_at).total_seconds()
+        return elapsed > settings.IMPORT_STALE_AFTER
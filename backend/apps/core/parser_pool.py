@@ -0,0 +1,260 @@
+"""
+Leitura isolada de planilhas em processos auxiliares.
+
+Arquivos corrompidos ou gigantes (.xls legados, "zip bombs" em .xlsx) podem
+prender a CPU ou esgotar a memória de quem os lê. Por isso a interpretação
+das planilhas roda num pool de processos filhos, reaproveitados entre
+leituras, cada um com limite de memória (RLIMIT_AS) e com tempo máximo por
+leitura. Um processo que estoura o limite ou o tempo é encerrado e
+substituído, e só a leitura dele falha.
+
+Os blocos convertidos voltam em arquivos Arrow num diretório temporário;
+pelo canal com o processo passam apenas os metadados e amostras pequenas.
+Com IMPORT_PARSER_WORKERS = 0 a leitura roda no próprio processo.
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class ParserError(Exception):
+    """Falha ao ler a planilha num processo auxiliar."""
+
+
+class ParserPool:
+    """
+    Pool de processos auxiliares de leitura.
+    
+    Os processos são criados sob demanda, até `size`, e cada um atende uma
+    leitura por vez. Depois de `max_jobs` leituras o processo é trocado por
+    um novo, devolvendo ao sistema a memória acumulada.
+    """
+    
+    def __init__(self, size, memory_limit, max_jobs):
+        self.size = size
+        self.memory_limit = memory_limit
+        self.max_jobs = max_jobs
+        self.context = multiprocessing.get_context('spawn')
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.started = 0
+    
+    def run(self, function, *args, timeout):
+        """Executa `function(*args)` num processo auxiliar e retorna o resultado."""
+        
+        worker = self._acquire()
+        try:
+            worker['connection'].send((function, args))
+            if not worker['connection'].poll(timeout):
+                self._discard(worker)
+                raise ParserError(f'Tempo limite de {timeout} segundos excedido ao ler a planilha')
+            status, result = worker['connection'].recv()
+        except (EOFError, OSError):
+            self._discard(worker)
+            raise ParserError(
+                'A leitura da planilha foi interrompida (memória insuficiente ou arquivo corrompido)'
+            )
+        except ParserError:
+            raise
+        except BaseException:
+            self._discard(worker)
+            raise
+        
+        worker['jobs'] += 1
+        if status == 'memory' or worker['jobs'] >= self.max_jobs:
+            self._discard(worker)
+        else:
+            self.idle.put(worker)
+        
+        if status != 'ok':
+            raise ParserError(result)
+        return result
+    
+    def _acquire(self):
+        """Retorna um processo livre, criando um novo se o pool ainda não está cheio."""
+        
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            
+            with self.lock:
+                start = self.started < self.size
+                if start:
+                    self.started += 1
+            if start:
+                return self._start()
+            
+            # Pool cheio: espera um processo ser devolvido (ou descartado)
+            try:
+                return self.idle.get(timeout=1)
+            except queue.Empty:
+                continue
+    
+    def _start(self):
+        """Inicia um processo auxiliar."""
+        
+        connection, child_connection = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main, args=(child_connection, self.memory_limit), daemon=True
+        )
+        try:
+            process.start()
+        except BaseException:
+            with self.lock:
+                self.started -= 1
+            raise
+        child_connection.close()
+        return {'process': process, 'connection': connection, 'jobs': 0}
+    
+    def _discard(self, worker):
+        """Encerra um processo auxiliar e libera a vaga no pool."""
+        
+        worker['connection'].close()
+        worker['process'].kill()
+        worker['process'].join()
+        with self.lock:
+            self.started -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parser_pool():
+    """Retorna o pool do processo atual (gunicorn ou Celery), criando-o na primeira leitura."""
+    global _pool
+    
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParserPool(
+                settings.IMPORT_PARSER_WORKERS,
+                settings.IMPORT_PARSER_MEMORY_LIMIT * 1024 * 1024,
+                settings.IMPORT_PARSER_MAX_JOBS
+            )
+        return _pool
+
+
+def run_parser(function, *args, timeout=None):
+    """Executa uma leitura no pool, ou no próprio processo se o pool estiver desativado."""
+    
+    if not settings.IMPORT_PARSER_WORKERS:
+        return function(*args)
+    return get_parser_pool().run(function, *args, timeout=timeout or settings.IMPORT_PARSER_TIMEOUT)
+
+
+def parse_preview(file, file_name, nrows):
+    """Lê o cabeçalho e a amostra da planilha (ver readers.read_sheet_preview)."""
+    
+    with _local_path(file) as path:
+        return run_parser(
+            _read_preview, path, file_name, nrows, timeout=settings.IMPORT_PARSER_PREVIEW_TIMEOUT
+        )
+
+
+@contextmanager
+def parse_to_arrow(file, file_name, part_size):
+    """
+    Converte a planilha em arquivos Arrow de até `part_size` linhas.
+    
+    Retorna os metadados (colunas, total de linhas e partes, com o caminho
+    de cada arquivo temporário). O diretório temporário é removido ao sair
+    do bloco with.
+    """
+    directory = tempfile.mkdtemp(prefix='logflow-parser-')
+    try:
+        with _local_path(file) as path:
+            yield run_parser(_convert_to_arrow, path, file_name, part_size, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def _local_path(file):
+    """Caminho local do arquivo, copiando-o para um temporário se o storage não tiver um."""
+    
+    path = getattr(file, 'name', None)
+    if path and os.path.isabs(path) and os.path.isfile(path):
+        yield path
+        return
+    
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(prefix='logflow-upload-') as copy:
+        shutil.copyfileobj(file, copy)
+        copy.flush()
+        file.seek(0)
+        yield copy.name
+
+
+def _worker_main(connection, memory_limit):
+    """Laço do processo auxiliar: recebe leituras e devolve os resultados."""
+    
+    import resource
+    
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    
+    while True:
+        try:
+            function, args = connection.recv()
+        except EOFError:
+            return
+        
+        try:
+            connection.send(('ok', function(*args)))
+        except MemoryError:
+            # O processo pode ter ficado inconsistente; o pool o substitui
+            connection.send(('memory', 'Memória insuficiente para ler a planilha'))
+            return
+        except Exception as e:
+            connection.send(('error', str(e) or e.__class__.__name__))
+
+
+def _read_preview(path, file_name, nrows):
+    """Lê a amostra da planilha (executado no processo auxiliar)."""
+    from .readers import read_sheet_preview
+    
+    with open(path, 'rb') as file:
+        return read_sheet_preview(file, file_name, nrows)
+
+
+def _convert_to_arrow(path, file_name, part_size, directory):
+    """Converte a planilha em arquivos Arrow (executado no processo auxiliar)."""
+    from .columnar import to_arrow_bytes
+    from .readers import iter_sheet_chunks, read_sheet_header
+    
+    meta = {
+        'columns': [],
+        'rows_count': 0,
+        'parts': []
+    }
+    
+    with open(path, 'rb') as file:
+        for number, df in enumerate(iter_sheet_chunks(file, file_name, part_size)):
+            if not meta['columns']:
+                meta['columns'] = [str(column) for column in df.columns]
+            
+            part_path = os.path.join(directory, f'part-{number:05d}.arrow')
+            with open(part_path, 'wb') as part_file:
+                part_file.write(to_arrow_bytes(df))
+            
+            meta['parts'].append({
+                'path': part_path,
+                'start_row': int(df.index[0]),
+                'end_row': int(df.index[-1]) + 1
+            })
+            meta['rows_count'] = int(df.index[-1]) + 1
+        
+        if not meta['columns']:
+            # Planilha sem linhas de dados: guarda apenas o cabeçalho
+            file.seek(0)
+            meta['columns'] = read_sheet_header(file, file_name)
+    
+    return meta
@@ -0,0 +1,380 @@
+"""
+Leitores de planilhas para a aplicação core.
+"""
+
+import csv
+import hashlib
+import io
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+
+# Quantidade padrão de linhas entregues por bloco aos processadores
+DEFAULT_CHUNK_SIZE = 5000
+
+# Quantidade padrão de linhas de amostra na pré-visualização
+DEFAULT_PREVIEW_ROWS = 10
+
+# Formatos aceitos no upload
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+DELIMITED_EXTENSIONS = ('.csv', '.tsv')
+PARQUET_EXTENSIONS = ('.parquet',)
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + DELIMITED_EXTENSIONS + PARQUET_EXTENSIONS
+
+# Trecho inicial usado para detectar codificação e delimitador dos CSVs
+CSV_SAMPLE_SIZE = 1024 * 1024
+
+# Tamanho dos blocos lidos pelo leitor de CSV do Arrow
+CSV_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def iter_sheet_chunks(file, file_name, chunk_size=DEFAULT_CHUNK_SIZE, start_row=0):
+    """
+    Lê a planilha em blocos de no máximo `chunk_size` linhas.
+    
+    Cada bloco é um DataFrame cujo índice é a posição da linha de dados na
+    planilha (0 = primeira linha após o cabeçalho), mantendo a numeração
+    "Linha N" das mensagens de erro igual à da leitura completa. Linhas
+    anteriores a `start_row` são puladas, para retomar uma importação.
+    """
+    extension = file_extension(file_name)
+    
+    if extension == '.xlsx':
+        yield from iter_xlsx_chunks(file, chunk_size, start_row)
+        return
+    
+    if extension in DELIMITED_EXTENSIONS:
+        yield from iter_csv_chunks(file, file_name, chunk_size, start_row)
+        return
+    
+    if extension in PARQUET_EXTENSIONS:
+        yield from iter_parquet_chunks(file, chunk_size, start_row)
+        return
+    
+    # Formato legado (.xls) não tem leitor em streaming no openpyxl
+    df = pd.read_excel(file).iloc[start_row:]
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def iter_xlsx_chunks(file, chunk_size=DEFAULT_CHUNK_SIZE, start_row=0):
+    """
+    Lê um arquivo .xlsx em streaming com o modo read_only do openpyxl.
+    
+    Apenas um bloco de linhas fica em memória por vez, então o pico de memória
+    depende de `chunk_size` e não do tamanho da planilha. Os tipos das células
+    (números, datas, textos) são preservados nas colunas do DataFrame.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        
+        columns = _normalize_columns(header)
+        width = len(columns)
+        records = []
+        index = []
+        
+        for position, values in enumerate(rows):
+            if position < start_row:
+                continue
+            
+            # Linhas totalmente vazias são ignoradas, mas mantêm a numeração
+            if not any(value is not None for value in values):
+                continue
+            
+            records.append(_fit_row(values, width))
+            index.append(position)
+            
+            if len(records) >= chunk_size:
+                yield pd.DataFrame.from_records(records, columns=columns, index=index)
+                records = []
+                index = []
+        
+        if records:
+            yield pd.DataFrame.from_records(records, columns=columns, index=index)
+    finally:
+        workbook.close()
+
+
+def iter_csv_chunks(file, file_name, chunk_size=DEFAULT_CHUNK_SIZE, start_row=0):
+    """
+    Lê um arquivo CSV/TSV em streaming com o leitor de CSV do Arrow.
+    
+    A codificação e o delimitador são detectados no início do arquivo. Todas
+    as colunas são lidas como texto (preservando, por exemplo, zeros à
+    esquerda em códigos); a conversão de números e datas fica com a validação
+    dos processadores, como nos valores digitados em planilhas.
+    
+    A detecção vê apenas os primeiros CSV_SAMPLE_SIZE bytes: se um arquivo
+    tido como UTF-8 tiver bytes inválidos mais adiante, a leitura continua
+    como Latin-1 a partir da primeira linha ainda não entregue.
+    """
+    csv_format = detect_csv_format(file, file_name)
+    if not csv_format['columns']:
+        return
+    
+    position = start_row
+    try:
+        for df in _iter_csv_batches(file, csv_format, chunk_size, start_row):
+            yield df
+            position = int(df.index[-1]) + 1
+    except pa.ArrowInvalid as e:
+        if csv_format['encoding'] != 'utf8' or 'UTF8' not in str(e):
+            raise
+        file.seek(0)
+        yield from _iter_csv_batches(file, {**csv_format, 'encoding': 'latin1'}, chunk_size, position)
+
+
+def iter_parquet_chunks(file, chunk_size=DEFAULT_CHUNK_SIZE, start_row=0):
+    """Lê um arquivo Parquet por lotes, preservando os tipos das colunas."""
+    parquet_file = pq.ParquetFile(file)
+    columns = _parquet_columns(parquet_file)
+    yield from _iter_record_batches(
+        parquet_file.iter_batches(batch_size=chunk_size, columns=columns), chunk_size, start_row
+    )
+
+
+def detect_csv_format(file, file_name):
+    """
+    Detecta a codificação, o delimitador e o cabeçalho de um CSV.
+    
+    Arquivos que não são UTF-8 válido são lidos como Latin-1 (padrão das
+    exportações do ERP). Em arquivos .tsv o delimitador é sempre a
+    tabulação; nos demais ele é inferido entre vírgula, ponto e vírgula,
+    tabulação e barra vertical.
+    """
+    file.seek(0)
+    sample = file.read(CSV_SAMPLE_SIZE)
+    file.seek(0)
+    
+    try:
+        text = sample.decode('utf-8')
+        encoding = 'utf8'
+    except UnicodeDecodeError as e:
+        if e.reason == 'unexpected end of data':
+            # A amostra cortou um caractere multibyte no final
+            text = sample[:e.start].decode('utf-8')
+            encoding = 'utf8'
+        else:
+            text = sample.decode('latin-1')
+            encoding = 'latin1'
+    text = text.lstrip('\ufeff')
+    
+    if file_extension(file_name) == '.tsv':
+        delimiter = '\t'
+    else:
+        # Descarta a última linha da amostra, que pode estar incompleta
+        lines = text.splitlines()
+        if len(sample) == CSV_SAMPLE_SIZE and len(lines) > 1:
+            lines = lines[:-1]
+        try:
+            delimiter = csv.Sniffer().sniff('\n'.join(lines[:100]), delimiters=',;\t|').delimiter
+        except csv.Error:
+            delimiter = ','
+    
+    header = next(csv.reader(io.StringIO(text), delimiter=delimiter), [])
+    return {
+        'encoding': encoding,
+        'delimiter': delimiter,
+        'columns': _normalize_columns([value or None for value in header])
+    }
+
+
+def file_extension(file_name):
+    """Retorna a extensão do arquivo em minúsculas."""
+    return os.path.splitext(file_name)[1].lower()
+
+
+def read_sheet_header(file, file_name):
+    """Retorna os nomes das colunas da planilha lendo apenas o cabeçalho."""
+    extension = file_extension(file_name)
+    
+    if extension in DELIMITED_EXTENSIONS:
+        return detect_csv_format(file, file_name)['columns']
+    
+    if extension in PARQUET_EXTENSIONS:
+        return _parquet_columns(pq.ParquetFile(file))
+    
+    if extension != '.xlsx':
+        return [str(column) for column in pd.read_excel(file, nrows=0).columns]
+    
+    workbook = load_workbook(file, read_only=True)
+    try:
+        header = next(workbook.active.iter_rows(max_row=1, values_only=True), None)
+    finally:
+        workbook.close()
+    return _normalize_columns(header) if header else []
+
+
+def read_sheet_preview(file, file_name, nrows=DEFAULT_PREVIEW_ROWS):
+    """
+    Lê apenas o cabeçalho e as primeiras `nrows` linhas da planilha.
+    
+    Em arquivos .xlsx o total de linhas vem da dimensão gravada na planilha,
+    sem percorrer os dados; quando ela não está disponível o total é None.
+    Em arquivos Parquet o total vem dos metadados do arquivo; em CSVs ele só
+    é conhecido depois da leitura completa.
+    Retorna um dicionário com `columns`, `sample` (DataFrame) e `rows_count`.
+    """
+    extension = file_extension(file_name)
+    
+    if extension in DELIMITED_EXTENSIONS or extension in PARQUET_EXTENSIONS:
+        columns = read_sheet_header(file, file_name)
+        file.seek(0)
+        sample = next(iter_sheet_chunks(file, file_name, nrows), None)
+        file.seek(0)
+        
+        rows_count = None
+        if extension in PARQUET_EXTENSIONS:
+            rows_count = pq.ParquetFile(file).metadata.num_rows
+            file.seek(0)
+        
+        return {
+            'columns': columns,
+            'sample': sample.head(nrows) if sample is not None else pd.DataFrame(columns=columns),
+            'rows_count': rows_count
+        }
+    
+    if extension != '.xlsx':
+        # Formato legado (.xls) é limitado a 65 mil linhas; lê por inteiro
+        df = pd.read_excel(file)
+        return {
+            'columns': [str(column) for column in df.columns],
+            'sample': df.head(nrows),
+            'rows_count': len(df)
+        }
+    
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.active
+        max_row = worksheet.max_row
+        rows = worksheet.iter_rows(max_row=nrows + 1, values_only=True)
+        header = next(rows, None)
+        columns = _normalize_columns(header) if header else []
+        records = [_fit_row(values, len(columns)) for values in rows]
+    finally:
+        workbook.close()
+        file.seek(0)
+    
+    return {
+        'columns': columns,
+        'sample': pd.DataFrame.from_records(records, columns=columns),
+        'rows_count': max(max_row - 1, 0) if max_row else None
+    }
+
+
+def hash_file(file):
+    """Calcula o hash SHA-256 do conteúdo do arquivo, lendo-o em partes."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1024 * 1024), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _iter_record_batches(batches, chunk_size, start_row):
+    """
+    Agrupa lotes do Arrow em DataFrames de no máximo `chunk_size` linhas.
+    
+    O índice de cada bloco é a posição da linha nos dados, como na leitura
+    das planilhas, e linhas totalmente vazias são ignoradas.
+    """
+    position = 0
+    pending = []
+    pending_rows = 0
+    
+    for batch in batches:
+        if position + batch.num_rows <= start_row:
+            position += batch.num_rows
+            continue
+        
+        if position < start_row:
+            batch = batch.slice(start_row - position)
+            position = start_row
+        
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        
+        while pending_rows >= chunk_size:
+            table = pa.Table.from_batches(pending)
+            df = _batch_frame(table.slice(0, chunk_size), position)
+            if len(df):
+                yield df
+            
+            position += chunk_size
+            pending = table.slice(chunk_size).to_batches()
+            pending_rows -= chunk_size
+    
+    if pending_rows:
+        df = _batch_frame(pa.Table.from_batches(pending), position)
+        if len(df):
+            yield df
+
+
+def _iter_csv_batches(file, csv_format, chunk_size, start_row):
+    """Lê o CSV com o formato detectado, em blocos indexados pela posição das linhas."""
+    columns = csv_format['columns']
+    reader = pa_csv.open_csv(
+        file,
+        read_options=pa_csv.ReadOptions(
+            encoding=csv_format['encoding'],
+            column_names=columns,
+            skip_rows=1,
+            block_size=CSV_BLOCK_SIZE
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=csv_format['delimiter']),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=True
+        )
+    )
+    yield from _iter_record_batches(reader, chunk_size, start_row)
+
+
+def _batch_frame(table, position):
+    """Converte um trecho dos dados em DataFrame indexado pela posição das linhas."""
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(position, position + len(df))
+    return df.dropna(how='all')
+
+
+def _parquet_columns(parquet_file):
+    """Retorna as colunas de dados do Parquet, sem as de índice do pandas."""
+    return [
+        name for name in parquet_file.schema_arrow.names
+        if not name.startswith('__index_level_')
+    ]
+
+
+def _fit_row(values, width):
+    """Ajusta a linha à quantidade de colunas do cabeçalho."""
+    values = tuple(values[:width])
+    if len(values) < width:
+        values += (None,) * (width - len(values))
+    return values
+
+
+def _normalize_columns(header):
+    """Gera nomes de colunas no mesmo formato usado pelo pandas.read_excel."""
+    columns = []
+    seen = {}
+    
+    for position, value in enumerate(header):
+        name = f'Unnamed: {position}' if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+    
+    return columns
@@ -0,0 +1,68 @@
+"""
+Serializers para a aplicação core.
+"""
+
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from .models import ImportJob, ImportPartition, SheetUpload
+
+
+class ImportPartitionSerializer(serializers.ModelSerializer):
+    """Serializer para o modelo ImportPartition."""
+    
+    class Meta:
+        model = ImportPartition
+        fields = [
+            'number', 'status', 'start_row', 'end_row', 'rows_done',
+            'processed_rows', 'error_count', 'message'
+        ]
+        read_only_fields = fields
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Serializer para o modelo ImportJob."""
+    
+    throughput = serializers.ReadOnlyField()
+    eta_seconds = serializers.ReadOnlyField()
+    checkpoint = serializers.ReadOnlyField()
+    errors_url = serializers.SerializerMethodField()
+    error_workbook_url = serializers.SerializerMethodField()
+    partitions = ImportPartitionSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file_path', 'data_type', 'column_mapping', 'options',
+            'status', 'total_rows', 'rows_done', 'processed_rows',
+            'throughput', 'eta_seconds', 'checkpoint', 'partitions', 'file_hash',
+            'message', 'summary', 'error_count', 'errors_url', 'error_workbook_url',
+            'errors', 'warnings', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+    
+    def get_errors_url(self, obj):
+        """Link para o relatório completo de erros, quando houver erros."""
+        if not obj.error_count:
+            return None
+        return reverse('core:import_job_errors', args=[obj.pk], request=self.context.get('request'))
+    
+    def get_error_workbook_url(self, obj):
+        """Link para a planilha das linhas rejeitadas, depois de gerada."""
+        if not obj.error_workbook_path:
+            return None
+        return reverse('core:import_job_error_workbook', args=[obj.pk], request=self.context.get('request'))
+
+
+class SheetUploadSerializer(serializers.ModelSerializer):
+    """Serializer para o modelo SheetUpload."""
+    
+    ready = serializers.BooleanField(source='rows_count_exact', read_only=True)
+    
+    class Meta:
+        model = SheetUpload
+        fields = [
+            'file_hash', 'file_path', 'original_name', 'data_type', 'size',
+            'columns', 'sample_rows', 'rows_count', 'rows_count_exact',
+            'ready', 'upload_count', 'created_at', 'last_uploaded_at'
+        ]
+        read_only_fields = fields
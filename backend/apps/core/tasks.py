@@ -0,0 +1,552 @@
+"""
+Tarefas assíncronas da aplicação core.
+"""
+
+import itertools
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pandas as pd
+from celery import shared_task
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .importers import get_importer
+from .models import ImportJob, ImportPartition, SheetUpload
+from .columnar import build_columnar_cache, delete_columnar_caches, iter_cached_chunks, load_cache_meta
+from .error_reports import (
+    delete_partition_errors, merge_partition_errors, write_error_part, write_error_workbook
+)
+from .readers import hash_file
+from .validation import format_error
+
+
+class SupersededError(Exception):
+    """Outro worker assumiu a execução da importação ou já gravou o bloco."""
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_import_job(self, job_id):
+    """
+    Executa uma importação de planilha em segundo plano.
+    
+    A mensagem só é confirmada ao final, então se o worker morrer no meio da
+    importação o broker entrega a tarefa de novo e ela continua a partir do
+    último checkpoint.
+    """
+    
+    job = ImportJob.objects.select_related('created_by').get(pk=job_id)
+    
+    if job.status == 'running' and not job.is_stale:
+        # Outro worker ainda está processando; confere de novo mais tarde
+        raise self.retry(countdown=settings.IMPORT_STALE_AFTER, max_retries=None)
+    
+    if job.status not in ('pending', 'running'):
+        return job.status
+    
+    if job.options.get('partitions'):
+        start_partitioned_import(job)
+    else:
+        run_import_job(job)
+    return job.status
+
+
+def run_import_job(job):
+    """
+    Processa o arquivo da importação bloco a bloco.
+    
+    Cada bloco é gravado na sua própria transação, de forma que os bloqueios
+    em tabelas como inventory_product duram apenas o tempo de um bloco. O
+    checkpoint (faixa de linhas do bloco e hash do arquivo) é salvo na mesma
+    transação do bloco, então uma importação interrompida recomeça da linha
+    seguinte ao último bloco gravado, sem reprocessar linhas. O cancelamento
+    é verificado antes de cada bloco.
+    
+    Cada execução assume a importação com um token próprio (ver _start_job).
+    A transação de cada bloco bloqueia o registro e confere o token e o
+    checkpoint, então um worker substituído por uma retomada para no bloco
+    seguinte, sem gravar de novo as linhas já importadas.
+    
+    Os erros de cada bloco vão para o relatório de erros da importação (ver
+    error_reports); o registro guarda apenas o total e as primeiras
+    IMPORT_MAX_INLINE_ERRORS mensagens.
+    """
+    importer = get_importer(job.data_type, job.column_mapping, job.options, job.created_by)
+    chunk_size = int(job.options.get('chunk_size') or importer.chunk_size or settings.IMPORT_CHUNK_SIZE)
+    
+    if not _start_job(job):
+        return
+    
+    try:
+        with _heartbeat(job):
+            _prepare_file(job)
+        
+        chunks = iter_cached_chunks(job.file_hash, chunk_size, start_row=job.rows_done)
+        for df in chunks:
+            if _is_cancelled(job):
+                break
+            
+            with transaction.atomic():
+                _lock_checkpoint(job, int(df.index[0]))
+                result = importer.process(df)
+                write_error_part(job.pk, int(df.index[0]), result['errors'])
+                
+                # Checkpoint gravado junto com os dados do bloco
+                job.checkpoint_start = int(df.index[0])
+                job.rows_done = int(df.index[-1]) + 1
+                job.processed_rows += result['processed_rows']
+                job.error_count += len(result['errors'])
+                _extend_capped(job.errors, map(format_error, result['errors']))
+                _extend_capped(job.warnings, result['warnings'])
+                for key, value in result.get('summary', {}).items():
+                    job.summary[key] = job.summary.get(key, 0) + value
+                job.heartbeat_at = timezone.now()
+                job.save(update_fields=[
+                    'checkpoint_start', 'rows_done', 'processed_rows', 'error_count',
+                    'errors', 'warnings', 'summary', 'heartbeat_at'
+                ])
+    
+    except SupersededError:
+        # A importação foi retomada por outro worker, que segue do checkpoint
+        return
+    except Exception as e:
+        job.status = 'failed'
+        job.message = f'Erro ao processar dados: {str(e)}'
+    else:
+        if _is_cancelled(job):
+            job.status = 'cancelled'
+            job.message = f'Importação cancelada. {job.processed_rows} linhas processadas.'
+        else:
+            job.status = 'completed'
+            job.message = importer.format_result(job.processed_rows, job.summary)
+            if job.total_rows is None or job.total_rows < job.rows_done:
+                job.total_rows = job.rows_done
+    
+    job.finished_at = timezone.now()
+    if _save_if_current(job, ['status', 'message', 'total_rows', 'finished_at']):
+        _after_finish(job)
+
+
+def start_partitioned_import(job):
+    """
+    Divide a importação em partições processadas em paralelo (options.partitions).
+    
+    Quando o motor de importação define partition_field, cada partição lê o
+    arquivo inteiro e processa só as linhas cuja chave (ex.: código do
+    produto) cai nela pelo hash, então as linhas de uma mesma chave ficam
+    numa única partição, na ordem da planilha, e as partições não disputam
+    os mesmos registros. Sem chave, o arquivo é dividido em faixas de
+    linhas. Cada partição vira uma tarefa do Celery; numa retomada, só as
+    partições com falha ou sem sinal do worker são enviadas de novo.
+    """
+    importer = get_importer(job.data_type, job.column_mapping, job.options, job.created_by)
+    count = int(job.options['partitions'])
+    
+    if not _start_job(job):
+        return
+    
+    try:
+        with _heartbeat(job):
+            _prepare_file(job)
+    except Exception as e:
+        job.status = 'failed'
+        job.message = f'Erro ao processar dados: {str(e)}'
+        job.finished_at = timezone.now()
+        _save_if_current(job, ['status', 'message', 'finished_at'])
+        return
+    
+    with transaction.atomic():
+        for number in range(count):
+            if importer.partition_field is None:
+                start_row = number * job.total_rows // count
+                end_row = (number + 1) * job.total_rows // count
+            else:
+                start_row, end_row = 0, job.total_rows
+            ImportPartition.objects.get_or_create(
+                job=job, number=number,
+                defaults={'start_row': start_row, 'end_row': end_row, 'rows_done': start_row}
+            )
+        
+        partitions = list(job.partitions.select_for_update())
+        retry = [
+            partition.number for partition in partitions
+            if partition.status in ('pending', 'failed') or (partition.status == 'running' and partition.is_stale)
+        ]
+        ImportPartition.objects.filter(job=job, number__in=retry).update(status='pending', message=None)
+    
+    if not retry:
+        # Todas as partições já terminaram; falta apenas consolidar
+        _finish_partitioned_import(job)
+        return
+    
+    for number in retry:
+        process_import_partition.delay(job.pk, number)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_import_partition(self, job_id, number):
+    """Executa uma partição de uma importação paralela."""
+    
+    partition = ImportPartition.objects.select_related('job__created_by').get(job_id=job_id, number=number)
+    
+    if partition.status == 'running' and not partition.is_stale:
+        # Outro worker ainda está processando; confere de novo mais tarde
+        raise self.retry(countdown=settings.IMPORT_STALE_AFTER, max_retries=None)
+    
+    if partition.status not in ('pending', 'running'):
+        return partition.status
+    
+    run_import_partition(partition)
+    return partition.status
+
+
+def run_import_partition(partition):
+    """
+    Processa uma partição bloco a bloco, como run_import_job.
+    
+    O checkpoint da partição e os contadores da importação (atualizados com
+    expressões F, já que várias partições gravam ao mesmo tempo) são salvos
+    na transação de cada bloco, que confere o token e o checkpoint da
+    partição como em run_import_job. A última partição a terminar consolida
+    a importação.
+    """
+    job = partition.job
+    importer = get_importer(job.data_type, job.column_mapping, job.options, job.created_by)
+    chunk_size = int(job.options.get('chunk_size') or importer.chunk_size or settings.IMPORT_CHUNK_SIZE)
+    count = int(job.options['partitions'])
+    keyed = importer.partition_field is not None
+    
+    partition.heartbeat_at = timezone.now()
+    partition.run_token = uuid.uuid4()
+    started = ImportPartition.objects.filter(pk=partition.pk, status__in=['pending', 'running']).update(
+        status='running', heartbeat_at=partition.heartbeat_at, run_token=partition.run_token
+    )
+    if not started:
+        return
+    # Checkpoint gravado pelo worker anterior até ser substituído
+    partition.refresh_from_db(fields=['rows_done', 'processed_rows', 'error_count', 'warnings', 'summary'])
+    
+    try:
+        # Nas partições por chave, cada bloco lido tem linhas de todas as
+        # partições; lê blocos maiores para que cada uma grave cerca de
+        # chunk_size linhas por transação
+        scan_size = chunk_size * count if keyed else chunk_size
+        for df in iter_cached_chunks(job.file_hash, scan_size, start_row=partition.rows_done):
+            if df.index[0] >= partition.end_row or _is_cancelled(job):
+                break
+            
+            df = df[df.index < partition.end_row]
+            start_row = int(df.index[0])
+            end_row = int(df.index[-1]) + 1
+            if keyed:
+                df = df[_partition_numbers(importer.partition_keys(df), count) == partition.number]
+            
+            with transaction.atomic():
+                _lock_checkpoint(partition, start_row)
+                if df.empty:
+                    result = {'processed_rows': 0, 'errors': [], 'warnings': []}
+                else:
+                    result = importer.process(df)
+                write_error_part(job.pk, start_row, result['errors'], partition=partition.number)
+                
+                partition.rows_done = end_row
+                partition.processed_rows += result['processed_rows']
+                partition.error_count += len(result['errors'])
+                _extend_capped(partition.warnings, result['warnings'])
+                for key, value in result.get('summary', {}).items():
+                    partition.summary[key] = partition.summary.get(key, 0) + value
+                partition.heartbeat_at = timezone.now()
+                partition.save(update_fields=[
+                    'rows_done', 'processed_rows', 'error_count', 'warnings', 'summary', 'heartbeat_at'
+                ])
+                
+                ImportJob.objects.filter(pk=job.pk).update(
+                    rows_done=F('rows_done') + len(df),
+                    processed_rows=F('processed_rows') + result['processed_rows'],
+                    error_count=F('error_count') + len(result['errors']),
+                    heartbeat_at=partition.heartbeat_at
+                )
+    
+    except SupersededError:
+        # A partição foi retomada por outro worker, que segue do checkpoint
+        return
+    except Exception as e:
+        partition.status = 'failed'
+        partition.message = f'Erro ao processar dados: {str(e)}'
+    else:
+        partition.status = 'cancelled' if _is_cancelled(job) else 'completed'
+    
+    if _save_if_current(partition, ['status', 'message']):
+        _finish_partitioned_import(job)
+
+
+def _finish_partitioned_import(job):
+    """
+    Consolida a importação paralela quando todas as partições terminaram.
+    
+    A importação fica bloqueada durante a verificação, então apenas a última
+    partição a terminar consolida os resumos e intercala os relatórios de
+    erros das partições.
+    """
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().select_related('created_by').get(pk=job.pk)
+        partitions = list(job.partitions.all())
+        if job.finished_at is not None or any(not partition.is_finished for partition in partitions):
+            return
+        
+        importer = get_importer(job.data_type, job.column_mapping, job.options, job.created_by)
+        
+        errors = merge_partition_errors(job.pk, {partition.number: partition.rows_done for partition in partitions})
+        job.errors = []
+        _extend_capped(job.errors, map(format_error, errors))
+        job.warnings = []
+        for partition in partitions:
+            _extend_capped(job.warnings, partition.warnings)
+        
+        job.error_count = sum(partition.error_count for partition in partitions)
+        job.summary = dict(sum((Counter(partition.summary) for partition in partitions), Counter()))
+        
+        failed = [partition for partition in partitions if partition.status == 'failed']
+        if job.status == 'cancelled' or any(partition.status == 'cancelled' for partition in partitions):
+            job.status = 'cancelled'
+            job.message = f'Importação cancelada. {job.processed_rows} linhas processadas.'
+        elif failed:
+            job.status = 'failed'
+            job.message = f'Partição {failed[0].number}: {failed[0].message}'
+        else:
+            job.status = 'completed'
+            job.message = importer.format_result(job.processed_rows, job.summary)
+        
+        job.finished_at = timezone.now()
+        job.save(update_fields=[
+            'status', 'message', 'error_count', 'errors', 'warnings', 'summary', 'finished_at'
+        ])
+        
+        if job.status != 'failed':
+            # Importações com falha mantêm os relatórios das partições para a retomada
+            transaction.on_commit(lambda: delete_partition_errors(job.pk, [p.number for p in partitions]))
+    
+    _after_finish(job)
+
+
+def _partition_numbers(keys, count):
+    """Distribui as chaves entre as partições com um hash estável entre processos."""
+    return pd.util.hash_pandas_object(keys, index=False) % count
+
+
+# Quantidade máxima de mensagens de erro retornadas pela simulação
+DRY_RUN_MAX_ERRORS = 100
+
+
+def plan_import(file_hash, data_type, column_mapping, options, user):
+    """
+    Simula uma importação, sem gravar dados.
+    
+    Lê a cópia colunar do arquivo, que já deve ter sido gerada (ver
+    build_upload_cache), e passa cada bloco pelo método plan do motor de
+    importação, que valida as linhas e resolve as chaves com consultas em
+    lote. O tempo de gravação é estimado pela vazão das últimas importações
+    do mesmo tipo.
+    """
+    meta = load_cache_meta(file_hash)
+    if meta is None:
+        raise ValueError('A cópia colunar do arquivo ainda não foi gerada')
+    
+    importer = get_importer(data_type, column_mapping, options, user)
+    chunk_size = int(options.get('chunk_size') or importer.chunk_size or settings.IMPORT_CHUNK_SIZE)
+    
+    processed_rows = 0
+    errors = []
+    summary = {}
+    # Motivos agrupados sem o valor rejeitado
+    reasons = Counter()
+    for df in iter_cached_chunks(file_hash, chunk_size):
+        result = importer.plan(df)
+        processed_rows += result['processed_rows']
+        reasons.update(error['message'].split(': ')[0] for error in result['errors'])
+        _extend_capped(errors, map(format_error, result['errors']), DRY_RUN_MAX_ERRORS)
+        for key, value in result['summary'].items():
+            summary[key] = summary.get(key, 0) + value
+    
+    throughput = ImportJob.historical_throughput(data_type) or settings.IMPORT_DEFAULT_THROUGHPUT
+    
+    return {
+        'file_hash': file_hash,
+        'total_rows': meta['rows_count'],
+        'processed_rows': processed_rows,
+        'rejected_rows': sum(reasons.values()),
+        'summary': summary,
+        'rejected_reasons': dict(reasons.most_common()),
+        'errors': errors,
+        'estimated_seconds': round(meta['rows_count'] / throughput, 1),
+    }
+
+
+def _start_job(job):
+    """
+    Assume a importação com um novo token de execução; retorna False se ela
+    foi cancelada.
+    
+    Um worker anterior ainda vivo perde a importação: a partir daqui os
+    blocos e o status gravados por ele são recusados (ver _lock_checkpoint).
+    """
+    now = timezone.now()
+    job.status = 'running'
+    job.started_at = job.started_at or now
+    job.heartbeat_at = now
+    job.run_token = uuid.uuid4()
+    started = ImportJob.objects.filter(pk=job.pk, status__in=['pending', 'running']).update(
+        status=job.status, started_at=job.started_at, heartbeat_at=job.heartbeat_at,
+        run_token=job.run_token
+    )
+    if not started:
+        # Cancelada antes de o worker começar
+        job.refresh_from_db()
+        return False
+    
+    # Checkpoint gravado pelo worker anterior até ser substituído
+    job.refresh_from_db(fields=[
+        'rows_done', 'checkpoint_start', 'processed_rows', 'error_count', 'errors', 'warnings', 'summary'
+    ])
+    return True
+
+
+def _lock_checkpoint(record, start_row):
+    """
+    Bloqueia a importação (ou a partição) até o fim da transação do bloco.
+    
+    Levanta SupersededError se outro worker assumiu a execução ou se o
+    checkpoint gravado não é o início do bloco, para que um bloco nunca
+    seja gravado duas vezes.
+    """
+    stored = type(record).objects.select_for_update().filter(pk=record.pk).values_list(
+        'run_token', 'rows_done'
+    ).first()
+    if stored != (record.run_token, start_row):
+        raise SupersededError()
+
+
+def _save_if_current(record, fields):
+    """Grava os campos se o worker ainda é o dono da execução; retorna False se foi substituído."""
+    return bool(type(record).objects.filter(pk=record.pk, run_token=record.run_token).update(
+        **{field: getattr(record, field) for field in fields}
+    ))
+
+
+@contextmanager
+def _heartbeat(record):
+    """
+    Renova o sinal do worker em segundo plano durante etapas sem blocos.
+    
+    O hash e a conversão do arquivo podem levar até IMPORT_PARSER_TIMEOUT
+    segundos, mais que IMPORT_STALE_AFTER; sem o sinal, a importação
+    pareceria interrompida e poderia ser retomada por outro worker.
+    """
+    stop = threading.Event()
+    
+    def beat():
+        try:
+            while not stop.wait(settings.IMPORT_STALE_AFTER / 3):
+                type(record).objects.filter(pk=record.pk, run_token=record.run_token).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            # Conexão própria da thread
+            connection.close()
+    
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _prepare_file(job):
+    """Confere o hash do arquivo e garante a cópia colunar usada na leitura dos blocos."""
+    
+    with default_storage.open(job.file_path, 'rb') as file_content:
+        file_hash = hash_file(file_content)
+        if job.file_hash and job.file_hash != file_hash:
+            raise ValueError('O arquivo foi alterado desde o último checkpoint')
+        
+        # Reaproveita a cópia colunar gerada no upload (ou a gera agora)
+        meta = build_columnar_cache(file_content, job.file_path, file_hash)
+    
+    job.file_hash = file_hash
+    job.total_rows = meta['rows_count']
+    job.save(update_fields=['file_hash', 'total_rows'])
+
+
+def _after_finish(job):
+    """Agenda a planilha de linhas rejeitadas, se pedida (options.error_workbook)."""
+    if job.status in ('completed', 'cancelled') and job.error_count and job.options.get('error_workbook'):
+        build_error_workbook.delay(job.pk)
+
+
+def _extend_capped(messages, new_messages, limit=None):
+    """Acrescenta mensagens à lista até o limite (IMPORT_MAX_INLINE_ERRORS)."""
+    limit = limit or settings.IMPORT_MAX_INLINE_ERRORS
+    messages.extend(itertools.islice(new_messages, max(limit - len(messages), 0)))
+
+
+def _is_cancelled(job):
+    """Verifica no banco se o cancelamento da importação foi solicitado."""
+    return ImportJob.objects.filter(pk=job.pk, status='cancelled').exists()
+
+
+@shared_task
+def build_error_workbook(job_id):
+    """
+    Gera em segundo plano a planilha com as linhas rejeitadas da importação.
+    
+    O caminho é gravado no registro ao terminar; até lá o link da planilha
+    não aparece na importação.
+    """
+    job = ImportJob.objects.get(pk=job_id)
+    path = write_error_workbook(job)
+    ImportJob.objects.filter(pk=job_id).update(error_workbook_path=path)
+    return path
+
+
+@shared_task
+def cleanup_upload_caches():
+    """
+    Remove as cópias colunares sem uso há mais de IMPORT_CACHE_RETENTION_DAYS dias.
+    
+    São mantidas as cópias de uploads recentes e de importações recentes ou
+    ainda não terminadas. Uma cópia removida é gerada de novo se o conteúdo
+    for processado outra vez. Executada diariamente pelo Celery Beat.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.IMPORT_CACHE_RETENTION_DAYS)
+    
+    keep = set(SheetUpload.objects.filter(last_uploaded_at__gte=cutoff).values_list('file_hash', flat=True))
+    keep.update(ImportJob.objects.filter(
+        Q(status__in=['pending', 'running']) | Q(created_at__gte=cutoff) | Q(finished_at__gte=cutoff),
+        file_hash__isnull=False
+    ).values_list('file_hash', flat=True))
+    
+    return len(delete_columnar_caches(keep))
+
+
+@shared_task
+def build_upload_cache(file_path, file_hash):
+    """
+    Gera a cópia colunar de um upload em segundo plano.
+    
+    Ao terminar, o total exato de linhas é gravado no registro do upload.
+    """
+    with default_storage.open(file_path, 'rb') as file_content:
+        meta = build_columnar_cache(file_content, file_path, file_hash)
+    
+    SheetUpload.objects.filter(file_hash=file_hash).update(
+        rows_count=meta['rows_count'], rows_count_exact=True
+    )
+    return meta['rows_count']
@@ -0,0 +1,11 @@
+"""
+Funções auxiliares dos testes da aplicação core.
+"""
+
+
+def import_in_chunks(importer, df, chunk_size):
+    """Processa a planilha em blocos, como a tarefa de importação, e junta os erros."""
+    errors = []
+    for start in range(0, len(df), chunk_size):
+        errors.extend(importer.process(df.iloc[start:start + chunk_size])['errors'])
+    return errors
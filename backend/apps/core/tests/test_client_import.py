@@ -0,0 +1,67 @@
+"""
+Testes da importação de clientes com detecção de alterações.
+"""
+
+import pandas as pd
+from django.test import TestCase
+
+from apps.core.importers import get_importer
+from apps.orders.models import Client
+from apps.users.models import User
+
+
+class ClientsImporterTests(TestCase):
+    """Atualização em lote apenas dos clientes alterados."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='importador', password='senha')
+        self.ana = Client.objects.create(name='Ana Souza', email='ana@exemplo.com', phone='1111')
+        self.bia = Client.objects.create(name='Bia Lima', email='bia@exemplo.com', phone='2222')
+    
+    def test_only_changed_clients_are_written(self):
+        df = pd.DataFrame({
+            'name': ['ANA SOUZA', 'Bia Lima', 'Caio Reis'],
+            'email': ['ana@exemplo.com', 'bia@novo.com', ''],
+            'phone': ['', '2222', '3333'],
+        })
+        bia_updated_at = self.bia.updated_at
+        
+        with self.assertNumQueries(3):
+            # Consulta dos clientes, inserção dos novos e atualização dos alterados
+            result = get_importer('clients', {}, {}, self.user).process(df)
+        
+        self.assertEqual(result['summary'], {'created': 1, 'updated': 1, 'unchanged': 1})
+        self.assertEqual(result['processed_rows'], 3)
+        
+        self.ana.refresh_from_db()
+        self.assertEqual((self.ana.name, self.ana.phone), ('Ana Souza', '1111'))
+        self.bia.refresh_from_db()
+        self.assertEqual(self.bia.email, 'bia@novo.com')
+        self.assertGreater(self.bia.updated_at, bia_updated_at)
+        self.assertEqual(Client.objects.get(name_key='caio reis').email, 'caio.reis@exemplo.com')
+    
+    def test_last_filled_value_of_repeated_client_wins(self):
+        df = pd.DataFrame({
+            'name': ['Bia Lima', 'bia lima', 'BIA LIMA'],
+            'phone': ['4444', '5555', ''],
+        })
+        
+        result = get_importer('clients', {}, {}, self.user).process(df)
+        
+        self.assertEqual(result['summary'], {'created': 0, 'updated': 1, 'unchanged': 0})
+        self.bia.refresh_from_db()
+        self.assertEqual(self.bia.phone, '5555')
+    
+    def test_invalid_rows_are_reported(self):
+        df = pd.DataFrame({
+            'name': ['', 'Ana Souza'],
+            'email': ['x@exemplo.com', 'sem-arroba'],
+        })
+        
+        result = get_importer('clients', {}, {}, self.user).process(df)
+        
+        self.assertEqual(
+            [(error['row'], error['column'], error['code']) for error in result['errors']],
+            [(1, 'name', 'required'), (2, 'email', 'invalid')]
+        )
+        self.assertEqual(Client.objects.count(), 2)
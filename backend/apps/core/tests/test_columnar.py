@@ -0,0 +1,73 @@
+"""
+Testes da cópia colunar das planilhas enviadas.
+"""
+
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.core.columnar import build_columnar_cache, cache_dir, iter_cached_chunks, load_cache_meta
+from apps.core.models import ImportJob, SheetUpload
+from apps.core.tasks import cleanup_upload_caches
+from apps.users.models import User
+
+
+SHEET = b'code,name,quantity\nP001,Caixa,1\nP002,Fita,2\n'
+
+
+class ColumnarCacheTests(TestCase):
+    """Geração e limpeza da cópia colunar."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root, IMPORT_CACHE_RETENTION_DAYS=30)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.user = User.objects.create_user(username='importador', password='senha')
+    
+    def build(self, file_hash):
+        return build_columnar_cache(io.BytesIO(SHEET), 'estoque.csv', file_hash)
+    
+    def test_interrupted_conversions_are_removed(self):
+        # Conversão interrompida antes do meta.json
+        default_storage.save(f'{cache_dir("abc")}/0ld/part-00000.arrow', ContentFile(b'parcial'))
+        
+        meta = self.build('abc')
+        
+        directories, _ = default_storage.listdir(cache_dir('abc'))
+        self.assertEqual(len(directories), 1)
+        self.assertTrue(meta['parts'][0]['name'].startswith(f'{cache_dir("abc")}/{directories[0]}/'))
+        self.assertEqual(len(next(iter_cached_chunks('abc'))), 2)
+    
+    def test_cleanup_removes_only_unused_caches(self):
+        for file_hash in ('recent', 'old', 'running'):
+            self.build(file_hash)
+            SheetUpload.objects.create(
+                file_hash=file_hash, file_path='excel_uploads/estoque.csv', original_name='estoque.csv',
+                data_type='inventory', created_by=self.user
+            )
+        old = timezone.now() - timedelta(days=31)
+        SheetUpload.objects.exclude(file_hash='recent').update(last_uploaded_at=old)
+        job = ImportJob.objects.create(
+            file_path='excel_uploads/estoque.csv', data_type='inventory', file_hash='running',
+            status='running', created_by=self.user
+        )
+        ImportJob.objects.filter(pk=job.pk).update(created_at=old)
+        
+        self.assertEqual(cleanup_upload_caches(), 1)
+        
+        self.assertIsNone(load_cache_meta('old'))
+        self.assertFalse(default_storage.exists(cache_dir('old')))
+        self.assertIsNotNone(load_cache_meta('recent'))
+        self.assertIsNotNone(load_cache_meta('running'))
+        
+        # Uma cópia removida é gerada de novo quando o conteúdo volta a ser lido
+        self.assertEqual(self.build('old')['rows_count'], 2)
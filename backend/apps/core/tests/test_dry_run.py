@@ -0,0 +1,94 @@
+"""
+Testes da simulação de importação (dry run).
+"""
+
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.core.columnar import build_columnar_cache
+from apps.core.models import ImportJob, SheetUpload
+from apps.inventory.models import Category, Product, StockMovement
+from apps.users.models import User
+
+
+SHEET = (
+    b'code,name,category,quantity\n'
+    b'P001,Caixa,Embalagens,5\n'
+    b'P002,Fita,Adesivos,2\n'
+    b'P002,Fita,Adesivos,3\n'
+    b',Sem codigo,,1\n'
+    b'P003,Etiqueta,,abc\n'
+)
+
+
+class DryRunTests(TestCase):
+    """Simulação síncrona sobre a cópia colunar."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.user = User.objects.create_user(username='importador', password='senha')
+        Product.objects.create(
+            code='P001', name='Caixa', category=Category.objects.create(name='Embalagens'), current_stock=1
+        )
+        
+        self.file_path = default_storage.save('excel_uploads/files/estoque.csv', ContentFile(SHEET))
+        self.upload = SheetUpload.objects.create(
+            file_hash='abc123', file_path=self.file_path, original_name='estoque.csv',
+            data_type='inventory', created_by=self.user
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+    
+    def dry_run(self, **options):
+        return self.api.post('/api/v1/upload/process/', {
+            'file_path': self.file_path,
+            'data_type': 'inventory',
+            'options': {'dry_run': True, **options},
+        }, format='json')
+    
+    def test_conflict_while_file_is_prepared(self):
+        with mock.patch('apps.core.views.build_upload_cache') as build:
+            response = self.dry_run()
+        
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['file_hash'], 'abc123')
+        # O upload já agendou a conversão
+        build.delay.assert_not_called()
+    
+    def test_report_without_writing_data(self):
+        with default_storage.open(self.file_path, 'rb') as file_content:
+            build_columnar_cache(file_content, self.file_path, 'abc123')
+        
+        for chunk_size in (100, 1):
+            with self.subTest(chunk_size=chunk_size):
+                response = self.dry_run(chunk_size=chunk_size)
+                
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual(response.data['total_rows'], 5)
+                self.assertEqual(response.data['processed_rows'], 3)
+                self.assertEqual(response.data['rejected_rows'], 2)
+                self.assertEqual(response.data['summary'], {
+                    'products_created': 1,
+                    'products_updated': 1,
+                    'categories_created': 1,
+                    'movements_created': 2,
+                })
+                self.assertEqual(
+                    response.data['rejected_reasons'],
+                    {'Código e nome são obrigatórios': 1, 'Quantidade inválida': 1}
+                )
+        
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertFalse(ImportJob.objects.exists())
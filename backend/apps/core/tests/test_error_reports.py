@@ -0,0 +1,72 @@
+"""
+Testes dos relatórios de erros das importações.
+"""
+
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.core.error_reports import iter_errors, write_error_part
+from apps.core.models import ImportJob
+from apps.users.models import User
+
+
+def errors_for(rows):
+    return [
+        {'row': row, 'column': 'quantity', 'code': 'invalid', 'message': f'Quantidade inválida: linha {row}'}
+        for row in rows
+    ]
+
+
+class ErrorReportTests(TestCase):
+    """Relatório de erros gravado por bloco e lido em streaming."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.user = User.objects.create_user(username='importador', password='senha')
+        self.job = ImportJob.objects.create(
+            file_path='excel_uploads/estoque.csv', data_type='inventory', created_by=self.user,
+            rows_done=20, error_count=5
+        )
+        write_error_part(self.job.pk, 10, errors_for([12, 15]))
+        write_error_part(self.job.pk, 0, errors_for([1, 3, 4]))
+    
+    def rows(self, **kwargs):
+        return [int(error['row']) for error in iter_errors(self.job.pk, **kwargs)]
+    
+    def test_errors_are_read_in_sheet_order(self):
+        self.assertEqual(self.rows(), [1, 3, 4, 12, 15])
+        self.assertEqual(self.rows(offset=2), [4, 12, 15])
+        self.assertEqual(self.rows(offset=4), [15])
+    
+    def test_reprocessed_chunk_replaces_its_errors(self):
+        write_error_part(self.job.pk, 0, errors_for([2]))
+        self.assertEqual(self.rows(), [2, 12, 15])
+        
+        write_error_part(self.job.pk, 10, [])
+        self.assertEqual(self.rows(), [2])
+    
+    def test_chunks_after_checkpoint_are_left_out(self):
+        self.assertEqual(self.rows(end_row=10), [1, 3, 4])
+    
+    def test_download_is_paginated(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        
+        response = api.get(f'/api/v1/upload/jobs/{self.job.pk}/errors/', {'page': 2, 'page_size': 2})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Total-Count'], '5')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'row,column,code,message')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['4', '12'])
+        
+        response = api.get(f'/api/v1/upload/jobs/{self.job.pk}/errors/', {'page': 0})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,154 @@
+"""
+Testes da importação de inventário em lote.
+"""
+
+import pandas as pd
+from django.test import TestCase
+
+from apps.core.importers import get_importer
+from apps.inventory.models import Category, Product, StockMovement
+from apps.users.models import User
+
+from .helpers import import_in_chunks
+
+
+class InventoryImporterTests(TestCase):
+    """Importação de inventário em lote."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='importador', password='senha')
+        self.category = Category.objects.create(name='Embalagens')
+        self.product = Product.objects.create(
+            code='P001', name='Caixa', category=self.category, current_stock=10
+        )
+    
+    def sheet(self):
+        return pd.DataFrame({
+            'code': ['P001', 'P002', 'P001', 'P002', 'P003', 'P001'],
+            'name': ['Caixa', 'Fita', 'Caixa', 'Fita', 'Etiqueta', 'Caixa'],
+            'category': ['Embalagens', 'Adesivos', 'Embalagens', 'Adesivos', '', 'Embalagens'],
+            'quantity': [5, 7, 3, 2, 4, 0],
+        })
+    
+    def test_movements_record_running_balances(self):
+        importer = get_importer('inventory', {}, {}, self.user)
+        result = importer.process(self.sheet())
+        
+        self.assertEqual(result['processed_rows'], 6)
+        self.assertEqual(result['errors'], [])
+        
+        movements = list(
+            StockMovement.objects.filter(product=self.product).order_by('pk').values_list(
+                'movement_type', 'quantity', 'previous_stock', 'current_stock', 'reference'
+            )
+        )
+        self.assertEqual(movements, [
+            ('in', 5, 10, 15, 'Importação Excel - Linha 1'),
+            ('in', 3, 15, 18, 'Importação Excel - Linha 3'),
+        ])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 18)
+    
+    def test_first_row_of_new_product_sets_initial_stock(self):
+        importer = get_importer('inventory', {}, {'default_min_stock': 3}, self.user)
+        importer.process(self.sheet())
+        
+        tape = Product.objects.get(code='P002')
+        self.assertEqual(tape.category.name, 'Adesivos')
+        self.assertEqual(tape.minimum_stock, 3)
+        self.assertEqual(tape.current_stock, 9)
+        self.assertEqual(
+            list(tape.stockmovement_set.values_list('previous_stock', 'current_stock')), [(7, 9)]
+        )
+        
+        label = Product.objects.get(code='P003')
+        self.assertEqual(label.category.name, 'Sem Categoria')
+        self.assertEqual(label.current_stock, 4)
+        self.assertFalse(label.stockmovement_set.exists())
+    
+    def test_result_does_not_depend_on_chunk_size(self):
+        expected = None
+        for chunk_size in (6, 1, 2, 4):
+            with self.subTest(chunk_size=chunk_size):
+                StockMovement.objects.all().delete()
+                Product.objects.exclude(pk=self.product.pk).delete()
+                Product.objects.filter(pk=self.product.pk).update(current_stock=10)
+                
+                importer = get_importer('inventory', {}, {}, self.user)
+                import_in_chunks(importer, self.sheet(), chunk_size)
+                
+                state = (
+                    sorted(Product.objects.values_list('code', 'current_stock')),
+                    list(StockMovement.objects.order_by('pk').values_list(
+                        'product__code', 'quantity', 'previous_stock', 'current_stock'
+                    ))
+                )
+                if expected is None:
+                    expected = state
+                self.assertEqual(state, expected)
+    
+    def test_invalid_rows_are_reported_without_stopping_the_chunk(self):
+        df = pd.DataFrame({
+            'code': ['P001', '', 'P004'],
+            'name': ['Caixa', 'Sem código', 'Pacote'],
+            'quantity': ['2', '1', 'abc'],
+        })
+        importer = get_importer('inventory', {}, {}, self.user)
+        result = importer.process(df)
+        
+        self.assertEqual(result['processed_rows'], 1)
+        self.assertEqual(
+            [(error['row'], error['column'], error['code']) for error in result['errors']],
+            [(2, 'code', 'required'), (3, 'quantity', 'invalid')]
+        )
+        self.assertFalse(Product.objects.filter(code='P004').exists())
+
+
+class InventoryDeltaImporterTests(TestCase):
+    """Contagem de inventário gravada como diferenças."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='importador', password='senha')
+        category = Category.objects.create(name='Embalagens')
+        Product.objects.create(code='P001', name='Caixa', category=category, current_stock=10)
+        Product.objects.create(code='P002', name='Fita', category=category, current_stock=4)
+    
+    def test_only_differences_are_adjusted(self):
+        df = pd.DataFrame({
+            'code': ['P001', 'P002', 'P003'],
+            'name': ['Caixa', 'Fita', 'Etiqueta'],
+            'quantity': [7, 4, 12],
+        })
+        result = get_importer('inventory', {}, {'delta': True}, self.user).process(df)
+        
+        self.assertEqual(result['summary'], {'created': 1, 'adjusted': 1, 'unchanged': 1})
+        self.assertEqual(
+            list(StockMovement.objects.values_list(
+                'product__code', 'movement_type', 'previous_stock', 'current_stock'
+            )),
+            [('P001', 'adjustment', 10, 7)]
+        )
+        self.assertEqual(Product.objects.get(code='P003').current_stock, 12)
+    
+    def test_last_count_of_repeated_code_wins(self):
+        df = pd.DataFrame({
+            'code': ['P001', 'P001'],
+            'name': ['Caixa', 'Caixa'],
+            'quantity': [8, 6],
+        })
+        get_importer('inventory', {}, {'delta': True}, self.user).process(df)
+        
+        self.assertEqual(Product.objects.get(code='P001').current_stock, 6)
+    
+    def test_blank_or_negative_count_is_rejected(self):
+        df = pd.DataFrame({
+            'code': ['P001', 'P002'],
+            'name': ['Caixa', 'Fita'],
+            'quantity': [None, -1],
+        })
+        result = get_importer('inventory', {}, {'delta': True}, self.user).process(df)
+        
+        self.assertEqual([error['code'] for error in result['errors']], ['required', 'out_of_range'])
+        self.assertEqual(
+            dict(Product.objects.values_list('code', 'current_stock')), {'P001': 10, 'P002': 4}
+        )
@@ -0,0 +1,155 @@
+"""
+Testes da importação de ordens em lote.
+"""
+
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+import pandas as pd
+from django.db import connection
+from django.test import TestCase
+
+from apps.core.importers import get_importer
+from apps.inventory.models import Category, Product
+from apps.orders.models import Client, ClientQuerySet, Order, OrderItem
+from apps.users.models import User
+
+from .helpers import import_in_chunks
+
+
+class ClientLookupTests(TestCase):
+    """Localização de clientes pelo nome normalizado."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='importador', password='senha')
+    
+    def test_clients_without_name_key_are_matched_by_name(self):
+        client = Client.objects.create(name='José Silva', email='jose@exemplo.com')
+        Client.objects.filter(pk=client.pk).update(name_key='')
+        
+        df = pd.DataFrame({'client': ['José Silva', 'JOSE  silva'], 'order_type': ['delivery', 'pickup']})
+        get_importer('orders', {}, {}, self.user).process(df)
+        
+        self.assertEqual(Client.objects.count(), 1)
+        self.assertEqual(Order.objects.filter(client=client).count(), 2)
+        
+        self.assertEqual(Client.objects.backfill_name_keys(), 1)
+        client.refresh_from_db()
+        self.assertEqual(client.name_key, 'jose silva')
+    
+    def test_new_clients_are_created_once_per_key(self):
+        Client.objects.create(name='Ana', email='ana@exemplo.com')
+        df = pd.DataFrame({'client': ['Ana', 'Bia', 'BIA', 'Caio', 'bia ']})
+        
+        get_importer('orders', {}, {}, self.user).process(df)
+        
+        self.assertEqual(
+            sorted(Client.objects.values_list('name_key', flat=True)), ['ana', 'bia', 'caio']
+        )
+        self.assertEqual(Order.objects.filter(client__name_key='bia').count(), 3)
+    
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Bloqueios consultivos exigem PostgreSQL')
+    def test_client_created_concurrently_is_found_after_lock(self):
+        by_name_key = ClientQuerySet.by_name_key
+        calls = []
+        
+        def created_by_other_import(queryset, names):
+            calls.append(names)
+            if len(calls) == 1:
+                # Outra importação grava o cliente entre a consulta e o bloqueio
+                found = by_name_key(queryset, names)
+                Client.objects.create(name='Bia', email='bia@exemplo.com')
+                return found
+            return by_name_key(queryset, names)
+        
+        with mock.patch.object(ClientQuerySet, 'by_name_key', created_by_other_import):
+            get_importer('orders', {}, {}, self.user).process(pd.DataFrame({'client': ['Bia']}))
+        
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Client.objects.filter(name_key='bia').count(), 1)
+        self.assertEqual(Order.objects.get().client.name, 'Bia')
+
+
+class OrderLinesImporterTests(TestCase):
+    """Importação de ordens com uma linha por item."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='importador', password='senha')
+        category = Category.objects.create(name='Embalagens')
+        Product.objects.create(
+            code='P001', name='Caixa', category=category, current_stock=10,
+            weight=Decimal('1.5'), dimensions='100x100x100'
+        )
+        Product.objects.create(
+            code='P002', name='Contêiner', category=category, current_stock=1, weight=Decimal('6000000')
+        )
+        self.df = pd.DataFrame({
+            'pedido': ['A', 'A', 'B', 'B', 'C'],
+            'client': ['Ana', None, None, 'Bia', 'Caio'],
+            'product_code': ['P001', 'P001', 'P001', 'P001', 'X'],
+            'quantity': [1, 2, 1, 1, 1],
+        })
+    
+    def import_lines(self, df, chunk_size=None):
+        importer = get_importer('orders', {}, {'group_by': 'pedido'}, self.user)
+        return import_in_chunks(importer, df, chunk_size or len(df))
+    
+    def test_result_does_not_depend_on_chunk_size(self):
+        for chunk_size in (5, 1, 2):
+            with self.subTest(chunk_size=chunk_size):
+                OrderItem.objects.all().delete()
+                Order.objects.all().delete()
+                
+                errors = self.import_lines(self.df, chunk_size)
+                
+                self.assertEqual(
+                    sorted(OrderItem.objects.values_list('order__external_reference', 'quantity')),
+                    [('A', 1), ('A', 2), ('B', 1)]
+                )
+                self.assertEqual(
+                    [(error['row'], error['code']) for error in errors],
+                    [(3, 'required'), (5, 'not_found')]
+                )
+                order = Order.objects.get(external_reference='A')
+                self.assertEqual((order.total_weight, order.total_volume), (Decimal('4.5'), Decimal('3')))
+    
+    def test_prices_outside_column_range_are_row_errors(self):
+        df = pd.DataFrame({
+            'pedido': ['A', 'A', 'A', 'A'],
+            'client': ['Ana', 'Ana', 'Ana', 'Ana'],
+            'product_code': ['P001', 'P001', 'P001', 'P001'],
+            'quantity': [1, 1, 1, 2],
+            'unit_price': ['10.5', '-1', '100000000', '60000000'],
+        })
+        
+        errors = self.import_lines(df)
+        
+        self.assertEqual(
+            [(error['row'], error['column'], error['code']) for error in errors],
+            [(row, 'unit_price', 'out_of_range') for row in (2, 3, 4)]
+        )
+        self.assertEqual(
+            list(OrderItem.objects.values_list('unit_price', 'total_price')),
+            [(Decimal('10.5'), Decimal('10.5'))]
+        )
+    
+    def test_order_totals_outside_column_range_are_row_errors(self):
+        df = pd.DataFrame({
+            'pedido': ['A', 'A', 'A'],
+            'client': ['Ana', None, None],
+            'product_code': ['P002', 'P002', 'P001'],
+            'quantity': [1, 1, 2],
+        })
+        
+        for chunk_size in (3, 1):
+            with self.subTest(chunk_size=chunk_size):
+                OrderItem.objects.all().delete()
+                Order.objects.all().delete()
+                
+                errors = self.import_lines(df, chunk_size)
+                
+                self.assertEqual([(error['row'], error['code']) for error in errors], [(2, 'out_of_range')])
+                order = Order.objects.get()
+                self.assertEqual(order.total_weight, Decimal('6000003'))
+                self.assertEqual(order.items.count(), 2)
@@ -0,0 +1,136 @@
+"""
+Testes das importações paralelas (options.partitions).
+"""
+
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.core import tasks
+from apps.core.error_reports import errors_dir, iter_errors, merge_partition_errors, write_error_part
+from apps.core.models import ImportJob, ImportPartition
+from apps.inventory.models import Product, StockMovement
+from apps.users.models import User
+
+from .test_error_reports import errors_for
+
+
+class PartitionErrorsTests(TestCase):
+    """Intercalação dos relatórios de erros das partições."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.user = User.objects.create_user(username='importador', password='senha')
+        self.job = ImportJob.objects.create(
+            file_path='excel_uploads/estoque.csv', data_type='inventory', options={'partitions': 2},
+            created_by=self.user, error_count=6
+        )
+        ImportPartition.objects.create(job=self.job, number=0, end_row=20, rows_done=20)
+        ImportPartition.objects.create(job=self.job, number=1, end_row=20, rows_done=10)
+        write_error_part(self.job.pk, 0, errors_for([2, 7]), partition=0)
+        write_error_part(self.job.pk, 10, errors_for([11, 18]), partition=0)
+        write_error_part(self.job.pk, 0, errors_for([1, 5]), partition=1)
+        # Bloco da partição 1 ainda sem checkpoint
+        write_error_part(self.job.pk, 10, errors_for([12]), partition=1)
+    
+    def download(self, **params):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.get(f'/api/v1/upload/jobs/{self.job.pk}/errors/', params)
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        return [int(line.split(',')[0]) for line in lines[1:]]
+    
+    def test_merge_follows_sheet_order_up_to_checkpoints(self):
+        errors = merge_partition_errors(self.job.pk, {0: 20, 1: 10})
+        
+        self.assertEqual([int(error['row']) for error in errors], [1, 2, 5, 7, 11, 18])
+        
+        # Repetir a intercalação refaz o relatório da importação
+        errors = merge_partition_errors(self.job.pk, {0: 10, 1: 10})
+        self.assertEqual([int(error['row']) for error in errors], [1, 2, 5, 7])
+    
+    def test_report_is_read_from_partitions_while_running(self):
+        self.assertEqual(self.download(), [1, 2, 5, 7, 11, 18])
+        self.assertEqual(self.download(page=2, page_size=4), [11, 18])
+        self.assertFalse(default_storage.listdir(errors_dir(self.job.pk))[1])
+    
+    def test_report_is_read_from_job_after_consolidation(self):
+        merge_partition_errors(self.job.pk, {0: 10, 1: 10})
+        self.job.finished_at = self.job.created_at
+        self.job.save(update_fields=['finished_at'])
+        
+        self.assertEqual(self.download(), [1, 2, 5, 7])
+
+
+class PartitionedImportTests(TestCase):
+    """Importação de estoque dividida em partições por código de produto."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.user = User.objects.create_user(username='importador', password='senha')
+        lines = ['code,name,quantity']
+        for row in range(1, 13):
+            lines.append(f'P{row % 4},Produto {row % 4},{"x" if row % 3 == 0 else 1}')
+        file_path = default_storage.save('excel_uploads/estoque.csv', ContentFile('\n'.join(lines).encode()))
+        self.job = ImportJob.objects.create(
+            file_path=file_path, data_type='inventory', options={'partitions': 2, 'chunk_size': 2},
+            created_by=self.user
+        )
+    
+    def run_partition(self, number):
+        partition = ImportPartition.objects.select_related('job__created_by').get(job=self.job, number=number)
+        tasks.run_import_partition(partition)
+    
+    def error_rows(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.get(f'/api/v1/upload/jobs/{self.job.pk}/errors/')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        return [int(line.split(',')[0]) for line in lines[1:]]
+    
+    def test_partitions_are_consolidated_by_the_last_one(self):
+        with mock.patch.object(tasks.process_import_partition, 'delay') as delay:
+            tasks.start_partitioned_import(self.job)
+        self.assertEqual(sorted(call.args for call in delay.call_args_list), [(self.job.pk, 0), (self.job.pk, 1)])
+        
+        self.run_partition(0)
+        first = ImportPartition.objects.get(job=self.job, number=0)
+        self.assertEqual(first.status, 'completed')
+        
+        # O relatório da partição que terminou já pode ser baixado
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'running')
+        self.assertEqual(self.job.error_count, first.error_count)
+        self.assertEqual(len(self.error_rows()), first.error_count)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_partition(1)
+        
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'completed')
+        self.assertEqual((self.job.rows_done, self.job.processed_rows, self.job.error_count), (12, 8, 4))
+        self.assertEqual(self.error_rows(), [3, 6, 9, 12])
+        self.assertEqual([int(error['row']) for error in iter_errors(self.job.pk, partition=0)], [])
+        
+        # A primeira linha de cada código cria o produto; as demais geram entradas
+        self.assertEqual(StockMovement.objects.count(), 4)
+        self.assertEqual(
+            dict(Product.objects.values_list('code', 'current_stock')),
+            {'P0': 2, 'P1': 2, 'P2': 2, 'P3': 2}
+        )
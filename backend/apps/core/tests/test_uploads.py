@@ -0,0 +1,83 @@
+"""
+Testes do upload de planilhas e da deduplicação por conteúdo.
+"""
+
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.core.models import ImportJob, SheetUpload
+from apps.users.models import User
+
+
+SHEET = b'code,name,quantity\nP001,Caixa,1\nP002,Fita,2\n'
+
+
+class SheetUploadDeduplicationTests(TestCase):
+    """Deduplicação dos uploads por usuário."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.owner = User.objects.create_user(username='ana', password='senha')
+        self.other = User.objects.create_user(username='bruno', password='senha')
+    
+    def upload(self, user, name='estoque.csv'):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            '/api/v1/upload/excel/', {'file': SimpleUploadedFile(name, SHEET), 'type': 'inventory'},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+    
+    def info(self, user, file_hash):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(f'/api/v1/upload/files/{file_hash}/')
+    
+    def test_same_user_gets_duplicate(self):
+        first = self.upload(self.owner)
+        again = self.upload(self.owner, name='copia.csv')
+        
+        self.assertFalse(first['duplicate'])
+        self.assertTrue(again['duplicate'])
+        self.assertEqual(again['original_name'], 'estoque.csv')
+        self.assertEqual(again['upload_count'], 2)
+    
+    def test_other_user_gets_own_upload_without_owner_metadata(self):
+        first = self.upload(self.owner)
+        ImportJob.objects.create(
+            file_path=first['file_path'], data_type='inventory', file_hash=first['file_hash'],
+            status='completed', finished_at=timezone.now(), created_by=self.owner
+        )
+        
+        second = self.upload(self.other, name='meu_estoque.csv')
+        
+        self.assertFalse(second['duplicate'])
+        self.assertEqual(second['warnings'], [])
+        self.assertEqual(second['original_name'], 'meu_estoque.csv')
+        self.assertEqual(second['upload_count'], 1)
+        # O arquivo armazenado é compartilhado
+        self.assertEqual(second['file_path'], first['file_path'])
+        self.assertEqual(second['columns'], ['code', 'name', 'quantity'])
+        self.assertEqual(SheetUpload.objects.filter(file_hash=first['file_hash']).count(), 2)
+        
+        response = self.info(self.other, second['file_hash'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['original_name'], 'meu_estoque.csv')
+    
+    def test_info_is_scoped_to_uploader(self):
+        first = self.upload(self.owner)
+        
+        self.assertEqual(self.info(self.other, first['file_hash']).status_code, 404)
+        self.assertEqual(self.info(self.owner, first['file_hash']).status_code, 200)
@@ -0,0 +1,45 @@
+"""
+Testes da validação vetorizada dos blocos.
+"""
+
+import pandas as pd
+from django.test import SimpleTestCase
+
+from apps.core.validation import INTEGER_MAX, ChunkValidator
+
+
+class ChunkValidatorTests(SimpleTestCase):
+    """Validação por coluna, com o primeiro erro de cada linha."""
+    
+    def test_integer_rejects_invalid_and_out_of_range_values(self):
+        df = pd.DataFrame({
+            'quantity': ['5', '', 'abc', '2.5', str(INTEGER_MAX), str(INTEGER_MAX + 1), '-3000000000']
+        })
+        validator = ChunkValidator(df, {})
+        
+        quantity = validator.integer('quantity')
+        
+        self.assertEqual(quantity[validator.valid].tolist(), [5, 0, INTEGER_MAX])
+        self.assertEqual(
+            [(error['row'], error['code']) for error in validator.errors],
+            [(3, 'invalid'), (4, 'invalid'), (6, 'out_of_range'), (7, 'out_of_range')]
+        )
+    
+    def test_integer_custom_bounds(self):
+        validator = ChunkValidator(pd.DataFrame({'quantity': ['0', '1', '100']}), {})
+        
+        validator.integer('quantity', min_value=1, max_value=99)
+        
+        self.assertEqual([error['row'] for error in validator.errors], [1, 3])
+    
+    def test_first_error_of_each_row_is_kept(self):
+        df = pd.DataFrame({'Código': ['', 'P2'], 'quantity': ['x', 'y']})
+        validator = ChunkValidator(df, {'code': 'Código'})
+        
+        validator.require(validator.text('code').eq(''), 'Código obrigatório', 'code')
+        validator.integer('quantity')
+        
+        self.assertEqual(
+            [(error['row'], error['column'], error['code']) for error in validator.errors],
+            [(1, 'Código', 'required'), (2, 'quantity', 'invalid')]
+        )
@@ -3,15 +3,42 @@ URLs para a aplicação core.
 """
 
 from django.urls import path
-from .views import ExcelUploadView, ExcelProcessView, system_stats
+from .views import (
+    ExcelUploadView, ExcelProcessView, UploadInfoView, ImportJobListView,
+    ImportJobDetailView, ImportJobCancelView, ImportJobResumeView, ImportJobErrorsView,
+    ImportJobErrorWorkbookView, StockMovementBatchView, low_stock_alert, stock_alert_events,
+    stock_at_date, system_stats
+)
 
 app_name = 'core'
 
 urlpatterns = [
     # Upload e processamento de Excel
     path('upload/excel/', ExcelUploadView.as_view(), name='excel_upload'),
+    path('upload/files/<slug:file_hash>/', UploadInfoView.as_view(), name='upload_info'),
     path('upload/process/', ExcelProcessView.as_view(), name='excel_process'),
     
+    # Importações em segundo plano
+    path('upload/jobs/', ImportJobListView.as_view(), name='import_job_list'),
+    path('upload/jobs/<int:pk>/', ImportJobDetailView.as_view(), name='import_job_detail'),
+    path('upload/jobs/<int:pk>/cancel/', ImportJobCancelView.as_view(), name='import_job_cancel'),
+    path('upload/jobs/<int:pk>/resume/', ImportJobResumeView.as_view(), name='import_job_resume'),
+    path('upload/jobs/<int:pk>/errors/', ImportJobErrorsView.as_view(), name='import_job_errors'),
+    path(
+        'upload/jobs/<int:pk>/errors/workbook/', ImportJobErrorWorkbookView.as_view(),
+        name='import_job_error_workbook'
+    ),
+    
+    # Movimentações de estoque em lote
+    path('inventory/movements/batch/', StockMovementBatchView.as_view(), name='stock_movement_batch'),
+    
+    # Estoque numa data (saldos diários)
+    path('inventory/stock-at/', stock_at_date, name='stock_at_date'),
+    
+    # Alertas de estoque baixo
+    path('inventory/alerts/low-stock/', low_stock_alert, name='low_stock_alert'),
+    path('inventory/alerts/events/', stock_alert_events, name='stock_alert_events'),
+    
     # Estatísticas do sistema
     path('stats/', system_stats, name='system_stats'),
 ]
@@ -0,0 +1,193 @@
+"""
+Validação vetorizada dos blocos de planilhas.
+"""
+
+from decimal import Decimal
+
+import pandas as pd
+from django.utils import timezone
+
+
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s]+'
+
+# Faixa das colunas IntegerField (integer de 32 bits no PostgreSQL)
+INTEGER_MIN = -2 ** 31
+INTEGER_MAX = 2 ** 31 - 1
+
+
+class ChunkValidator:
+    """
+    Valida e normaliza as colunas de um bloco com operações do pandas.
+    
+    Cada verificação roda sobre a coluna inteira e registra o erro apenas
+    nas linhas que ainda não falharam, reproduzindo o comportamento anterior
+    de reportar o primeiro problema de cada linha. Cada erro tem a linha, a
+    coluna da planilha, um código (required, invalid, too_long, not_found,
+    out_of_range) e a mensagem.
+    """
+    
+    def __init__(self, df, column_mapping):
+        self.df = df
+        self.column_mapping = column_mapping or {}
+        self.messages = pd.Series(None, index=df.index, dtype=object)
+        self.columns = pd.Series(None, index=df.index, dtype=object)
+        self.codes = pd.Series(None, index=df.index, dtype=object)
+    
+    @property
+    def valid(self):
+        """Máscara das linhas sem erros."""
+        return self.messages.isna()
+    
+    @property
+    def errors(self):
+        """Erros das linhas rejeitadas, na ordem da planilha."""
+        rejected = self.messages.notna()
+        return [
+            {'row': int(index) + 1, 'column': column, 'code': code, 'message': message}
+            for index, column, code, message in zip(
+                self.messages.index[rejected], self.columns[rejected],
+                self.codes[rejected], self.messages[rejected]
+            )
+        ]
+    
+    def fail(self, mask, message, field=None, code='invalid'):
+        """Registra o erro nas linhas da máscara que ainda são válidas."""
+        mask = mask & self.valid
+        if mask.any():
+            if isinstance(message, pd.Series):
+                message = message[mask]
+            self.messages[mask] = message
+            self.columns[mask] = self.column_mapping.get(field, field)
+            self.codes[mask] = code
+    
+    def column(self, field):
+        """Retorna a coluna mapeada para o campo, com vazios como NaN."""
+        name = self.column_mapping.get(field, field)
+        if name not in self.df.columns:
+            return pd.Series(None, index=self.df.index, dtype=object)
+        
+        series = self.df[name]
+        if series.dtype == object:
+            try:
+                series = series.mask(series.str.strip().eq(''))
+            except AttributeError:
+                # Coluna sem nenhum texto (ex.: apenas datas)
+                pass
+        return series
+    
+    def text(self, field, default=''):
+        """Normaliza a coluna como texto sem espaços nas pontas."""
+        raw = self.column(field)
+        
+        # Números inteiros lidos como float (por causa de vazios) viram "123"
+        if pd.api.types.is_float_dtype(raw) and (raw.dropna() % 1 == 0).all():
+            raw = raw.astype('Int64')
+        
+        return raw.astype(str).str.strip().where(raw.notna(), default).rename(field)
+    
+    def require(self, mask, message, field=None):
+        """Rejeita as linhas da máscara por falta de campo obrigatório."""
+        self.fail(mask, message, field, 'required')
+    
+    def max_length(self, values, max_length, label):
+        """Rejeita os textos (retornados por text) maiores que o limite do campo."""
+        self.fail(
+            values.str.len() > max_length, f'{label} excede {max_length} caracteres',
+            values.name, 'too_long'
+        )
+    
+    def integer(self, field, default=0, label='Quantidade', min_value=INTEGER_MIN, max_value=INTEGER_MAX):
+        """
+        Converte a coluna para inteiros, rejeitando valores inválidos.
+        
+        Valores fora de [min_value, max_value] (por padrão, a faixa de um
+        IntegerField) são rejeitados com out_of_range, em vez de falharem a
+        gravação do bloco inteiro no banco.
+        """
+        raw = self.column(field)
+        numeric = pd.to_numeric(raw, errors='coerce')
+        invalid = raw.notna() & (numeric.isna() | (numeric % 1 != 0))
+        out_of_range = ~invalid & ((numeric < min_value) | (numeric > max_value))
+        
+        self.fail(invalid, f'{label} inválida: ' + raw.astype(str), field)
+        self.fail(
+            out_of_range,
+            f'{label} fora do intervalo permitido ({_range_text(min_value, max_value)}): ' + raw.astype(str),
+            field, 'out_of_range'
+        )
+        return numeric.where(~invalid & ~out_of_range).fillna(default).astype(int)
+    
+    def decimal(self, field, default=0, label='Valor', min_value=None, max_value=None):
+        """
+        Converte a coluna para números, rejeitando valores inválidos.
+        
+        Com min_value/max_value (ex.: decimal_max do campo do modelo), os
+        valores fora da faixa são rejeitados com out_of_range.
+        """
+        raw = self.column(field)
+        numeric = pd.to_numeric(raw, errors='coerce')
+        invalid = raw.notna() & numeric.isna()
+        out_of_range = pd.Series(False, index=numeric.index)
+        if min_value is not None:
+            out_of_range |= numeric < min_value
+        if max_value is not None:
+            out_of_range |= numeric > max_value
+        
+        self.fail(invalid, f'{label} inválido: ' + raw.astype(str), field)
+        self.fail(
+            out_of_range,
+            f'{label} fora do intervalo permitido ({_range_text(min_value, max_value)}): ' + raw.astype(str),
+            field, 'out_of_range'
+        )
+        return numeric.where(~invalid & ~out_of_range).fillna(default)
+    
+    def date(self, field, default=None, label='Data'):
+        """Converte a coluna para datas com fuso horário, rejeitando inválidas."""
+        raw = self.column(field)
+        parsed = pd.to_datetime(raw, errors='coerce', dayfirst=True, format='mixed')
+        invalid = raw.notna() & parsed.isna()
+        
+        self.fail(invalid, f'{label} inválida: ' + raw.astype(str), field)
+        
+        if parsed.dt.tz is None:
+            parsed = parsed.dt.tz_localize(
+                timezone.get_current_timezone(), ambiguous='NaT', nonexistent='shift_forward'
+            )
+        return parsed.fillna(default or timezone.localtime())
+    
+    def choice(self, field, choices, default, label):
+        """Valida a coluna contra os valores permitidos."""
+        raw = self.column(field)
+        values = raw.astype(str).str.strip().where(raw.notna(), default).rename(field)
+        invalid = ~values.isin(choices)
+        
+        self.fail(invalid, f'{label} inválido: ' + values, field)
+        return values
+    
+    def email(self, field, label='Email'):
+        """Valida o formato dos emails preenchidos."""
+        values = self.text(field)
+        invalid = values.ne('') & ~values.str.fullmatch(EMAIL_PATTERN)
+        
+        self.fail(invalid, f'{label} inválido: ' + values, field)
+        return values
+
+
+def decimal_max(model_field):
+    """Maior valor que cabe no DecimalField (99999999.99 com max_digits=10 e decimal_places=2)."""
+    places = model_field.decimal_places
+    return float(Decimal(10) ** (model_field.max_digits - places) - Decimal(10) ** -places)
+
+
+def _range_text(min_value, max_value):
+    """Descreve a faixa permitida nas mensagens de erro."""
+    if min_value is None:
+        return f'até {max_value}'
+    if max_value is None:
+        return f'a partir de {min_value}'
+    return f'de {min_value} a {max_value}'
+
+
+def format_error(error):
+    """Formata o erro de uma linha como "Linha N: mensagem"."""
+    return f"Linha {error['row']}: {error['message']}"
@@ -2,27 +2,56 @@
 Views core para funcionalidades básicas do LogFlow.
 """
 
-import pandas as pd
-import io
+import json
 from datetime import datetime
-from rest_framework import status, permissions
-from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework import status, permissions, generics
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FileUploadParser
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from apps.inventory.models import Product, Category, StockMovement
-from apps.orders.models import Order, OrderItem, Client
+from apps.inventory.ledger import apply_movements
+from apps.inventory.models import Product, StockAlert, StockMovement
+from apps.inventory.snapshots import stock_at
+from apps.orders.models import Order, Client
 from apps.users.models import User
 
+from .columnar import load_cache_meta
+from .error_reports import iter_error_csv
+from .importers import IMPORTERS
+from .models import ImportJob, SheetUpload
+from .parser_pool import parse_preview
+from .readers import DEFAULT_PREVIEW_ROWS, SUPPORTED_EXTENSIONS, file_extension, hash_file
+from .serializers import ImportJobSerializer, SheetUploadSerializer
+from .tasks import build_upload_cache, plan_import, process_import_job
+
+
+# Limite de linhas de amostra retornadas no upload
+MAX_PREVIEW_ROWS = 100
+
+# Diretório das planilhas, armazenadas pelo hash do conteúdo
+UPLOAD_DIR = 'excel_uploads/files'
+
+# Paginação do relatório de erros
+ERRORS_PAGE_SIZE = 10000
+MAX_ERRORS_PAGE_SIZE = 100000
+
+# Paginação dos alertas de estoque
+ALERTS_PAGE_SIZE = 100
+MAX_ALERTS_PAGE_SIZE = 1000
+
 
 class ExcelUploadView(APIView):
-    """View para upload de planilhas Excel."""
+    """View para upload de planilhas Excel, CSV/TSV e Parquet."""
     
     parser_classes = [MultiPartParser, FileUploadParser]
     
@@ -31,7 +60,7 @@ class ExcelUploadView(APIView):
             openapi.Parameter(
                 'file',
                 openapi.IN_FORM,
-                description="Arquivo Excel (.xlsx, .xls)",
+                description="Planilha (.xlsx, .xls, .csv, .tsv, .parquet)",
                 type=openapi.TYPE_FILE,
                 required=True
             ),
@@ -41,6 +70,13 @@ class ExcelUploadView(APIView):
                 description="Tipo de dados (inventory, orders, clients)",
                 type=openapi.TYPE_STRING,
                 required=True
+            ),
+            openapi.Parameter(
+                'preview_rows',
+                openapi.IN_FORM,
+                description="Linhas de amostra retornadas (padrão 10, máximo 100)",
+                type=openapi.TYPE_INTEGER,
+                required=False
             )
         ],
         responses={
@@ -50,9 +86,14 @@ class ExcelUploadView(APIView):
                     type=openapi.TYPE_OBJECT,
                     properties={
                         'message': openapi.Schema(type=openapi.TYPE_STRING),
+                        'duplicate': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                        'warnings': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
                         'file_path': openapi.Schema(type=openapi.TYPE_STRING),
+                        'file_hash': openapi.Schema(type=openapi.TYPE_STRING),
                         'rows_count': openapi.Schema(type=openapi.TYPE_INTEGER),
-                        'columns': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING))
+                        'rows_count_exact': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                        'columns': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                        'sample_rows': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
                     }
                 )
             ),
@@ -60,7 +101,7 @@ class ExcelUploadView(APIView):
         }
     )
     def post(self, request):
-        """Upload de arquivo Excel."""
+        """Upload de planilha."""
         
         if 'file' not in request.FILES:
             return Response(
@@ -72,34 +113,144 @@ class ExcelUploadView(APIView):
         data_type = request.data.get('type', 'inventory')
         
         # Validação do arquivo
-        if not file.name.endswith(('.xlsx', '.xls')):
+        if file_extension(file.name) not in SUPPORTED_EXTENSIONS:
             return Response(
-                {'error': 'Formato de arquivo não suportado. Use .xlsx ou .xls'},
+                {'error': 'Formato de arquivo não suportado. Use .xlsx, .xls, .csv, .tsv ou .parquet'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         try:
-            # Lê o arquivo Excel
-            df = pd.read_excel(file)
+            preview_rows = min(int(request.data.get('preview_rows', DEFAULT_PREVIEW_ROWS)), MAX_PREVIEW_ROWS)
+        except (TypeError, ValueError):
+            preview_rows = DEFAULT_PREVIEW_ROWS
+        
+        try:
+            # O hash é calculado lendo o upload em partes, antes de gravá-lo,
+            # para que conteúdos repetidos não sejam armazenados de novo
+            file_hash = hash_file(file)
+            upload = SheetUpload.objects.filter(file_hash=file_hash, created_by=request.user).first()
             
-            # Salva o arquivo
-            file_path = f'excel_uploads/{data_type}/{datetime.now().strftime("%Y%m%d_%H%M%S")}_{file.name}'
-            saved_path = default_storage.save(file_path, ContentFile(file.read()))
+            if upload is not None:
+                SheetUpload.objects.filter(pk=upload.pk).update(
+                    upload_count=F('upload_count') + 1, last_uploaded_at=timezone.now()
+                )
+                upload.refresh_from_db()
+                return self._upload_response(
+                    upload, data_type, preview_rows,
+                    message='Arquivo já enviado anteriormente',
+                    duplicate=True
+                )
             
-            # Retorna informações sobre o arquivo
-            return Response({
-                'message': 'Arquivo enviado com sucesso',
-                'file_path': saved_path,
-                'rows_count': len(df),
-                'columns': df.columns.tolist(),
-                'data_type': data_type
-            })
+            # O mesmo conteúdo enviado por outro usuário: reaproveita o arquivo
+            # armazenado e a leitura, sem expor o registro dele
+            shared = SheetUpload.objects.filter(file_hash=file_hash).first()
+            if shared is not None and default_storage.exists(shared.file_path):
+                saved_path = shared.file_path
+                stored = False
+                preview = {
+                    'columns': shared.columns,
+                    'sample_rows': shared.sample_rows,
+                    'rows_count': shared.rows_count
+                }
+            else:
+                # Armazena o arquivo pelo hash do conteúdo
+                saved_path = default_storage.save(f'{UPLOAD_DIR}/{file_hash}{file_extension(file.name)}', file)
+                stored = True
+                
+                try:
+                    # Lê só o cabeçalho e a amostra, num processo auxiliar com
+                    # limites de memória e tempo; o total vem dos metadados do arquivo
+                    with default_storage.open(saved_path, 'rb') as saved_file:
+                        preview = parse_preview(saved_file, saved_path, MAX_PREVIEW_ROWS)
+                except Exception:
+                    default_storage.delete(saved_path)
+                    raise
+                preview['sample_rows'] = json.loads(
+                    preview['sample'].to_json(orient='records', date_format='iso')
+                )
+            
+            # Reaproveita o total exato se o conteúdo já foi convertido antes
+            meta = load_cache_meta(file_hash)
+            upload, created = SheetUpload.objects.get_or_create(
+                file_hash=file_hash,
+                created_by=request.user,
+                defaults={
+                    'file_path': saved_path,
+                    'original_name': file.name,
+                    'data_type': data_type,
+                    'size': file.size,
+                    'columns': preview['columns'],
+                    'sample_rows': preview['sample_rows'],
+                    'rows_count': meta['rows_count'] if meta else preview['rows_count'],
+                    'rows_count_exact': meta is not None
+                }
+            )
+            
+            if not created:
+                # Outro envio do mesmo conteúdo pelo usuário terminou primeiro
+                if stored:
+                    default_storage.delete(saved_path)
+            elif meta is None and stored:
+                # A cópia colunar (e o total exato de linhas) é gerada em segundo plano
+                transaction.on_commit(lambda: build_upload_cache.delay(saved_path, file_hash))
             
+            return self._upload_response(
+                upload, data_type, preview_rows,
+                message='Arquivo enviado com sucesso',
+                duplicate=not created
+            )
+        
         except Exception as e:
             return Response(
                 {'error': f'Erro ao processar arquivo: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+    
+    def _upload_response(self, upload, data_type, preview_rows, message, duplicate):
+        """Monta a resposta do upload a partir do registro armazenado."""
+        
+        warnings = []
+        last_import = upload.last_import
+        if last_import is not None:
+            warnings.append(
+                f'Este conteúdo já foi importado em '
+                f'{timezone.localtime(last_import.finished_at):%d/%m/%Y %H:%M} '
+                f'(importação #{last_import.pk})'
+            )
+        
+        data = SheetUploadSerializer(upload).data
+        data['sample_rows'] = data['sample_rows'][:preview_rows]
+        
+        return Response({
+            'message': message,
+            'duplicate': duplicate,
+            'warnings': warnings,
+            **data,
+            'data_type': data_type
+        })
+
+
+class UploadInfoView(generics.RetrieveAPIView):
+    """View para consultar um upload e o total exato de linhas."""
+    
+    serializer_class = SheetUploadSerializer
+    lookup_field = 'file_hash'
+    
+    def get_queryset(self):
+        # Cada usuário vê apenas os próprios uploads; administradores veem todos
+        if self.request.user.is_staff:
+            return SheetUpload.objects.all()
+        return SheetUpload.objects.filter(created_by=self.request.user)
+    
+    def get_object(self):
+        # O mesmo conteúdo pode ter um registro por usuário; o próprio vem
+        # primeiro e, para administradores, depois o envio mais recente
+        queryset = self.filter_queryset(self.get_queryset()).filter(file_hash=self.kwargs['file_hash'])
+        upload = queryset.filter(created_by=self.request.user).first() or queryset.first()
+        if upload is None:
+            raise Http404
+        self.check_object_permissions(self.request, upload)
+        return upload
 
 
 class ExcelProcessView(APIView):
@@ -117,25 +268,22 @@ class ExcelProcessView(APIView):
                 ),
                 'options': openapi.Schema(
                     type=openapi.TYPE_OBJECT,
-                    description="Opções de processamento"
+                    description="Opções de processamento (chunk_size, async, copy, delta, group_by, dry_run, error_workbook, partitions)"
                 )
             },
             required=['file_path', 'data_type']
         ),
         responses={
             200: openapi.Response(
-                description="Processamento realizado com sucesso",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        'message': openapi.Schema(type=openapi.TYPE_STRING),
-                        'processed_rows': openapi.Schema(type=openapi.TYPE_INTEGER),
-                        'errors': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
-                        'warnings': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING))
-                    }
-                )
+                description="Processamento realizado com sucesso (options.async = false) ou simulação (options.dry_run = true)",
+                schema=ImportJobSerializer()
             ),
-            400: "Erro no processamento"
+            202: openapi.Response(
+                description="Importação agendada em segundo plano",
+                schema=ImportJobSerializer()
+            ),
+            400: "Erro no processamento",
+            409: "Simulação indisponível enquanto o arquivo é preparado"
         }
     )
     def post(self, request):
@@ -152,195 +300,466 @@ class ExcelProcessView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            # Lê o arquivo salvo
-            file_content = default_storage.open(file_path, 'rb')
-            df = pd.read_excel(file_content)
-            
-            # Processa baseado no tipo de dados
-            if data_type == 'inventory':
-                result = self._process_inventory_data(df, column_mapping, options, request.user)
-            elif data_type == 'orders':
-                result = self._process_orders_data(df, column_mapping, options, request.user)
-            elif data_type == 'clients':
-                result = self._process_clients_data(df, column_mapping, options, request.user)
-            else:
+        if data_type not in IMPORTERS:
+            return Response(
+                {'error': 'Tipo de dados não suportado'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not default_storage.exists(file_path):
+            return Response(
+                {'error': 'Arquivo não encontrado'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if options.get('copy') and (data_type != 'inventory' or connection.vendor != 'postgresql'):
+            return Response(
+                {'error': 'A opção copy está disponível apenas para inventário com PostgreSQL'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if options.get('delta') and (data_type != 'inventory' or options.get('copy')):
+            return Response(
+                {'error': 'A opção delta está disponível apenas para inventário, sem a opção copy'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        partitions = options.get('partitions')
+        if partitions is not None and not options.get('dry_run'):
+            if not isinstance(partitions, int) or not 2 <= partitions <= settings.IMPORT_MAX_PARTITIONS:
                 return Response(
-                    {'error': 'Tipo de dados não suportado'},
+                    {'error': f'partitions deve ser um número entre 2 e {settings.IMPORT_MAX_PARTITIONS}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            return Response(result)
-            
-        except Exception as e:
+            if not options.get('async', True):
+                return Response(
+                    {'error': 'A opção partitions exige processamento assíncrono'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        if options.get('dry_run'):
+            # Simulação síncrona, sem criar a importação nem gravar dados
+            try:
+                upload = SheetUpload.objects.filter(file_path=file_path).first()
+                if upload is not None:
+                    file_hash = upload.file_hash
+                else:
+                    with default_storage.open(file_path, 'rb') as file_content:
+                        file_hash = hash_file(file_content)
+                
+                # A simulação lê a cópia colunar; a planilha não é convertida
+                # na requisição enquanto a cópia é gerada em segundo plano
+                if load_cache_meta(file_hash) is None:
+                    if upload is None:
+                        build_upload_cache.delay(file_path, file_hash)
+                    return Response(
+                        {
+                            'error': 'O arquivo ainda está sendo preparado; tente a simulação novamente em instantes',
+                            'file_hash': file_hash
+                        },
+                        status=status.HTTP_409_CONFLICT
+                    )
+                
+                report = plan_import(file_hash, data_type, column_mapping, options, request.user)
+            except Exception as e:
+                return Response(
+                    {'error': f'Erro ao simular importação: {str(e)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response({'dry_run': True, 'data_type': data_type, **report})
+        
+        job = ImportJob.objects.create(
+            file_path=file_path,
+            data_type=data_type,
+            column_mapping=column_mapping,
+            options=options,
+            created_by=request.user
+        )
+        
+        if not options.get('async', True):
+            # Processamento síncrono, na própria requisição
+            process_import_job(job.id)
+            job.refresh_from_db()
+            response_status = status.HTTP_400_BAD_REQUEST if job.status == 'failed' else status.HTTP_200_OK
             return Response(
-                {'error': f'Erro ao processar dados: {str(e)}'},
-                status=status.HTTP_400_BAD_REQUEST
+                ImportJobSerializer(job, context={'request': request}).data, status=response_status
             )
-    
-    def _process_inventory_data(self, df, column_mapping, options, user):
-        """Processa dados de inventário."""
         
-        processed_rows = 0
-        errors = []
-        warnings = []
+        transaction.on_commit(lambda: self._enqueue(job))
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
+    @staticmethod
+    def _enqueue(job):
+        """Envia a importação para a fila do Celery."""
         
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                try:
-                    # Mapeia as colunas
-                    code = row.get(column_mapping.get('code', 'code'), '')
-                    name = row.get(column_mapping.get('name', 'name'), '')
-                    category_name = row.get(column_mapping.get('category', 'category'), '')
-                    quantity = row.get(column_mapping.get('quantity', 'quantity'), 0)
-                    
-                    if not code or not name:
-                        errors.append(f"Linha {index + 1}: Código e nome são obrigatórios")
-                        continue
-                    
-                    # Cria ou obtém categoria
-                    category, created = Category.objects.get_or_create(
-                        name=category_name or 'Sem Categoria',
-                        defaults={'description': 'Categoria criada automaticamente'}
-                    )
-                    
-                    # Cria ou atualiza produto
-                    product, created = Product.objects.get_or_create(
-                        code=code,
-                        defaults={
-                            'name': name,
-                            'category': category,
-                            'current_stock': quantity,
-                            'minimum_stock': options.get('default_min_stock', 0),
-                            'created_by': user
-                        }
-                    )
-                    
-                    if not created:
-                        # Atualiza estoque se produto já existe
-                        if quantity > 0:
-                            StockMovement.objects.create(
-                                product=product,
-                                movement_type='in',
-                                quantity=quantity,
-                                reference=f'Importação Excel - Linha {index + 1}',
-                                notes='Importação automática via Excel',
-                                created_by=user
-                            )
-                    
-                    processed_rows += 1
-                    
-                except Exception as e:
-                    errors.append(f"Linha {index + 1}: {str(e)}")
-        
-        return {
-            'message': f'Processamento concluído. {processed_rows} produtos processados.',
-            'processed_rows': processed_rows,
-            'errors': errors,
-            'warnings': warnings
+        result = process_import_job.delay(job.id)
+        ImportJob.objects.filter(pk=job.pk).update(task_id=result.id)
+
+
+class ImportJobListView(generics.ListAPIView):
+    """View para listar as importações do usuário."""
+    
+    serializer_class = ImportJobSerializer
+    filterset_fields = ['status', 'data_type']
+    ordering_fields = ['created_at', 'finished_at']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        return ImportJob.objects.filter(created_by=self.request.user).prefetch_related('partitions')
+
+
+class ImportJobDetailView(generics.RetrieveAPIView):
+    """View para acompanhar o progresso de uma importação."""
+    
+    serializer_class = ImportJobSerializer
+    
+    def get_queryset(self):
+        return ImportJob.objects.filter(created_by=self.request.user).prefetch_related('partitions')
+
+
+class ImportJobCancelView(APIView):
+    """View para cancelar uma importação em andamento."""
+    
+    @swagger_auto_schema(
+        responses={
+            200: ImportJobSerializer(),
+            400: "Importação já finalizada",
+            404: "Importação não encontrada"
         }
+    )
+    def post(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk, created_by=request.user)
+        
+        # O worker verifica o status antes de cada bloco e para no próximo
+        updated = ImportJob.objects.filter(
+            pk=job.pk, status__in=['pending', 'running']
+        ).update(status='cancelled')
+        
+        if not updated:
+            return Response(
+                {'error': 'Importação já finalizada'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        job.refresh_from_db()
+        if job.started_at is None:
+            job.finished_at = timezone.now()
+            job.message = 'Importação cancelada antes de iniciar.'
+            job.save(update_fields=['finished_at', 'message'])
+        
+        return Response(ImportJobSerializer(job).data)
+
+
+class ImportJobResumeView(APIView):
+    """View para retomar uma importação interrompida a partir do checkpoint."""
     
-    def _process_orders_data(self, df, column_mapping, options, user):
-        """Processa dados de ordens."""
+    @swagger_auto_schema(
+        responses={
+            202: ImportJobSerializer(),
+            400: "Importação não pode ser retomada",
+            404: "Importação não encontrada"
+        }
+    )
+    def post(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk, created_by=request.user)
         
-        processed_rows = 0
-        errors = []
-        warnings = []
+        if not (job.status == 'failed' or (job.status == 'running' and job.is_stale)):
+            return Response(
+                {'error': 'Apenas importações com falha ou interrompidas podem ser retomadas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                try:
-                    # Mapeia as colunas
-                    client_name = row.get(column_mapping.get('client', 'client'), '')
-                    order_type = row.get(column_mapping.get('order_type', 'order_type'), 'delivery')
-                    description = row.get(column_mapping.get('description', 'description'), '')
-                    requested_date = row.get(column_mapping.get('requested_date', 'requested_date'), datetime.now())
-                    
-                    if not client_name:
-                        errors.append(f"Linha {index + 1}: Nome do cliente é obrigatório")
-                        continue
-                    
-                    # Cria ou obtém cliente
-                    client, created = Client.objects.get_or_create(
-                        name=client_name,
-                        defaults={
-                            'email': f'{client_name.lower().replace(" ", ".")}@exemplo.com',
-                            'created_by': user
-                        }
-                    )
-                    
-                    # Cria ordem
-                    order = Order.objects.create(
-                        client=client,
-                        order_type=order_type,
-                        description=description,
-                        requested_date=requested_date,
-                        created_by=user
-                    )
-                    
-                    processed_rows += 1
-                    
-                except Exception as e:
-                    errors.append(f"Linha {index + 1}: {str(e)}")
-        
-        return {
-            'message': f'Processamento concluído. {processed_rows} ordens criadas.',
-            'processed_rows': processed_rows,
-            'errors': errors,
-            'warnings': warnings
+        job.status = 'pending'
+        job.message = None
+        job.finished_at = None
+        job.save(update_fields=['status', 'message', 'finished_at'])
+        
+        transaction.on_commit(lambda: ExcelProcessView._enqueue(job))
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobErrorsView(APIView):
+    """View para baixar o relatório de erros de uma importação (CSV)."""
+    
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                description="Página do relatório (a partir de 1); sem ela o relatório vem completo"
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                description=f"Erros por página (padrão {ERRORS_PAGE_SIZE}, máximo {MAX_ERRORS_PAGE_SIZE})"
+            ),
+        ],
+        responses={
+            200: "CSV com as colunas row, column, code e message",
+            400: "Paginação inválida",
+            404: "Importação não encontrada"
         }
+    )
+    def get(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk, created_by=request.user)
+        
+        offset, limit = 0, None
+        filename = f'importacao-{job.pk}-erros.csv'
+        if 'page' in request.query_params:
+            try:
+                page = int(request.query_params['page'])
+                page_size = int(request.query_params.get('page_size', ERRORS_PAGE_SIZE))
+            except ValueError:
+                page = page_size = 0
+            
+            if page < 1 or not 1 <= page_size <= MAX_ERRORS_PAGE_SIZE:
+                return Response(
+                    {'error': f'page deve ser maior que zero e page_size entre 1 e {MAX_ERRORS_PAGE_SIZE}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            offset, limit = (page - 1) * page_size, page_size
+            filename = f'importacao-{job.pk}-erros-{page}.csv'
+        
+        # Importações paralelas em andamento: lê os blocos das partições
+        partitions = None
+        if job.options.get('partitions') and job.finished_at is None:
+            partitions = dict(job.partitions.values_list('number', 'rows_done'))
+        
+        # Apenas os blocos já gravados (até o checkpoint) entram no relatório
+        response = StreamingHttpResponse(
+            iter_error_csv(
+                job.pk, end_row=job.errors_end_row, offset=offset, limit=limit, partitions=partitions
+            ),
+            content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Total-Count'] = job.error_count
+        return response
+
+
+class ImportJobErrorWorkbookView(APIView):
+    """View para baixar a planilha com as linhas rejeitadas de uma importação."""
     
-    def _process_clients_data(self, df, column_mapping, options, user):
-        """Processa dados de clientes."""
+    @swagger_auto_schema(
+        responses={
+            200: "Planilha .xlsx com as linhas rejeitadas, a linha original e o erro",
+            404: "Importação não encontrada ou planilha ainda não gerada"
+        }
+    )
+    def get(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk, created_by=request.user)
         
-        processed_rows = 0
-        errors = []
-        warnings = []
+        if not job.error_workbook_path:
+            return Response(
+                {'error': 'Planilha de erros não disponível'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                try:
-                    # Mapeia as colunas
-                    name = row.get(column_mapping.get('name', 'name'), '')
-                    email = row.get(column_mapping.get('email', 'email'), '')
-                    phone = row.get(column_mapping.get('phone', 'phone'), '')
-                    address = row.get(column_mapping.get('address', 'address'), '')
-                    
-                    if not name:
-                        errors.append(f"Linha {index + 1}: Nome é obrigatório")
-                        continue
-                    
-                    # Cria cliente
-                    client, created = Client.objects.get_or_create(
-                        name=name,
-                        defaults={
-                            'email': email or f'{name.lower().replace(" ", ".")}@exemplo.com',
-                            'phone': phone,
-                            'address': address
+        return FileResponse(
+            default_storage.open(job.error_workbook_path, 'rb'),
+            as_attachment=True,
+            filename=f'importacao-{job.pk}-rejeitadas.xlsx'
+        )
+
+
+class StockMovementBatchView(APIView):
+    """View para registrar um lote de movimentações de estoque."""
+    
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'movements': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'product': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'code': openapi.Schema(type=openapi.TYPE_STRING),
+                            'movement_type': openapi.Schema(type=openapi.TYPE_STRING),
+                            'quantity': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'reference': openapi.Schema(type=openapi.TYPE_STRING),
+                            'notes': openapi.Schema(type=openapi.TYPE_STRING)
                         }
                     )
-                    
-                    if not created:
-                        # Atualiza dados se cliente já existe
-                        if email:
-                            client.email = email
-                        if phone:
-                            client.phone = phone
-                        if address:
-                            client.address = address
-                        client.save()
-                    
-                    processed_rows += 1
-                    
-                except Exception as e:
-                    errors.append(f"Linha {index + 1}: {str(e)}")
-        
-        return {
-            'message': f'Processamento concluído. {processed_rows} clientes processados.',
-            'processed_rows': processed_rows,
-            'errors': errors,
-            'warnings': warnings
+                )
+            },
+            required=['movements']
+        ),
+        responses={
+            200: "Resultado de cada movimentação do lote",
+            400: "Lote inválido"
         }
+    )
+    def post(self, request):
+        """Aplica as movimentações numa única transação."""
+        
+        movements = request.data.get('movements')
+        if not isinstance(movements, list) or not movements:
+            return Response(
+                {'error': 'movements deve ser uma lista não vazia'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(movements) > settings.STOCK_MOVEMENT_BATCH_MAX_ITEMS:
+            return Response(
+                {'error': f'O lote aceita no máximo {settings.STOCK_MOVEMENT_BATCH_MAX_ITEMS} movimentações'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = apply_movements(movements, request.user)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({
+            'created': created,
+            'rejected': len(results) - created,
+            'results': results
+        })
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('date', openapi.IN_QUERY, description="Data (AAAA-MM-DD)", type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('products', openapi.IN_QUERY, description="Ids dos produtos, separados por vírgula", type=openapi.TYPE_STRING),
+        openapi.Parameter('codes', openapi.IN_QUERY, description="Códigos dos produtos, separados por vírgula", type=openapi.TYPE_STRING),
+        openapi.Parameter('category', openapi.IN_QUERY, description="Id da categoria", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: "Estoque de cada produto ao fim do dia", 400: "Parâmetros inválidos"}
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def stock_at_date(request):
+    """Endpoint para o estoque de produtos ao fim de uma data."""
+    
+    try:
+        day = datetime.strptime(request.query_params.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return Response(
+            {'error': 'date é obrigatório, no formato AAAA-MM-DD'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    products = Product.objects.all()
+    filtered = False
+    try:
+        if request.query_params.get('products'):
+            products = products.filter(pk__in=[int(pk) for pk in request.query_params['products'].split(',')])
+            filtered = True
+        if request.query_params.get('category'):
+            products = products.filter(category_id=int(request.query_params['category']))
+            filtered = True
+    except ValueError:
+        return Response(
+            {'error': 'products e category devem ser ids numéricos'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if request.query_params.get('codes'):
+        products = products.filter(code__in=request.query_params['codes'].split(','))
+        filtered = True
+    
+    if not filtered:
+        return Response(
+            {'error': 'Informe products, codes ou category'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        stock = stock_at(products, day)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    results = [
+        {'id': pk, 'code': code, 'name': name, 'stock': stock[pk]}
+        for pk, code, name in products.order_by('code').values_list('pk', 'code', 'name')
+        if pk in stock
+    ]
+    return Response({
+        'date': day.isoformat(),
+        'total': sum(result['stock'] for result in results),
+        'products': results
+    })
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('after', openapi.IN_QUERY, description="Código do último produto recebido", type=openapi.TYPE_STRING),
+        openapi.Parameter('limit', openapi.IN_QUERY, description=f"Produtos por página (máximo {MAX_ALERTS_PAGE_SIZE})", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: "Produtos com estoque baixo", 400: "Parâmetros inválidos"}
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def low_stock_alert(request):
+    """Endpoint para os produtos com estoque no mínimo ou abaixo dele, em ordem de código."""
+    
+    after = request.query_params.get('after', '')
+    try:
+        limit = int(request.query_params.get('limit', ALERTS_PAGE_SIZE))
+    except ValueError:
+        return Response(
+            {'error': 'limit deve ser um número inteiro'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not 1 <= limit <= MAX_ALERTS_PAGE_SIZE:
+        return Response(
+            {'error': f'limit deve estar entre 1 e {MAX_ALERTS_PAGE_SIZE}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # O filtro corresponde ao índice parcial product_low_stock_idx
+    low_stock = Product.objects.filter(current_stock__lte=F('minimum_stock'))
+    products = list(
+        low_stock.filter(code__gt=after).order_by('code').values(
+            'id', 'code', 'name', 'current_stock', 'minimum_stock'
+        )[:limit]
+    )
+    
+    return Response({
+        'count': low_stock.count(),
+        'products': products,
+        'next': products[-1]['code'] if len(products) == limit else None
+    })
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('after', openapi.IN_QUERY, description="Id do último alerta recebido", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('limit', openapi.IN_QUERY, description=f"Alertas por página (máximo {MAX_ALERTS_PAGE_SIZE})", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: "Alertas de cruzamento do estoque mínimo", 400: "Parâmetros inválidos"}
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def stock_alert_events(request):
+    """Endpoint para os cruzamentos do estoque mínimo, em ordem de registro."""
+    
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', ALERTS_PAGE_SIZE))
+    except ValueError:
+        return Response(
+            {'error': 'after e limit devem ser números inteiros'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not 1 <= limit <= MAX_ALERTS_PAGE_SIZE:
+        return Response(
+            {'error': f'limit deve estar entre 1 e {MAX_ALERTS_PAGE_SIZE}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    events = list(
+        StockAlert.objects.filter(pk__gt=after).order_by('pk').values(
+            'id', 'product_id', 'kind', 'current_stock', 'minimum_stock', 'created_at',
+            product_code=F('product__code')
+        )[:limit]
+    )
+    
+    return Response({
+        'events': events,
+        'next': events[-1]['id'] if events else after
+    })
 
 
 @api_view(['GET'])
@@ -348,7 +767,7 @@ class ExcelProcessView(APIView):
 def system_stats(request):
     """Endpoint para estatísticas do sistema."""
     
-    from django.db.models import Count, Sum
+    from django.db.models import Sum
     from django.utils import timezone
     from datetime import timedelta
     
@@ -359,13 +778,13 @@ def system_stats(request):
     total_users = User.objects.count()
     
     # Estatísticas de estoque
+    # O filtro corresponde ao índice parcial product_low_stock_idx
     low_stock_products = Product.objects.filter(
-        current_stock__lte=models.F('minimum_stock')
+        current_stock__lte=F('minimum_stock')
     ).count()
     
-    total_stock_value = Product.objects.aggregate(
-        total=Sum(models.F('current_stock') * models.F('unit_price'))
-    )['total'] or 0
+    # Produtos não têm preço: o total é em unidades
+    total_stock = Product.objects.aggregate(total=Sum('current_stock'))['total'] or 0
     
     # Estatísticas de ordens
     pending_orders = Order.objects.filter(status='pending').count()
@@ -386,7 +805,7 @@ def system_stats(request):
         },
         'inventory': {
             'low_stock_products': low_stock_products,
-            'total_stock_value': float(total_stock_value),
+            'total_stock': total_stock,
         },
         'orders': {
             'pending': pending_orders,
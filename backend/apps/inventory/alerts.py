@@ -0,0 +1,58 @@
+"""
+Alertas de estoque baixo.
+
+Um produto está em alerta quando o estoque atual não passa do mínimo. O
+conjunto de produtos em alerta é mantido pelo próprio banco num índice
+parcial (ver Product.Meta.indexes), então listá-lo custa proporcionalmente
+ao número de alertas, e não ao de produtos.
+
+Cada gravação que altera o estoque ou o mínimo (movimentações, lotes,
+importações e edições do produto) compara a situação anterior com a nova e
+registra um StockAlert por cruzamento do limite, na mesma transação. Depois
+do commit, o sinal stock_alerts_created é enviado com os alertas criados,
+para notificação.
+"""
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import StockAlert
+
+
+# Enviado após o commit, com os alertas criados (argumento `alerts`)
+stock_alerts_created = Signal()
+
+
+def is_low(current_stock, minimum_stock):
+    """Verifica se o estoque está no mínimo ou abaixo dele."""
+    return current_stock <= minimum_stock
+
+
+def record_crossings(changes):
+    """
+    Registra os cruzamentos do estoque mínimo.
+    
+    `changes` traz (id do produto, se estava em alerta, estoque atual,
+    estoque mínimo) de cada produto alterado; produtos novos entram como
+    fora de alerta. Retorna os alertas criados.
+    """
+    alerts = []
+    for product_id, was_low, current_stock, minimum_stock in changes:
+        low = is_low(current_stock, minimum_stock)
+        if low == was_low:
+            continue
+        alerts.append(StockAlert(
+            product_id=product_id,
+            kind='low' if low else 'restored',
+            current_stock=current_stock,
+            minimum_stock=minimum_stock
+        ))
+    
+    if not alerts:
+        return []
+    
+    StockAlert.objects.bulk_create(alerts)
+    transaction.on_commit(
+        lambda: stock_alerts_created.send(sender=StockAlert, alerts=alerts)
+    )
+    return alerts
@@ -0,0 +1,268 @@
+"""
+Aplicação das movimentações no estoque dos produtos.
+
+O saldo nunca é calculado a partir de uma instância de Product em memória,
+que pode estar desatualizada: entradas e saídas são aplicadas com um único
+UPDATE condicional (current_stock = current_stock + delta, desde que o
+resultado não fique negativo) que retorna o saldo gravado. O bloqueio da
+linha dura só até o fim da transação da movimentação, então movimentações
+simultâneas no mesmo produto são serializadas pelo banco, sem perda de
+atualizações. Ajustes, que substituem o saldo, bloqueiam o produto com
+select_for_update antes de gravar.
+
+Lotes de movimentações (ver apply_movements) bloqueiam todos os produtos
+envolvidos de uma vez, sempre na ordem do id, calculam os saldos em memória
+e gravam as movimentações e os saldos com operações em lote.
+"""
+
+from django.db import connection, transaction
+
+from .alerts import is_low, record_crossings
+from .models import Product, StockMovement
+
+
+# Sinal da quantidade no saldo, por tipo de movimentação (ajustes substituem o saldo)
+STOCK_DELTA_SIGNS = {
+    'in': 1,
+    'out': -1,
+    'transfer': 1,
+}
+
+# Registros por comando nas gravações em lote
+BATCH_SIZE = 1000
+
+
+class InsufficientStockError(Exception):
+    """Movimentação deixaria o estoque do produto negativo."""
+    
+    def __init__(self, product_id, available, requested):
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+        super().__init__(
+            f'Estoque insuficiente: disponível {available}, solicitado {requested}'
+        )
+
+
+def apply_movement(product_id, movement_type, quantity):
+    """
+    Aplica a movimentação no estoque do produto.
+    
+    Retorna (estoque anterior, estoque atual) conforme gravados no banco.
+    Levanta InsufficientStockError se o saldo ficaria negativo e
+    Product.DoesNotExist se o produto não existe. Deve ser chamada dentro
+    da transação que grava a movimentação. Cruzamentos do estoque mínimo
+    geram alertas (ver alerts).
+    """
+    if movement_type == 'adjustment':
+        previous, current, minimum = _set_stock(product_id, quantity)
+    else:
+        previous, current, minimum = _add_stock(product_id, STOCK_DELTA_SIGNS[movement_type] * quantity)
+    
+    record_crossings([(product_id, is_low(previous, minimum), current, minimum)])
+    return previous, current
+
+
+def apply_movements(items, user):
+    """
+    Aplica um lote de movimentações numa única transação.
+    
+    Cada item traz `product` (id) ou `code`, `movement_type`, `quantity` e,
+    opcionalmente, `reference` e `notes`. Os itens são aplicados na ordem
+    recebida, com o saldo corrente de cada produto calculado em memória.
+    Itens inválidos, de produtos inexistentes ou que deixariam o estoque
+    negativo são rejeitados individualmente, sem impedir os demais.
+    
+    Retorna um resultado por item, na ordem recebida.
+    """
+    results = [None] * len(items)
+    
+    accepted = []
+    for index, item in enumerate(items):
+        error = _check_item(item)
+        if error:
+            results[index] = _rejected(index, error)
+        else:
+            accepted.append(index)
+    
+    codes = {items[index]['code'] for index in accepted if items[index].get('product') is None}
+    ids_by_code = dict(Product.objects.filter(code__in=codes).values_list('code', 'pk')) if codes else {}
+    
+    product_ids = {}
+    for index in accepted:
+        item = items[index]
+        product_ids[index] = item['product'] if item.get('product') is not None else ids_by_code.get(item['code'])
+    
+    with transaction.atomic():
+        # Bloqueio sempre na ordem do id: lotes simultâneos não entram em deadlock
+        locked = Product.objects.select_for_update().filter(
+            pk__in={product_id for product_id in product_ids.values() if product_id is not None}
+        ).order_by('pk').values_list('pk', 'current_stock', 'minimum_stock')
+        minimums = {}
+        initial = {}
+        for product_id, current_stock, minimum_stock in locked:
+            initial[product_id] = current_stock
+            minimums[product_id] = minimum_stock
+        stock = dict(initial)
+        
+        movements = []
+        created = []
+        for index in accepted:
+            item = items[index]
+            product_id = product_ids[index]
+            if product_id not in stock:
+                results[index] = _rejected(index, 'Produto não encontrado')
+                continue
+            
+            previous = stock[product_id]
+            if item['movement_type'] == 'adjustment':
+                current = item['quantity']
+            else:
+                current = previous + STOCK_DELTA_SIGNS[item['movement_type']] * item['quantity']
+            if current < 0:
+                results[index] = _rejected(
+                    index, str(InsufficientStockError(product_id, previous, item['quantity']))
+                )
+                continue
+            
+            stock[product_id] = current
+            movements.append(StockMovement(
+                product_id=product_id,
+                movement_type=item['movement_type'],
+                quantity=item['quantity'],
+                previous_stock=previous,
+                current_stock=current,
+                reference=item.get('reference'),
+                notes=item.get('notes'),
+                created_by=user
+            ))
+            created.append(index)
+        
+        StockMovement.objects.bulk_create(movements, batch_size=BATCH_SIZE)
+        
+        # Um único novo saldo por produto movimentado
+        moved = {movement.product_id for movement in movements}
+        Product.objects.bulk_update(
+            [Product(pk=product_id, current_stock=stock[product_id]) for product_id in sorted(moved)],
+            ['current_stock'],
+            batch_size=BATCH_SIZE
+        )
+        record_crossings(
+            (product_id, is_low(initial[product_id], minimums[product_id]), stock[product_id], minimums[product_id])
+            for product_id in sorted(moved)
+        )
+    
+    for index, movement in zip(created, movements):
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'id': movement.pk,
+            'product': movement.product_id,
+            'previous_stock': movement.previous_stock,
+            'current_stock': movement.current_stock
+        }
+    return results
+
+
+def _check_item(item):
+    """Valida os campos de um item do lote, retornando a mensagem de erro."""
+    
+    if not isinstance(item, dict):
+        return 'Item inválido'
+    
+    product = item.get('product')
+    if product is None and not item.get('code'):
+        return 'Informe product ou code'
+    if product is not None and (not isinstance(product, int) or isinstance(product, bool)):
+        return 'product deve ser o id do produto'
+    if product is None and not isinstance(item['code'], str):
+        return 'code deve ser texto'
+    
+    if item.get('movement_type') not in dict(StockMovement.MOVEMENT_TYPES):
+        return 'Tipo de movimentação inválido'
+    
+    quantity = item.get('quantity')
+    if not isinstance(quantity, int) or isinstance(quantity, bool):
+        return 'quantity deve ser um número inteiro'
+    if quantity < 0 or (quantity == 0 and item['movement_type'] != 'adjustment'):
+        return 'quantity deve ser positiva'
+    
+    reference = item.get('reference')
+    if reference is not None and (not isinstance(reference, str) or len(reference) > 100):
+        return 'reference deve ser texto com até 100 caracteres'
+    notes = item.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        return 'notes deve ser texto'
+    return None
+
+
+def _rejected(index, error):
+    """Resultado de um item rejeitado."""
+    return {'index': index, 'status': 'error', 'error': error}
+
+
+def _add_stock(product_id, delta):
+    """Soma `delta` ao estoque com um UPDATE condicional. Retorna (anterior, atual, mínimo)."""
+    
+    if not _can_return_from_update():
+        return _add_stock_locked(product_id, delta)
+    
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {Product._meta.db_table} '
+            f'SET current_stock = current_stock + %s '
+            f'WHERE id = %s AND current_stock + %s >= 0 '
+            f'RETURNING current_stock, minimum_stock',
+            [delta, product_id, delta]
+        )
+        row = cursor.fetchone()
+    
+    if row is None:
+        _raise_rejected(product_id, delta)
+    return row[0] - delta, row[0], row[1]
+
+
+def _add_stock_locked(product_id, delta):
+    """Soma `delta` ao estoque bloqueando o produto (bancos sem UPDATE ... RETURNING)."""
+    
+    with transaction.atomic():
+        previous, minimum = Product.objects.select_for_update().values_list(
+            'current_stock', 'minimum_stock'
+        ).get(pk=product_id)
+        if previous + delta < 0:
+            raise InsufficientStockError(product_id, previous, -delta)
+        
+        Product.objects.filter(pk=product_id).update(current_stock=previous + delta)
+    return previous, previous + delta, minimum
+
+
+def _set_stock(product_id, quantity):
+    """Substitui o estoque pela quantidade contada."""
+    
+    if quantity < 0:
+        raise InsufficientStockError(product_id, 0, -quantity)
+    
+    with transaction.atomic():
+        previous, minimum = Product.objects.select_for_update().values_list(
+            'current_stock', 'minimum_stock'
+        ).get(pk=product_id)
+        Product.objects.filter(pk=product_id).update(current_stock=quantity)
+    return previous, quantity, minimum
+
+
+def _raise_rejected(product_id, delta):
+    """Explica por que o UPDATE condicional não alterou nenhuma linha."""
+    
+    available = Product.objects.filter(pk=product_id).values_list('current_stock', flat=True).first()
+    if available is None:
+        raise Product.DoesNotExist(f'Produto {product_id} não encontrado')
+    raise InsufficientStockError(product_id, available, -delta)
+
+
+def _can_return_from_update():
+    """Verifica se o banco aceita UPDATE ... RETURNING."""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
@@ -0,0 +1,23 @@
+"""
+Converte a tabela de movimentações de estoque em tabela particionada por mês.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory.partitions import partition_table
+
+
+class Command(BaseCommand):
+    help = 'Converte a tabela de movimentações de estoque em tabela particionada por mês (PostgreSQL)'
+    
+    def handle(self, *args, **options):
+        try:
+            converted = partition_table(settings.STOCK_MOVEMENT_PARTITIONS_AHEAD)
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if converted:
+            self.stdout.write(self.style.SUCCESS('Tabela de movimentações particionada por mês'))
+        else:
+            self.stdout.write('A tabela de movimentações já é particionada')
@@ -2,7 +2,9 @@
 Modelos para o controle de inventário do LogFlow.
 """
 
-from django.db import models
+import re
+
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
@@ -181,11 +183,37 @@ class Product(models.Model):
             models.Index(fields=['name']),
             models.Index(fields=['category']),
             models.Index(fields=['status']),
+            # Índice parcial: só os produtos abaixo do mínimo (alertas)
+            models.Index(
+                fields=['code'],
+                name='product_low_stock_idx',
+                condition=models.Q(current_stock__lte=models.F('minimum_stock'))
+            ),
         ]
     
     def __str__(self):
         return f"{self.code} - {self.name}"
     
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'current_stock', 'minimum_stock'} & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+        
+        from .alerts import is_low, record_crossings
+        
+        # Edições de estoque ou do mínimo podem cruzar o limite do alerta
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Product.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'current_stock', 'minimum_stock'
+                ).first()
+            super().save(*args, **kwargs)
+            record_crossings([
+                (self.pk, previous is not None and is_low(*previous), self.current_stock, self.minimum_stock)
+            ])
+    
     @property
     def stock_status(self):
         """Retorna o status do estoque."""
@@ -207,6 +235,15 @@ class Product(models.Model):
         if not self.maximum_stock or self.maximum_stock == 0:
             return 0
         return (self.current_stock / self.maximum_stock) * 100
+    
+    @property
+    def volume(self):
+        """Calcula o volume unitário em m³ a partir das dimensões (CxLxA, em cm)."""
+        values = re.findall(r'\d+(?:[.,]\d+)?', self.dimensions or '')
+        if len(values) != 3:
+            return 0
+        length, width, height = (float(value.replace(',', '.')) for value in values)
+        return length * width * height / 1000000
 
 
 class StockMovement(models.Model):
@@ -280,19 +317,140 @@ class StockMovement(models.Model):
         return f"{self.product.code} - {self.get_movement_type_display()} - {self.quantity}"
     
     def save(self, *args, **kwargs):
-        if not self.pk:  # Nova movimentação
-            self.previous_stock = self.product.current_stock
-            if self.movement_type == 'in':
-                self.current_stock = self.previous_stock + self.quantity
-            elif self.movement_type == 'out':
-                self.current_stock = self.previous_stock - self.quantity
-            elif self.movement_type == 'adjustment':
-                self.current_stock = self.quantity
-            elif self.movement_type == 'transfer':
-                self.current_stock = self.previous_stock + self.quantity
-            
-            # Atualiza o estoque do produto
-            self.product.current_stock = self.current_stock
-            self.product.save(update_fields=['current_stock'])
+        if self.pk:
+            super().save(*args, **kwargs)
+            return
+        
+        from .ledger import apply_movement
         
-        super().save(*args, **kwargs)
+        # Nova movimentação: o saldo é atualizado no banco (ver ledger), na
+        # mesma transação que grava a movimentação
+        with transaction.atomic():
+            self.previous_stock, self.current_stock = apply_movement(
+                self.product_id, self.movement_type, self.quantity
+            )
+            super().save(*args, **kwargs)
+        
+        self.product.current_stock = self.current_stock
+
+
+class StockSnapshot(models.Model):
+    """Saldo de abertura e de fechamento de um produto num dia com movimentações."""
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        verbose_name=_('Produto')
+    )
+    
+    date = models.DateField(
+        verbose_name=_('Data')
+    )
+    
+    opening_stock = models.IntegerField(
+        verbose_name=_('Estoque de Abertura')
+    )
+    
+    closing_stock = models.IntegerField(
+        verbose_name=_('Estoque de Fechamento')
+    )
+    
+    movements = models.IntegerField(
+        default=0,
+        verbose_name=_('Movimentações')
+    )
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Data de atualização')
+    )
+    
+    class Meta:
+        verbose_name = _('Saldo Diário')
+        verbose_name_plural = _('Saldos Diários')
+        ordering = ['product', '-date']
+        unique_together = ['product', 'date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.code} - {self.date} - {self.closing_stock}"
+
+
+class SnapshotConsolidation(models.Model):
+    """
+    Faixa de dias com os saldos diários consolidados (registro único).
+    
+    Todos os dias de history_start até consolidated_through foram
+    consolidados, sem lacunas; dias consolidados fora da faixa não são
+    considerados na consulta do estoque numa data.
+    """
+    
+    history_start = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name=_('Primeiro Dia Consolidado')
+    )
+    
+    consolidated_through = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name=_('Consolidado Até')
+    )
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Data de atualização')
+    )
+    
+    class Meta:
+        verbose_name = _('Consolidação dos Saldos')
+        verbose_name_plural = _('Consolidações dos Saldos')
+    
+    def __str__(self):
+        return f"{self.history_start} - {self.consolidated_through}"
+
+
+class StockAlert(models.Model):
+    """Cruzamento do estoque mínimo de um produto, para notificação."""
+    
+    KIND_CHOICES = [
+        ('low', _('Estoque baixo')),
+        ('restored', _('Estoque normalizado')),
+    ]
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='alerts',
+        verbose_name=_('Produto')
+    )
+    
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name=_('Tipo')
+    )
+    
+    current_stock = models.IntegerField(
+        verbose_name=_('Estoque Atual')
+    )
+    
+    minimum_stock = models.IntegerField(
+        verbose_name=_('Estoque Mínimo')
+    )
+    
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Data de criação')
+    )
+    
+    class Meta:
+        verbose_name = _('Alerta de Estoque')
+        verbose_name_plural = _('Alertas de Estoque')
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.product.code} - {self.get_kind_display()} - {self.current_stock}"
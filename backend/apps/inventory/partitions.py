@@ -0,0 +1,277 @@
+"""
+Particionamento mensal da tabela de movimentações (PostgreSQL).
+
+A tabela de movimentações é convertida, uma única vez, numa tabela
+particionada por faixa de created_at (ver partition_table). A tabela
+original vira a partição das movimentações até o fim do mês corrente e,
+dali em diante, cada mês tem a sua partição, criada com antecedência (ver
+ensure_partitions). Movimentações fora das partições mensais (datas além
+das partições já criadas, ou de meses já arquivados) vão para a partição
+DEFAULT, em vez de falhar, e passam para a partição do mês quando ela é
+criada. Consultas filtradas por created_at, como as contagens
+dos últimos 30 dias, leem só as partições do período, e os índices de cada
+partição param de crescer quando o mês termina.
+
+Partições mais antigas que o período de retenção são exportadas para um
+CSV compactado no storage e removidas (ver archive_partitions). Só são
+arquivados meses com os saldos diários já consolidados, para que a
+consulta do estoque numa data continue correta sem as movimentações.
+"""
+
+import datetime
+import gzip
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import StockMovement
+from .snapshots import consolidated_range, day_start
+
+
+# Diretório dos arquivos das partições arquivadas
+ARCHIVE_DIR = 'archive/stock_movements'
+
+# Sufixo da tabela original, mantida como primeira partição
+LEGACY_SUFFIX = '_legacy'
+
+# Sufixo da partição DEFAULT
+DEFAULT_SUFFIX = '_default'
+
+# Limite superior da faixa de uma partição (FOR VALUES FROM (...) TO ('...'))
+UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def is_partitioned():
+    """Verifica se a tabela de movimentações já é particionada."""
+    if connection.vendor != 'postgresql':
+        return False
+    
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+            [StockMovement._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partition_table(months_ahead):
+    """
+    Converte a tabela de movimentações em tabela particionada por mês.
+    
+    A tabela original é renomeada e anexada como partição das movimentações
+    até o início do próximo mês; a nova tabela herda colunas, chaves
+    estrangeiras e índices (com os mesmos nomes). O id passa a vir de uma
+    sequência comum, pois partições não podem ter colunas identity. A
+    tabela fica bloqueada durante a conversão, que deve rodar numa janela
+    de manutenção. A partição DEFAULT e as partições mensais são criadas em
+    seguida (ver ensure_partitions). Retorna False se a tabela já era
+    particionada.
+    """
+    if connection.vendor != 'postgresql':
+        raise ValueError('O particionamento das movimentações exige PostgreSQL')
+    if is_partitioned():
+        return False
+    
+    table = StockMovement._meta.db_table
+    legacy = f'{table}{LEGACY_SUFFIX}'
+    boundary = _month_start(_add_months(timezone.localdate(), 1))
+    
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id'), attidentity "
+            "FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table, table]
+        )
+        sequence, identity = cursor.fetchone()
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+        last_id = cursor.fetchone()[0]
+        
+        cursor.execute(
+            'SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint '
+            "WHERE conrelid = %s::regclass AND contype IN ('f', 'p')",
+            [table]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            'SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE i.indrelid = %s::regclass AND NOT i.indisunique',
+            [table]
+        )
+        indexes = cursor.fetchall()
+        
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        for name, kind, _ in constraints:
+            if kind == 'p':
+                # Libera o nome do índice da chave primária para a nova tabela
+                cursor.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {_legacy_name(name)}')
+        if identity:
+            # A sequência da coluna identity é removida junto com ela
+            cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY')
+            sequence = f'{table}_id_seq'
+            cursor.execute(f'CREATE SEQUENCE {sequence} START WITH {last_id + 1}')
+        else:
+            cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT')
+        
+        cursor.execute(
+            f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING STORAGE) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)')
+        
+        for name, kind, definition in constraints:
+            if kind == 'f':
+                cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+        
+        for name, definition in indexes:
+            # A tabela particionada fica com os nomes dos índices do modelo
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {_legacy_name(name)}')
+            columns = definition[definition.index(' USING '):]
+            cursor.execute(f'CREATE INDEX {name} ON {table}{columns}')
+        
+        # A restrição validada evita que a anexação percorra a tabela de novo
+        bound_constraint = _legacy_name(f'{table}_bound')
+        cursor.execute(
+            f"ALTER TABLE {legacy} ADD CONSTRAINT {bound_constraint} "
+            f"CHECK (created_at < '{boundary.isoformat()}') NOT VALID"
+        )
+        cursor.execute(f'ALTER TABLE {legacy} VALIDATE CONSTRAINT {bound_constraint}')
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+        )
+    
+    ensure_partitions(months_ahead)
+    return True
+
+
+def ensure_partitions(months_ahead):
+    """
+    Cria as partições do mês corrente e dos `months_ahead` meses seguintes.
+    
+    Cria também a partição DEFAULT, se ainda não existe. Cada partição
+    mensal é criada como tabela avulsa, recebe as movimentações do mês que
+    estavam na partição DEFAULT e só então é anexada, já que o PostgreSQL
+    recusa a anexação enquanto a DEFAULT tiver linhas da faixa. Retorna os
+    nomes das partições criadas.
+    """
+    table = StockMovement._meta.db_table
+    default = f'{table}{DEFAULT_SUFFIX}'
+    covered_until = max((upper for _, upper in list_partitions()), default=None)
+    
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {default} PARTITION OF {table} DEFAULT')
+    
+    created = []
+    today = timezone.localdate()
+    for offset in range(months_ahead + 1):
+        month = _add_months(today, offset)
+        start, end = _month_start(month), _month_start(_add_months(month, 1))
+        if covered_until is not None and start < covered_until:
+            continue
+        
+        name = f'{table}_p{month:%Y%m}'
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING STORAGE)')
+            cursor.execute(
+                f'WITH moved AS ('
+                f'DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *'
+                f') INSERT INTO {name} SELECT * FROM moved',
+                [start, end]
+            )
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        created.append(name)
+    return created
+
+
+def default_rows():
+    """Quantidade de movimentações na partição DEFAULT (fora das partições mensais)."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {StockMovement._meta.db_table}{DEFAULT_SUFFIX}')
+        return cursor.fetchone()[0]
+
+
+def archive_partitions(retention_months):
+    """
+    Arquiva as partições de meses anteriores ao período de retenção.
+    
+    Cada partição é exportada com COPY para um CSV compactado no storage
+    e, em seguida, desanexada e removida. A partição DEFAULT nunca é
+    arquivada. Partições com dias depois da
+    faixa consolidada sem lacunas (ver snapshots.consolidate) são mantidas; depois de arquivados, os saldos
+    desses meses não devem ser consolidados de novo. Retorna os caminhos
+    dos arquivos gravados.
+    """
+    cutoff = _month_start(_add_months(timezone.localdate(), -retention_months))
+    built_through = consolidated_range()[1]
+    if built_through is None:
+        return []
+    cutoff = min(cutoff, day_start(built_through + datetime.timedelta(days=1)))
+    
+    table = StockMovement._meta.db_table
+    archived = []
+    for name, upper in sorted(list_partitions(), key=lambda partition: partition[1]):
+        if upper > cutoff:
+            break
+        
+        path = f'{ARCHIVE_DIR}/{name}.csv.gz'
+        with tempfile.TemporaryFile() as output:
+            with gzip.GzipFile(fileobj=output, mode='wb') as compressed:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', compressed)
+            output.seek(0)
+            default_storage.delete(path)
+            path = default_storage.save(path, File(output))
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+            cursor.execute(f'DROP TABLE {name}')
+        archived.append(path)
+    return archived
+
+
+def list_partitions():
+    """Retorna (nome, limite superior) de cada partição mensal (e da original) das movimentações."""
+    
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass',
+            [StockMovement._meta.db_table]
+        )
+        rows = cursor.fetchall()
+    
+    partitions = []
+    for name, bound in rows:
+        match = UPPER_BOUND_RE.search(bound)
+        if match:
+            partitions.append((name, datetime.datetime.fromisoformat(match.group(1))))
+    return partitions
+
+
+def _month_start(day):
+    """Início do primeiro dia do mês, no fuso horário do projeto."""
+    return day_start(day.replace(day=1))
+
+
+def _add_months(day, months):
+    """Primeiro dia do mês `months` meses depois do mês de `day`."""
+    month = day.month - 1 + months
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _legacy_name(name):
+    """Nome de um objeto da tabela original, respeitando o limite de 63 caracteres."""
+    return f'{name[:63 - len(LEGACY_SUFFIX)]}{LEGACY_SUFFIX}'
@@ -0,0 +1,191 @@
+"""
+Saldos diários de estoque e consulta do estoque numa data.
+
+Para cada dia com movimentações, um produto recebe um registro com o saldo
+de abertura e o de fechamento do dia. Os saldos são calculados a partir do
+estoque atual, descontando a soma das movimentações posteriores (a
+diferença entre current_stock e previous_stock de cada uma), então também
+refletem estoques iniciais gravados sem movimentação. A consolidação roda
+toda madrugada, do dia seguinte ao último consolidado até o dia anterior
+(ver tasks.build_stock_snapshots), e pode ser repetida para qualquer dia.
+
+A faixa de dias consolidados sem lacunas fica em SnapshotConsolidation
+(ver consolidate). Como todo dia da faixa com movimentações de um produto
+tem um registro, o estoque numa data consolidada é o fechamento do último
+registro até a data (ou a abertura do primeiro registro seguinte). Apenas
+as movimentações posteriores à faixa são somadas, e o custo da consulta não
+cresce com o histórico. Datas anteriores ao primeiro dia consolidado não
+são consultadas (ver history_start): as movimentações desses dias podem
+não ter saldo diário ou já ter sido arquivadas.
+"""
+
+import datetime
+import itertools
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import SnapshotConsolidation, StockMovement, StockSnapshot
+
+
+# Registros por comando na gravação dos saldos
+BATCH_SIZE = 1000
+
+# Efeito de uma movimentação no saldo (ajustes inclusive)
+MOVEMENT_DELTA = F('current_stock') - F('previous_stock')
+
+
+def build_snapshots(day):
+    """
+    Consolida os saldos dos produtos movimentados no dia.
+    
+    Produtos, movimentações do dia e posteriores são lidos num único
+    comando, para que o cálculo veja um estado consistente mesmo com
+    movimentações simultâneas. Retorna a quantidade de saldos gravados.
+    """
+    start, end = day_start(day), day_start(day + datetime.timedelta(days=1))
+    
+    rows = StockMovement.objects.filter(created_at__gte=start).order_by().values(
+        'product_id', 'product__current_stock'
+    ).annotate(
+        count=Count('pk', filter=Q(created_at__lt=end)),
+        day_delta=Coalesce(Sum(MOVEMENT_DELTA, filter=Q(created_at__lt=end)), 0),
+        after_delta=Coalesce(Sum(MOVEMENT_DELTA, filter=Q(created_at__gte=end)), 0)
+    ).filter(count__gt=0)
+    
+    total = 0
+    rows = rows.iterator(chunk_size=BATCH_SIZE)
+    while True:
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+        if not batch:
+            return total
+        
+        snapshots = []
+        for row in batch:
+            closing = row['product__current_stock'] - row['after_delta']
+            snapshots.append(StockSnapshot(
+                product_id=row['product_id'],
+                date=day,
+                opening_stock=closing - row['day_delta'],
+                closing_stock=closing,
+                movements=row['count']
+            ))
+        
+        StockSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=['product', 'date'],
+            update_fields=['opening_stock', 'closing_stock', 'movements', 'updated_at']
+        )
+        total += len(snapshots)
+
+
+def consolidate(start, end):
+    """
+    Consolida os saldos de `start` até `end`, dia a dia, e atualiza a faixa consolidada.
+    
+    A faixa só é estendida por dias contíguos a ela: consolidar um dia
+    isolado depois de uma lacuna grava os saldos, mas a faixa continua
+    terminando antes da lacuna até que ela seja consolidada. Retorna a
+    quantidade de saldos gravados.
+    """
+    total = 0
+    day = start
+    while day <= end:
+        total += build_snapshots(day)
+        day += datetime.timedelta(days=1)
+    if start > end:
+        return total
+    
+    one_day = datetime.timedelta(days=1)
+    with transaction.atomic():
+        SnapshotConsolidation.objects.get_or_create(pk=1)
+        state = SnapshotConsolidation.objects.select_for_update().get(pk=1)
+        if state.consolidated_through is None:
+            state.history_start, state.consolidated_through = start, end
+        else:
+            if start <= state.consolidated_through + one_day and end > state.consolidated_through:
+                state.consolidated_through = end
+            if start < state.history_start and end >= state.history_start - one_day:
+                state.history_start = start
+        state.save()
+    return total
+
+
+def consolidated_range():
+    """Retorna (primeiro dia, último dia) da faixa consolidada, ou (None, None)."""
+    state = SnapshotConsolidation.objects.filter(pk=1).first()
+    if state is None:
+        return None, None
+    return state.history_start, state.consolidated_through
+
+
+def history_start():
+    """Primeiro dia com saldos consolidados, ou None se ainda não há nenhum."""
+    return consolidated_range()[0]
+
+
+def stock_at(products, day):
+    """
+    Retorna o estoque de cada produto ao fim do dia: {id do produto: estoque}.
+    
+    `products` é um queryset de Product. Tudo é calculado num único comando:
+    o saldo do último dia da faixa consolidada até a data vem dos registros
+    diários (uma busca no índice por produto) e só as movimentações dos
+    dias seguintes são somadas. Produtos criados depois da data têm estoque
+    zero. Levanta ValueError para datas anteriores a history_start.
+    """
+    start, built_through = consolidated_range()
+    if start is not None and day < start:
+        raise ValueError(f'Não há saldos consolidados antes de {start.isoformat()}')
+    
+    end = day_start(day + datetime.timedelta(days=1))
+    
+    movements = StockMovement.objects.filter(product=OuterRef('pk'))
+    annotations = {}
+    
+    if built_through is not None:
+        # Saldo no último dia consolidado até a data
+        base_day = min(day, built_through)
+        snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'))
+        annotations['previous_closing'] = Subquery(
+            snapshots.filter(date__lte=base_day).order_by('-date').values('closing_stock')[:1]
+        )
+        # Registros depois da faixa (após uma lacuna) não são considerados
+        annotations['next_opening'] = Subquery(
+            snapshots.filter(
+                date__gt=base_day, date__lte=built_through
+            ).order_by('date').values('opening_stock')[:1]
+        )
+        movements = movements.filter(created_at__gte=day_start(base_day + datetime.timedelta(days=1)))
+    
+    annotations['until_delta'] = _delta_sum(movements.filter(created_at__lt=end))
+    annotations['after_delta'] = _delta_sum(movements.filter(created_at__gte=end))
+    
+    stock = {}
+    for product in products.order_by().annotate(**annotations).values(
+        'pk', 'current_stock', 'created_at', *annotations
+    ):
+        if product['created_at'] >= end:
+            stock[product['pk']] = 0
+        elif product.get('previous_closing') is not None:
+            stock[product['pk']] = product['previous_closing'] + product['until_delta']
+        elif product.get('next_opening') is not None:
+            stock[product['pk']] = product['next_opening'] + product['until_delta']
+        else:
+            # Sem movimentações nos dias consolidados
+            stock[product['pk']] = product['current_stock'] - product['after_delta']
+    return stock
+
+
+def day_start(day):
+    """Início do dia no fuso horário do projeto."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _delta_sum(movements):
+    """Soma do efeito das movimentações de um produto, como subconsulta."""
+    total = movements.order_by().values('product').annotate(total=Sum(MOVEMENT_DELTA)).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
@@ -0,0 +1,51 @@
+"""
+Tarefas assíncronas da aplicação de inventário.
+"""
+
+import datetime
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .partitions import archive_partitions, default_rows, ensure_partitions, is_partitioned
+from .snapshots import consolidate, consolidated_range
+
+
+@shared_task
+def build_stock_snapshots(start=None, end=None):
+    """
+    Consolida os saldos diários de `start` até `end` (datas ISO).
+    
+    Sem argumentos (agendada toda madrugada no Celery Beat) consolida do
+    dia seguinte ao último consolidado até o dia anterior, recuperando os
+    dias de execuções perdidas; sem consolidação anterior, só o dia
+    anterior. Com apenas `start`, vai até o dia anterior.
+    """
+    yesterday = timezone.localdate() - datetime.timedelta(days=1)
+    if start:
+        start = datetime.date.fromisoformat(start)
+    else:
+        built_through = consolidated_range()[1]
+        start = built_through + datetime.timedelta(days=1) if built_through else yesterday
+    end = datetime.date.fromisoformat(end) if end else yesterday
+    return consolidate(start, end)
+
+
+@shared_task
+def maintain_stock_movement_partitions():
+    """
+    Cria as partições mensais futuras e arquiva as antigas.
+    
+    O resultado informa quantas movimentações ficaram na partição DEFAULT
+    (datas fora das partições mensais). Não faz nada se a tabela de movimentações não foi particionada (ver o
+    comando partition_stock_movements).
+    """
+    if not is_partitioned():
+        return None
+    
+    created = ensure_partitions(settings.STOCK_MOVEMENT_PARTITIONS_AHEAD)
+    archived = []
+    if settings.STOCK_MOVEMENT_RETENTION_MONTHS:
+        archived = archive_partitions(settings.STOCK_MOVEMENT_RETENTION_MONTHS)
+    return {'created': created, 'archived': archived, 'default_rows': default_rows()}
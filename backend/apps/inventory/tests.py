@@ -0,0 +1,353 @@
+"""
+Testes da aplicação das movimentações no estoque.
+"""
+
+import datetime
+import gzip
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.inventory import ledger
+from apps.inventory.alerts import stock_alerts_created
+from apps.inventory.ledger import InsufficientStockError, apply_movement, apply_movements
+from apps.inventory.models import (
+    Category, Product, SnapshotConsolidation, StockAlert, StockMovement, StockSnapshot
+)
+from apps.inventory.partitions import (
+    archive_partitions, default_rows, ensure_partitions, list_partitions, partition_table
+)
+from apps.inventory.snapshots import consolidated_range, day_start, stock_at
+from apps.inventory.tasks import build_stock_snapshots
+from apps.users.models import User
+
+
+class LedgerTestCase(TestCase):
+    """Produtos e usuário comuns aos testes do ledger."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='estoquista', password='senha')
+        category = Category.objects.create(name='Embalagens')
+        self.box = Product.objects.create(
+            code='P001', name='Caixa', category=category, current_stock=10, minimum_stock=5
+        )
+        self.tape = Product.objects.create(
+            code='P002', name='Fita', category=category, current_stock=3, minimum_stock=0
+        )
+    
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.current_stock
+
+
+class ApplyMovementTests(LedgerTestCase):
+    """Movimentações individuais."""
+    
+    def test_in_and_out_return_balances_written_to_the_database(self):
+        self.assertEqual(apply_movement(self.box.pk, 'in', 4), (10, 14))
+        self.assertEqual(apply_movement(self.box.pk, 'out', 14), (14, 0))
+        self.assertEqual(self.stock(self.box), 0)
+    
+    def test_out_beyond_stock_is_rejected_without_changing_it(self):
+        with self.assertRaises(InsufficientStockError) as raised:
+            apply_movement(self.box.pk, 'out', 11)
+        
+        self.assertEqual((raised.exception.available, raised.exception.requested), (10, 11))
+        self.assertEqual(self.stock(self.box), 10)
+    
+    def test_out_uses_the_stored_balance_not_a_stale_instance(self):
+        stale = Product.objects.get(pk=self.box.pk)
+        Product.objects.filter(pk=self.box.pk).update(current_stock=2)
+        
+        with self.assertRaises(InsufficientStockError):
+            apply_movement(stale.pk, 'out', 5)
+        self.assertEqual(self.stock(self.box), 2)
+    
+    def test_locked_path_rejects_negative_stock(self):
+        # Bancos sem UPDATE ... RETURNING
+        with mock.patch.object(ledger, '_can_return_from_update', return_value=False):
+            self.assertEqual(apply_movement(self.box.pk, 'out', 4), (10, 6))
+            with self.assertRaises(InsufficientStockError):
+                apply_movement(self.box.pk, 'out', 7)
+        self.assertEqual(self.stock(self.box), 6)
+    
+    def test_adjustment_replaces_stock_and_rejects_negative_counts(self):
+        self.assertEqual(apply_movement(self.box.pk, 'adjustment', 2), (10, 2))
+        with self.assertRaises(InsufficientStockError):
+            apply_movement(self.box.pk, 'adjustment', -1)
+        self.assertEqual(self.stock(self.box), 2)
+    
+    def test_unknown_product(self):
+        with self.assertRaises(Product.DoesNotExist):
+            apply_movement(0, 'in', 1)
+
+
+class ApplyMovementsTests(LedgerTestCase):
+    """Lotes de movimentações."""
+    
+    def test_items_are_applied_in_order_with_running_balances(self):
+        results = apply_movements([
+            {'product': self.box.pk, 'movement_type': 'out', 'quantity': 4},
+            {'code': 'P001', 'movement_type': 'in', 'quantity': 1},
+            {'code': 'P002', 'movement_type': 'adjustment', 'quantity': 8},
+        ], self.user)
+        
+        self.assertEqual(
+            [(result['status'], result['previous_stock'], result['current_stock']) for result in results],
+            [('created', 10, 6), ('created', 6, 7), ('created', 3, 8)]
+        )
+        self.assertEqual((self.stock(self.box), self.stock(self.tape)), (7, 8))
+        self.assertEqual(StockMovement.objects.count(), 3)
+    
+    def test_invalid_items_are_rejected_individually(self):
+        results = apply_movements([
+            {'product': self.box.pk, 'movement_type': 'out', 'quantity': 11},
+            {'code': 'XXX', 'movement_type': 'in', 'quantity': 1},
+            {'product': self.box.pk, 'movement_type': 'in', 'quantity': 0},
+            {'product': self.tape.pk, 'movement_type': 'out', 'quantity': 3},
+            {'product': self.tape.pk, 'movement_type': 'out', 'quantity': 1},
+        ], self.user)
+        
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['error', 'error', 'error', 'created', 'error']
+        )
+        self.assertIn('Estoque insuficiente', results[0]['error'])
+        self.assertEqual(results[1]['error'], 'Produto não encontrado')
+        self.assertEqual((self.stock(self.box), self.stock(self.tape)), (10, 0))
+        self.assertEqual(StockMovement.objects.count(), 1)
+    
+    def test_products_are_locked_in_id_order(self):
+        items = [
+            {'product': self.tape.pk, 'movement_type': 'in', 'quantity': 1},
+            {'product': self.box.pk, 'movement_type': 'in', 'quantity': 1},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            apply_movements(items, self.user)
+        
+        table = connection.ops.quote_name(Product._meta.db_table)
+        locks = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM {table}' in query['sql']
+        ]
+        self.assertEqual(len(locks), 1)
+        self.assertIn(f'ORDER BY {table}.{connection.ops.quote_name("id")} ASC', locks[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', locks[0])
+
+
+class StockAlertTests(LedgerTestCase):
+    """Cruzamentos do estoque mínimo e listagem dos produtos em alerta."""
+    
+    def alerts(self):
+        return list(StockAlert.objects.order_by('pk').values_list('product__code', 'kind', 'current_stock'))
+    
+    def test_minimum_stock_crossings_create_alerts(self):
+        apply_movement(self.box.pk, 'out', 6)
+        apply_movement(self.box.pk, 'out', 1)
+        apply_movement(self.box.pk, 'in', 5)
+        
+        self.assertEqual(self.alerts(), [('P001', 'low', 4), ('P001', 'restored', 8)])
+    
+    def test_batch_records_one_crossing_per_product(self):
+        apply_movements([
+            {'product': self.box.pk, 'movement_type': 'out', 'quantity': 6},
+            {'product': self.box.pk, 'movement_type': 'in', 'quantity': 5},
+            {'product': self.tape.pk, 'movement_type': 'out', 'quantity': 3},
+        ], self.user)
+        
+        # O saldo final da caixa (9) continua acima do mínimo
+        self.assertEqual(self.alerts(), [('P002', 'low', 0)])
+    
+    def test_minimum_stock_edits_cross_the_limit(self):
+        self.box.minimum_stock = 12
+        self.box.save()
+        self.box.name = 'Caixa grande'
+        self.box.save(update_fields=['name'])
+        self.box.minimum_stock = 2
+        self.box.save(update_fields=['minimum_stock'])
+        
+        self.assertEqual(self.alerts(), [('P001', 'low', 10), ('P001', 'restored', 10)])
+    
+    def test_signal_is_sent_after_commit(self):
+        received = []
+        
+        def receiver(sender, alerts, **kwargs):
+            received.extend((alert.product_id, alert.kind) for alert in alerts)
+        
+        stock_alerts_created.connect(receiver)
+        self.addCleanup(stock_alerts_created.disconnect, receiver)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_movement(self.tape.pk, 'out', 3)
+            self.assertEqual(received, [])
+        
+        self.assertEqual(received, [(self.tape.pk, 'low')])
+    
+    def test_low_stock_list_and_events_are_paginated(self):
+        apply_movement(self.box.pk, 'out', 6)
+        apply_movement(self.tape.pk, 'out', 3)
+        api = APIClient()
+        api.force_authenticate(self.user)
+        
+        response = api.get('/api/v1/inventory/alerts/low-stock/', {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([product['code'] for product in response.data['products']], ['P001'])
+        
+        response = api.get('/api/v1/inventory/alerts/low-stock/', {'limit': 1, 'after': response.data['next']})
+        self.assertEqual([product['code'] for product in response.data['products']], ['P002'])
+        
+        response = api.get('/api/v1/inventory/alerts/events/', {'limit': 1})
+        self.assertEqual([event['product_code'] for event in response.data['events']], ['P001'])
+        response = api.get('/api/v1/inventory/alerts/events/', {'after': response.data['next']})
+        self.assertEqual([event['product_code'] for event in response.data['events']], ['P002'])
+        self.assertEqual(response.data['next'], response.data['events'][-1]['id'])
+        
+        self.assertEqual(api.get('/api/v1/inventory/alerts/events/', {'limit': 0}).status_code, 400)
+
+class StockSnapshotTests(LedgerTestCase):
+    """Consolidação dos saldos diários e estoque numa data."""
+    
+    def setUp(self):
+        super().setUp()
+        today = timezone.localdate()
+        self.days = [today - datetime.timedelta(days=offset) for offset in (3, 2, 1)]
+        Product.objects.update(created_at=day_start(today - datetime.timedelta(days=10)))
+        self.move(self.box, 'in', 5, self.days[0])
+        self.move(self.box, 'out', 4, self.days[1])
+        self.move(self.tape, 'in', 2, self.days[2])
+        self.move(self.box, 'in', 1, today)
+    
+    def move(self, product, movement_type, quantity, day):
+        movement = StockMovement.objects.create(
+            product=product, movement_type=movement_type, quantity=quantity, created_by=self.user
+        )
+        StockMovement.objects.filter(pk=movement.pk).update(
+            created_at=day_start(day) + datetime.timedelta(hours=12)
+        )
+    
+    def build(self, day):
+        return build_stock_snapshots(day.isoformat(), day.isoformat())
+    
+    def stock_at(self, day):
+        stock = stock_at(Product.objects.all(), day)
+        return stock[self.box.pk], stock[self.tape.pk]
+    
+    def test_scheduled_run_catches_up_from_last_consolidated_day(self):
+        self.assertEqual(self.build(self.days[0]), 1)
+        self.assertEqual(consolidated_range(), (self.days[0], self.days[0]))
+        
+        self.assertEqual(build_stock_snapshots(), 2)
+        self.assertEqual(consolidated_range(), (self.days[0], self.days[2]))
+        self.assertEqual(
+            sorted(StockSnapshot.objects.values_list('product__code', 'date', 'closing_stock')),
+            [('P001', self.days[0], 15), ('P001', self.days[1], 11), ('P002', self.days[2], 5)]
+        )
+        
+        # Nada a recuperar
+        self.assertEqual(build_stock_snapshots(), 0)
+        self.assertEqual(consolidated_range(), (self.days[0], self.days[2]))
+    
+    def test_days_after_a_gap_are_not_treated_as_consolidated(self):
+        self.build(self.days[0])
+        self.build(self.days[2])
+        self.assertEqual(consolidated_range(), (self.days[0], self.days[0]))
+        
+        expected = [(15, 3), (11, 3), (11, 5)]
+        self.assertEqual([self.stock_at(day) for day in self.days], expected)
+        
+        self.build(self.days[1])
+        self.assertEqual(consolidated_range(), (self.days[0], self.days[1]))
+        self.assertEqual([self.stock_at(day) for day in self.days], expected)
+        self.assertEqual(self.stock_at(timezone.localdate()), (12, 5))
+    
+    def test_dates_before_history_are_rejected(self):
+        self.build(self.days[1])
+        self.assertEqual(self.stock_at(self.days[1]), (11, 3))
+        with self.assertRaises(ValueError):
+            self.stock_at(self.days[0])
+        
+        # Consolidar os dias anteriores estende a faixa para trás
+        self.build(self.days[0])
+        self.assertEqual(consolidated_range(), (self.days[0], self.days[1]))
+        self.assertEqual(self.stock_at(self.days[0]), (15, 3))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Particionamento exige PostgreSQL')
+class StockMovementPartitionTests(LedgerTestCase):
+    """Partições mensais das movimentações e arquivamento."""
+    
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.today = timezone.localdate()
+        self.table = StockMovement._meta.db_table
+        partition_table(1)
+    
+    def move(self, created_at, reference=None):
+        movement = StockMovement.objects.create(
+            product=self.box, movement_type='in', quantity=1, reference=reference, created_by=self.user
+        )
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=created_at)
+    
+    def count(self, partition):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {partition}')
+            return cursor.fetchone()[0]
+    
+    def on(self, day):
+        return mock.patch('apps.inventory.partitions.timezone.localdate', return_value=day)
+    
+    def test_rows_beyond_monthly_partitions_go_to_default(self):
+        future = self.today + datetime.timedelta(days=400)
+        self.move(day_start(future))
+        self.assertEqual(default_rows(), 1)
+        
+        # A partição do mês recebe as movimentações que estavam na DEFAULT
+        with self.on(future):
+            created = ensure_partitions(0)
+        
+        self.assertEqual(created, [f'{self.table}_p{future:%Y%m}'])
+        self.assertEqual(default_rows(), 0)
+        self.assertEqual(self.count(created[0]), 1)
+        self.assertEqual(StockMovement.objects.count(), 1)
+    
+    def test_consolidated_months_are_archived(self):
+        self.move(day_start(self.today - datetime.timedelta(days=1000)), reference='antiga')
+        self.move(timezone.now(), reference='recente')
+        later = self.today + datetime.timedelta(days=100)
+        
+        with self.on(later):
+            self.assertEqual(archive_partitions(1), [])
+            
+            SnapshotConsolidation.objects.create(
+                pk=1, history_start=self.today, consolidated_through=later - datetime.timedelta(days=1)
+            )
+            archived = archive_partitions(1)
+        
+        legacy = f'{self.table}_legacy'
+        self.assertEqual(archived[0], f'archive/stock_movements/{legacy}.csv.gz')
+        self.assertNotIn(legacy, [name for name, _ in list_partitions()])
+        with default_storage.open(archived[0], 'rb') as archive:
+            content = gzip.decompress(archive.read()).decode('utf-8')
+        self.assertIn('antiga', content)
+        self.assertIn('recente', content)
+        self.assertFalse(StockMovement.objects.exists())
+        
+        # Datas de meses arquivados não falham: vão para a DEFAULT
+        self.move(day_start(self.today - datetime.timedelta(days=1000)))
+        self.assertEqual(default_rows(), 1)
@@ -0,0 +1,21 @@
+"""
+Preenche a chave normalizada do nome dos clientes gravados antes dela existir.
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.models import Client
+
+
+class Command(BaseCommand):
+    help = 'Preenche Client.name_key dos clientes sem chave, usada pelas importações de planilhas'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Clientes atualizados por comando (padrão 1000)'
+        )
+    
+    def handle(self, *args, **options):
+        updated = Client.objects.backfill_name_keys(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} clientes atualizados'))
@@ -2,10 +2,52 @@
 Modelos para gestão de ordens do LogFlow.
 """
 
+import unicodedata
+
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
+from .numbering import reserve_order_numbers
+
+
+class ClientQuerySet(models.QuerySet):
+    """QuerySet de clientes."""
+    
+    def by_name_key(self, names):
+        """
+        Retorna {chave do nome: cliente} dos clientes com os nomes; se houver
+        mais de um cliente com a mesma chave, o mais antigo.
+        
+        Clientes gravados antes de Client.name_key existir ficam com a chave
+        vazia até serem preenchidos (ver backfill_name_keys); enquanto isso,
+        são encontrados pelo nome exato, como antes.
+        """
+        names = set(names)
+        keys = {self.model.normalize_name(name) for name in names}
+        
+        clients = {}
+        matching = self.filter(models.Q(name_key__in=keys) | models.Q(name_key='', name__in=names))
+        for client in matching.order_by('id'):
+            clients.setdefault(client.name_key or self.model.normalize_name(client.name), client)
+        return clients
+    
+    def backfill_name_keys(self, batch_size=1000):
+        """Preenche a chave do nome dos clientes sem chave. Retorna quantos foram atualizados."""
+        
+        pending = self.filter(name_key='').only('pk', 'name').order_by('pk')
+        updated = 0
+        last_pk = 0
+        while True:
+            clients = list(pending.filter(pk__gt=last_pk)[:batch_size])
+            if not clients:
+                return updated
+            
+            for client in clients:
+                client.name_key = self.model.normalize_name(client.name)
+            updated += self.bulk_update(clients, ['name_key'])
+            last_pk = clients[-1].pk
+
 
 class Client(models.Model):
     """Cliente para as ordens."""
@@ -15,6 +57,14 @@ class Client(models.Model):
         verbose_name=_('Nome')
     )
     
+    # Nome normalizado, usado para localizar clientes nas importações
+    name_key = models.CharField(
+        max_length=200,
+        blank=True,
+        editable=False,
+        verbose_name=_('Chave do Nome')
+    )
+    
     email = models.EmailField(
         verbose_name=_('Email')
     )
@@ -68,13 +118,47 @@ class Client(models.Model):
         verbose_name=_('Data de atualização')
     )
     
+    objects = ClientQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Cliente')
         verbose_name_plural = _('Clientes')
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name_key']),
+        ]
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        self.name_key = self.normalize_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def normalize_name(name):
+        """
+        Normaliza o nome para comparação: sem acentos, sem diferença entre
+        maiúsculas e minúsculas e com espaços simples.
+        """
+        decomposed = unicodedata.normalize('NFKD', name or '')
+        name = ''.join(char for char in decomposed if not unicodedata.combining(char))
+        return ' '.join(name.split()).casefold()[:200]
+
+
+class OrderQuerySet(models.QuerySet):
+    """QuerySet de ordens."""
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        """Cria as ordens em lote, reservando os números que faltam de uma vez."""
+        objs = list(objs)
+        missing = [order for order in objs if not order.order_number]
+        for order, number in zip(missing, reserve_order_numbers(len(missing))):
+            order.order_number = number
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 class Order(models.Model):
@@ -110,6 +194,14 @@ class Order(models.Model):
         verbose_name=_('Número da Ordem')
     )
     
+    # Número do pedido no sistema de origem (importações de planilhas)
+    external_reference = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        verbose_name=_('Referência Externa')
+    )
+    
     order_type = models.CharField(
         max_length=20,
         choices=ORDER_TYPES,
@@ -220,12 +312,15 @@ class Order(models.Model):
         verbose_name=_('Data de atualização')
     )
     
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Ordem')
         verbose_name_plural = _('Ordens')
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['order_number']),
+            models.Index(fields=['external_reference']),
             models.Index(fields=['order_type', 'status']),
             models.Index(fields=['client', 'created_at']),
             models.Index(fields=['status', 'priority']),
@@ -237,12 +332,7 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Gera número da ordem automaticamente
-            last_order = Order.objects.order_by('-id').first()
-            if last_order:
-                last_number = int(last_order.order_number.split('-')[1])
-                self.order_number = f"ORD-{last_number + 1:06d}"
-            else:
-                self.order_number = "ORD-000001"
+            self.order_number = reserve_order_numbers(1)[0]
         
         super().save(*args, **kwargs)
     
@@ -0,0 +1,107 @@
+"""
+Numeração das ordens do LogFlow.
+"""
+
+from django.db import ProgrammingError, connection, transaction
+
+
+ORDER_NUMBER_PREFIX = 'ORD-'
+
+# Sequência do PostgreSQL usada para reservar os números
+ORDER_NUMBER_SEQUENCE = 'orders_order_number_seq'
+
+# SQLSTATE do PostgreSQL para relação inexistente (undefined_table)
+UNDEFINED_TABLE = '42P01'
+
+# Se a sequência já foi encontrada neste processo
+_sequence_ready = False
+
+
+def format_order_number(number):
+    """Formata o número sequencial como número de ordem (ORD-000001)."""
+    return f'{ORDER_NUMBER_PREFIX}{number:06d}'
+
+
+def reserve_order_numbers(count):
+    """
+    Reserva `count` números de ordem numa única consulta.
+    
+    No PostgreSQL os números vêm de uma sequência: workers concorrentes
+    nunca recebem o mesmo número e não esperam uns pelos outros. Números
+    reservados por uma transação desfeita não são reaproveitados, então as
+    únicas lacunas possíveis são as de blocos reservados e não usados.
+    
+    A sequência é criada na primeira reserva, se ainda não existir. Depois
+    de encontrá-la, o processo reserva os números direto, numa consulta só.
+    """
+    global _sequence_ready
+    
+    if count <= 0:
+        return []
+    
+    if connection.vendor != 'postgresql':
+        return _reserve_after_last_order(count)
+    
+    with connection.cursor() as cursor:
+        if _sequence_ready:
+            try:
+                return _next_numbers(cursor, count)
+            except ProgrammingError:
+                # Sequência removida (ex.: banco recriado); a próxima reserva verifica de novo
+                _sequence_ready = False
+                raise
+        
+        try:
+            # Savepoint: o erro de sequência inexistente não invalida a transação
+            with transaction.atomic():
+                numbers = _next_numbers(cursor, count)
+        except ProgrammingError as e:
+            if getattr(e.__cause__, 'pgcode', None) != UNDEFINED_TABLE:
+                raise
+            _create_sequence(cursor)
+            numbers = _next_numbers(cursor, count)
+        
+        _sequence_ready = True
+        return numbers
+
+
+def _next_numbers(cursor, count):
+    """Reserva os próximos `count` números da sequência."""
+    cursor.execute(
+        'SELECT nextval(%s) FROM generate_series(1, %s)',
+        [ORDER_NUMBER_SEQUENCE, count]
+    )
+    return [format_order_number(row[0]) for row in cursor.fetchall()]
+
+
+def _create_sequence(cursor):
+    """Cria a sequência, continuando a partir da maior ordem existente."""
+    
+    from .models import Order
+    
+    with transaction.atomic():
+        # Serializa a criação entre workers concorrentes
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [ORDER_NUMBER_SEQUENCE])
+        cursor.execute('SELECT to_regclass(%s)', [ORDER_NUMBER_SEQUENCE])
+        if cursor.fetchone()[0] is not None:
+            return
+        
+        cursor.execute(f'CREATE SEQUENCE {ORDER_NUMBER_SEQUENCE}')
+        cursor.execute(
+            f'SELECT MAX(CAST(substring(order_number FROM %s) AS bigint)) '
+            f'FROM {Order._meta.db_table}',
+            [f'^{ORDER_NUMBER_PREFIX}([0-9]+)$']
+        )
+        last_number = cursor.fetchone()[0]
+        if last_number:
+            cursor.execute('SELECT setval(%s, %s)', [ORDER_NUMBER_SEQUENCE, last_number])
+
+
+def _reserve_after_last_order(count):
+    """Reserva os números seguintes ao da última ordem (bancos sem sequências)."""
+    
+    from .models import Order
+    
+    last_order = Order.objects.order_by('-id').first()
+    last_number = int(last_order.order_number.split('-')[1]) if last_order else 0
+    return [format_order_number(last_number + offset) for offset in range(1, count + 1)]
@@ -0,0 +1,61 @@
+"""
+Testes da aplicação de ordens.
+"""
+
+import unittest
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.orders import numbering
+from apps.orders.models import Client, Order
+from apps.users.models import User
+
+
+class OrderNumberingTests(TestCase):
+    """Reserva dos números de ordem."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='operador', password='senha')
+        self.client_record = Client.objects.create(name='Ana', email='ana@exemplo.com')
+    
+    def order(self, **fields):
+        return Order(
+            client=self.client_record, order_type='delivery', requested_date=timezone.now(),
+            created_by=self.user, **fields
+        )
+    
+    def test_numbers_continue_after_last_order(self):
+        self.order(order_number='ORD-000041').save()
+        
+        first = self.order()
+        first.save()
+        Order.objects.bulk_create([self.order(), self.order(), self.order(order_number='EXT-1')])
+        
+        self.assertEqual(first.order_number, 'ORD-000042')
+        self.assertEqual(
+            sorted(Order.objects.values_list('order_number', flat=True)),
+            ['EXT-1', 'ORD-000041', 'ORD-000042', 'ORD-000043', 'ORD-000044']
+        )
+    
+    def test_nothing_to_reserve(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(numbering.reserve_order_numbers(0), [])
+    
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Sequências exigem PostgreSQL')
+    def test_sequence_is_created_once_and_then_used_directly(self):
+        self.order(order_number='ORD-000041').save()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP SEQUENCE IF EXISTS {numbering.ORDER_NUMBER_SEQUENCE}')
+        
+        with mock.patch.object(numbering, '_sequence_ready', False):
+            self.assertEqual(numbering.reserve_order_numbers(2), ['ORD-000042', 'ORD-000043'])
+            self.assertTrue(numbering._sequence_ready)
+            
+            # Com a sequência conhecida, a reserva é uma consulta só
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(numbering.reserve_order_numbers(1), ['ORD-000044'])
+            self.assertEqual(len(queries), 1)
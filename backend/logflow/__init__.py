@@ -1 +1,7 @@
 # LogFlow - Sistema de Logística Inteligente
+
+# Garante que o app Celery seja carregado junto com o Django, para que
+# as tarefas @shared_task usem a configuração do projeto
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
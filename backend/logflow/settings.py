@@ -4,6 +4,7 @@ Configurações do Django para o projeto LogFlow.
 
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -198,6 +199,23 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Saldos diários de estoque do dia anterior
+    'build-stock-snapshots': {
+        'task': 'apps.inventory.tasks.build_stock_snapshots',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    # Partições mensais das movimentações (depois dos saldos diários)
+    'maintain-stock-movement-partitions': {
+        'task': 'apps.inventory.tasks.maintain_stock_movement_partitions',
+        'schedule': crontab(hour=1, minute=30),
+    },
+    # Cópias colunares de planilhas sem uso recente
+    'cleanup-upload-caches': {
+        'task': 'apps.core.tasks.cleanup_upload_caches',
+        'schedule': crontab(hour=2, minute=30),
+    },
+}
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -212,6 +230,26 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Importação de Planilhas
+IMPORT_CHUNK_SIZE = config('IMPORT_CHUNK_SIZE', default=5000, cast=int)  # linhas por commit
+IMPORT_STALE_AFTER = config('IMPORT_STALE_AFTER', default=300, cast=int)  # segundos sem sinal do worker
+IMPORT_DEFAULT_THROUGHPUT = config('IMPORT_DEFAULT_THROUGHPUT', default=2000, cast=int)  # linhas/s estimadas sem histórico
+IMPORT_MAX_PARTITIONS = config('IMPORT_MAX_PARTITIONS', default=32, cast=int)  # partições de uma importação paralela
+IMPORT_MAX_INLINE_ERRORS = config('IMPORT_MAX_INLINE_ERRORS', default=100, cast=int)  # mensagens de erro guardadas na importação
+IMPORT_CACHE_RETENTION_DAYS = config('IMPORT_CACHE_RETENTION_DAYS', default=30, cast=int)  # dias sem uso antes de remover a cópia colunar
+
+# Leitura de planilhas em processos auxiliares (0 = no próprio processo)
+IMPORT_PARSER_WORKERS = config('IMPORT_PARSER_WORKERS', default=2, cast=int)  # processos por worker do gunicorn/Celery
+IMPORT_PARSER_MEMORY_LIMIT = config('IMPORT_PARSER_MEMORY_LIMIT', default=1024, cast=int)  # MB por processo
+IMPORT_PARSER_TIMEOUT = config('IMPORT_PARSER_TIMEOUT', default=900, cast=int)  # segundos por conversão
+IMPORT_PARSER_PREVIEW_TIMEOUT = config('IMPORT_PARSER_PREVIEW_TIMEOUT', default=30, cast=int)  # segundos por pré-visualização
+IMPORT_PARSER_MAX_JOBS = config('IMPORT_PARSER_MAX_JOBS', default=50, cast=int)  # leituras antes de trocar o processo
+
+# Movimentações de estoque
+STOCK_MOVEMENT_BATCH_MAX_ITEMS = config('STOCK_MOVEMENT_BATCH_MAX_ITEMS', default=10000, cast=int)  # itens por lote
+STOCK_MOVEMENT_PARTITIONS_AHEAD = config('STOCK_MOVEMENT_PARTITIONS_AHEAD', default=3, cast=int)  # meses criados com antecedência
+STOCK_MOVEMENT_RETENTION_MONTHS = config('STOCK_MOVEMENT_RETENTION_MONTHS', default=24, cast=int)  # meses mantidos no banco (0 = sem arquivamento)
+
 # Logging
 LOGGING = {
     'version': 1,